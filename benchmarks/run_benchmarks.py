@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for KiPFG on synthetic projects of increasing size.
+
+Every benchmark runs against projects generated by synthetic_project.py and
+the kicad-cli stub bundled with KiPFG, so neither KiCad nor a real project is
+needed. The results are printed as a table and can be written as JSON to
+compare runs:
+
+    python benchmarks/run_benchmarks.py --output results.json
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src", "KiPFG"))
+
+import bom_formatter
+import fitz
+import generate
+import pdf_diff
+import post_process
+import step_geometry
+from build_cache import BuildCache
+from project_information import ProjectInformation, createCliArgParser
+from synthetic_project import PROJECT_NAME, create_project
+
+SIZES = {
+    "small": {"layers": 2, "footprints": 50, "sheets": 1, "file_size": 0},
+    "medium": {"layers": 4, "footprints": 500, "sheets": 4,
+               "file_size": 2 << 20},
+    "large": {"layers": 8, "footprints": 3000, "sheets": 16,
+              "file_size": 20 << 20},
+}
+
+# Number of files and their size in the trees used by the post_process
+# benchmarks.
+FILE_TREES = {
+    "small": (50, 16 << 10),
+    "medium": (500, 64 << 10),
+    "large": (2000, 256 << 10),
+}
+
+benchmarks = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark. It is called with the project directory and the
+    size name, and returns the function to time and an optional function
+    run before every repetition.
+    """
+    def decorator(function):
+        benchmarks[name] = function
+        return function
+
+    return decorator
+
+
+def load_project(project_dir):
+    """
+    Load a project into the module globals of generate.py, like a run of
+    generate.py in the project directory would.
+    """
+    os.chdir(project_dir)
+
+    with redirect_stdout(io.StringIO()):
+        generate.loadProject(
+            createCliArgParser().parse_args(["--kicad-cli", "stub"])
+        )
+
+    generate.build_cache = None
+
+
+def create_file_tree(directory, size):
+    file_count, file_size = FILE_TREES[size]
+
+    for index in range(file_count):
+        sub_dir = os.path.join(directory, f"dir{index % 10}")
+        os.makedirs(sub_dir, exist_ok=True)
+
+        # half random, half text, so the files compress like real outputs
+        with open(os.path.join(sub_dir, f"file{index}.gbr"), 'wb') as f:
+            f.write(os.urandom(file_size // 2))
+            f.write(b"X1Y1D01*\n" * (file_size // 2 // 9))
+
+
+@benchmark("project_information")
+def bench_project_information(project_dir, size):
+    os.chdir(project_dir)
+    cli_args = createCliArgParser().parse_args([])
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            ProjectInformation(cli_args).getSchematicSheetFileNames()
+
+    return run, None
+
+
+def bench_bom_engine(project_dir, engine):
+    load_project(project_dir)
+
+    def setup():
+        # the sheets are looked up again like in a fresh run
+        generate.prin.schematic_sheet_file_names = None
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            generate.exportBom(generate.prin.schematic_file_name,
+                               generate.prin.revision, engine)
+
+    return run, setup
+
+
+@benchmark("bom")
+def bench_bom(project_dir, size):
+    return bench_bom_engine(project_dir, "native")
+
+
+@benchmark("bom_kicad_cli")
+def bench_bom_kicad_cli(project_dir, size):
+    return bench_bom_engine(project_dir, "kicad-cli")
+
+
+def bench_pick_and_place_engine(project_dir, engine):
+    load_project(project_dir)
+    prin = generate.prin
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            generate.exportPickAndPlace(prin.pcb_file_name, prin.revision,
+                                        engine)
+
+    return run, None
+
+
+@benchmark("pick_and_place")
+def bench_pick_and_place(project_dir, size):
+    return bench_pick_and_place_engine(project_dir, "native")
+
+
+@benchmark("pick_and_place_kicad_cli")
+def bench_pick_and_place_kicad_cli(project_dir, size):
+    return bench_pick_and_place_engine(project_dir, "kicad-cli")
+
+
+@benchmark("step_geometry")
+def bench_step_geometry(project_dir, size):
+    load_project(project_dir)
+    pcb_file_name = generate.prin.pcb_file_name
+
+    def run():
+        step_geometry.read_step_geometry(pcb_file_name)
+
+    return run, None
+
+
+@benchmark("order_list")
+def bench_order_list(project_dir, size):
+    # every footprint of the project as its own BOM line
+    rows = [
+        {
+            "Quantity": "1",
+            "Reference": f"R{index + 1}",
+            "Value": f"{index}R",
+            "Footprint": "Resistor_SMD:R_0603_1608Metric",
+            "Manufacturer": "ACME",
+            "Order Number": f"ACME-{index}",
+        }
+        for index in range(SIZES[size]["footprints"] * 10)
+    ]
+    output = os.path.join(project_dir, "order_list.xlsx")
+
+    def run():
+        bom_formatter.write_order_list(output, iter(rows), "Benchmark")
+
+    return run, None
+
+
+@benchmark("pdf_merge")
+def bench_pdf_merge(project_dir, size):
+    load_project(project_dir)
+
+    # The layer plots are restored from a build cache after the first run,
+    # so the repetitions measure merging the layers and not the plotting.
+    generate.build_cache = BuildCache(os.path.join(project_dir, ".cache"),
+                                      1 << 30)
+    prin = generate.prin
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            generate.exportPdfPcb(prin.pcb_file_name, prin.copper_layers,
+                                  prin.revision)
+
+    run()
+
+    return run, None
+
+
+@benchmark("pdf_diff")
+def bench_pdf_diff(project_dir, size):
+    load_project(project_dir)
+    prin = generate.prin
+
+    with redirect_stdout(io.StringIO()):
+        generate.exportPdfPcb(prin.pcb_file_name, prin.copper_layers,
+                              prin.revision)
+
+    new_file = glob.glob(os.path.join(project_dir, generate.output_path_pdf,
+                                      "*_PCB.pdf"))[0]
+    old_file = os.path.join(project_dir, "old_PCB.pdf")
+    output = os.path.join(project_dir, "diff.pdf")
+
+    # a line added to every layer, so none of them is skipped as unchanged
+    with fitz.open(new_file) as document:
+        for page in document:
+            page.draw_line((10, 10), (100, 100))
+
+        document.save(old_file)
+
+    def run():
+        pdf_diff.diff_pdfs(old_file, new_file, output)
+
+    return run, None
+
+
+@benchmark("copy")
+def bench_copy(project_dir, size):
+    source = os.path.join(project_dir, "tree")
+    destination = os.path.join(project_dir, "copy")
+    create_file_tree(source, size)
+
+    def setup():
+        shutil.rmtree(destination, ignore_errors=True)
+
+    def run():
+        post_process.copy_files_and_directories(source, destination)
+
+    return run, setup
+
+
+@benchmark("copy_sync")
+def bench_copy_sync(project_dir, size):
+    source = os.path.join(project_dir, "tree")
+    destination = os.path.join(project_dir, "copy")
+    create_file_tree(source, size)
+    post_process.copy_files_and_directories(source, destination, sync=True)
+
+    def run():
+        post_process.copy_files_and_directories(source, destination,
+                                                sync=True)
+
+    return run, None
+
+
+@benchmark("archive")
+def bench_archive(project_dir, size):
+    source = os.path.join(project_dir, "tree")
+    archive = os.path.join(project_dir, "tree.zip")
+    create_file_tree(source, size)
+
+    def run():
+        post_process.create_archive(archive, [os.path.join(source, "*", "*")])
+
+    return run, None
+
+
+@benchmark("delete")
+def bench_delete(project_dir, size):
+    source = os.path.join(project_dir, "tree")
+    destination = os.path.join(project_dir, "copy")
+    create_file_tree(source, size)
+
+    def setup():
+        shutil.rmtree(destination, ignore_errors=True)
+        shutil.copytree(source, destination)
+
+    def run():
+        post_process.delete_directory(destination)
+
+    return run, setup
+
+
+def measure(run, setup=None, repeat=5):
+    times = []
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the KiPFG benchmarks on synthetic projects"
+    )
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Repetitions of every benchmark (default: 5)")
+    parser.add_argument('--sizes', default=",".join(SIZES),
+                        help=f"Comma separated project sizes (default: {','.join(SIZES)})")
+    parser.add_argument('--filter', default="",
+                        help="Only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    sizes = [size for size in args.sizes.split(",") if size]
+
+    for size in sizes:
+        if size not in SIZES:
+            parser.error(f"unknown size '{size}'")
+
+    results = []
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix="kipfg-bench-") as work_dir:
+        for size in sizes:
+            for name, setup_benchmark in benchmarks.items():
+                if args.filter not in name:
+                    continue
+
+                project_dir = os.path.join(work_dir, f"{size}-{name}")
+                create_project(project_dir, **SIZES[size])
+
+                try:
+                    run, setup = setup_benchmark(project_dir, size)
+                    times = measure(run, setup, args.repeat)
+                finally:
+                    os.chdir(cwd)
+
+                shutil.rmtree(project_dir, ignore_errors=True)
+
+                result = {
+                    "benchmark": name,
+                    "size": size,
+                    "params": SIZES[size],
+                    "times": times,
+                    "min": min(times),
+                    "median": statistics.median(times),
+                    "mean": statistics.mean(times),
+                }
+                results.append(result)
+
+                print(f"{name:<24} {size:<7} "
+                      f"min {result['min'] * 1000:10.2f} ms   "
+                      f"median {result['median'] * 1000:10.2f} ms",
+                      flush=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "project": PROJECT_NAME,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Synthetic KiCad projects for the benchmarks.
+
+The files follow the structure KiCad 8 writes, so KiPFG reads them like real
+projects. They are scaled by the number of copper layers, footprints and
+hierarchical sheets, and can be padded to a minimum file size with filler
+nodes placed where large real projects have their bulk: library symbols in
+the schematic and tracks in the pcb.
+"""
+import json
+import os
+import uuid
+
+PROJECT_NAME = "BENCH"
+
+# value, footprint, reference prefix
+PARTS = [
+    ("10k", "Resistor_SMD:R_0603_1608Metric", "R"),
+    ("100n", "Capacitor_SMD:C_0603_1608Metric", "C"),
+    ("10u", "Capacitor_SMD:C_0805_2012Metric", "C"),
+    ("BC847", "Package_TO_SOT_SMD:SOT-23", "Q"),
+    ("LED", "LED_SMD:LED_0603_1608Metric", "D"),
+    ("STM32F103", "Package_QFP:LQFP-48_7x7mm_P0.5mm", "U"),
+]
+
+NON_COPPER_LAYERS = [
+    (32, "B.Adhes", "user", "B.Adhesive"),
+    (33, "F.Adhes", "user", "F.Adhesive"),
+    (34, "B.Paste", "user", None),
+    (35, "F.Paste", "user", None),
+    (36, "B.SilkS", "user", "B.Silkscreen"),
+    (37, "F.SilkS", "user", "F.Silkscreen"),
+    (38, "B.Mask", "user", None),
+    (39, "F.Mask", "user", None),
+    (44, "Edge.Cuts", "user", None),
+    (46, "B.CrtYd", "user", "B.Courtyard"),
+    (47, "F.CrtYd", "user", "F.Courtyard"),
+    (48, "B.Fab", "user", None),
+    (49, "F.Fab", "user", None),
+]
+
+
+def _uuid(*parts):
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, "/".join(map(str, parts))))
+
+
+def _copper_layers(layer_count):
+    layers = [(0, "F.Cu")]
+    layers += [(i, f"In{i}.Cu") for i in range(1, layer_count - 1)]
+    layers.append((31, "B.Cu"))
+    return layers
+
+
+def _symbol(index, path):
+    value, footprint, prefix = PARTS[index % len(PARTS)]
+    x = 25.4 + (index % 20) * 7.62
+    y = 25.4 + (index // 20 % 20) * 7.62
+
+    return f"""	(symbol
+		(lib_id "Device:{prefix}")
+		(at {x:.2f} {y:.2f} 0)
+		(unit 1)
+		(exclude_from_sim no)
+		(in_bom yes)
+		(on_board yes)
+		(dnp no)
+		(uuid "{_uuid("symbol", index)}")
+		(property "Reference" "{prefix}{index + 1}"
+			(at {x + 2.54:.2f} {y:.2f} 0)
+			(effects (font (size 1.27 1.27)))
+		)
+		(property "Value" "{value}"
+			(at {x + 2.54:.2f} {y + 2.54:.2f} 0)
+			(effects (font (size 1.27 1.27)))
+		)
+		(property "Footprint" "{footprint}"
+			(at {x:.2f} {y:.2f} 0)
+			(effects (font (size 1.27 1.27)) (hide yes))
+		)
+		(property "Manufacturer" "ACME"
+			(at {x:.2f} {y:.2f} 0)
+			(effects (font (size 1.27 1.27)) (hide yes))
+		)
+		(property "Order Number" "ACME-{value}-{footprint.split(":")[1]}"
+			(at {x:.2f} {y:.2f} 0)
+			(effects (font (size 1.27 1.27)) (hide yes))
+		)
+		(instances
+			(project "{PROJECT_NAME}"
+				(path "{path}"
+					(reference "{prefix}{index + 1}")
+					(unit 1)
+				)
+			)
+		)
+	)
+"""
+
+
+def _sheet_symbol(sheet):
+    return f"""	(sheet
+		(at {25.4 + sheet * 30:.2f} 150 0)
+		(size 25.4 20.32)
+		(uuid "{_uuid("sheet", sheet)}")
+		(property "Sheetname" "Sheet{sheet}"
+			(at {25.4 + sheet * 30:.2f} 149 0)
+			(effects (font (size 1.27 1.27)))
+		)
+		(property "Sheetfile" "sheet{sheet}.kicad_sch"
+			(at {25.4 + sheet * 30:.2f} 171 0)
+			(effects (font (size 1.27 1.27)))
+		)
+	)
+"""
+
+
+def _lib_symbol_filler(index):
+    pins = "".join(
+        f"""				(pin passive line
+					(at 0 {pin * 2.54:.2f} 270)
+					(length 1.27)
+					(name "~" (effects (font (size 1.27 1.27))))
+					(number "{pin}" (effects (font (size 1.27 1.27))))
+				)
+"""
+        for pin in range(1, 9)
+    )
+
+    return f"""		(symbol "Filler:Part{index}"
+			(exclude_from_sim no)
+			(in_bom yes)
+			(on_board yes)
+			(symbol "Part{index}_1_1"
+{pins}			)
+		)
+"""
+
+
+def _schematic(name, symbols, sheets, padding, root):
+    title_block = """	(title_block
+		(title "Benchmark")
+		(rev "1")
+	)
+""" if root else """	(title_block
+		(rev "1")
+	)
+"""
+
+    body = "".join(symbols) + "".join(sheets)
+    head = f"""(kicad_sch
+	(version 20231120)
+	(generator "eeschema")
+	(generator_version "8.0")
+	(uuid "{_uuid("schematic", name)}")
+	(paper "A4")
+{title_block}"""
+
+    lib_symbols = []
+    size = len(head) + len(body)
+    index = 0
+
+    while size < padding:
+        filler = _lib_symbol_filler(index)
+        lib_symbols.append(filler)
+        size += len(filler)
+        index += 1
+
+    return (head + "\t(lib_symbols\n" + "".join(lib_symbols) + "\t)\n" +
+            body + ")\n")
+
+
+def _footprint(index):
+    value, footprint, prefix = PARTS[index % len(PARTS)]
+    x = 10 + (index % 40) * 2.5
+    y = 10 + (index // 40 % 40) * 2.5
+    side = "F" if index % 4 else "B"
+
+    return f"""	(footprint "{footprint}"
+		(layer "{side}.Cu")
+		(uuid "{_uuid("footprint", index)}")
+		(at {x:.2f} {y:.2f})
+		(property "Reference" "{prefix}{index + 1}"
+			(at 0 -1.5 0)
+			(layer "{side}.SilkS")
+			(effects (font (size 1 1) (thickness 0.15)))
+		)
+		(property "Value" "{value}"
+			(at 0 1.5 0)
+			(layer "{side}.Fab")
+			(effects (font (size 1 1) (thickness 0.15)))
+		)
+		(attr smd)
+		(pad "1" smd roundrect
+			(at -0.8 0)
+			(size 0.8 0.95)
+			(layers "{side}.Cu" "{side}.Paste" "{side}.Mask")
+			(net {index % 50 + 1} "N{index % 50 + 1}")
+		)
+		(pad "2" smd roundrect
+			(at 0.8 0)
+			(size 0.8 0.95)
+			(layers "{side}.Cu" "{side}.Paste" "{side}.Mask")
+			(net {(index + 1) % 50 + 1} "N{(index + 1) % 50 + 1}")
+		)
+	)
+"""
+
+
+def _segment(index, layer_names):
+    layer = layer_names[index % len(layer_names)]
+    x = 10 + (index % 100) * 0.5
+    y = 10 + (index // 100 % 100) * 0.5
+
+    return f"""	(segment
+		(start {x:.2f} {y:.2f})
+		(end {x + 0.5:.2f} {y:.2f})
+		(width 0.25)
+		(layer "{layer}")
+		(net {index % 50 + 1})
+		(uuid "{_uuid("segment", index)}")
+	)
+"""
+
+
+def _pcb(layer_count, footprints, padding):
+    copper_layers = _copper_layers(layer_count)
+    layer_names = [name for _, name in copper_layers]
+
+    layers = "".join(
+        f'\t\t({number} "{name}" signal)\n' for number, name in copper_layers
+    ) + "".join(
+        f'\t\t({number} "{name}" {kind} "{user_name}")\n' if user_name
+        else f'\t\t({number} "{name}" {kind})\n'
+        for number, name, kind, user_name in NON_COPPER_LAYERS
+    )
+
+    nets = "".join(f'\t(net {net} "N{net}")\n' for net in range(1, 51))
+
+    head = f"""(kicad_pcb
+	(version 20240108)
+	(generator "pcbnew")
+	(generator_version "8.0")
+	(general
+		(thickness 1.6)
+		(legacy_teardrops no)
+	)
+	(paper "A4")
+	(title_block
+		(title "Benchmark")
+		(rev "1")
+	)
+	(layers
+{layers}	)
+	(setup
+		(pad_to_mask_clearance 0)
+		(aux_axis_origin 10 110)
+	)
+	(net 0 "")
+{nets}"""
+
+    body = [head]
+    body += [_footprint(index) for index in range(footprints)]
+    size = sum(len(part) for part in body)
+    index = 0
+
+    while size < padding:
+        segment = _segment(index, layer_names)
+        body.append(segment)
+        size += len(segment)
+        index += 1
+
+    return "".join(body) + ")\n"
+
+
+def create_project(directory, layers=4, footprints=100, sheets=1,
+                   file_size=0):
+    """
+    Write a synthetic KiCad project.
+
+    Args:
+        directory (str): Directory the project is written to.
+        layers (int): Number of copper layers, at least 2.
+        footprints (int): Number of symbols and footprints. The symbols are
+            spread evenly over the sheets.
+        sheets (int): Number of hierarchical sheets below the top level
+            schematic.
+        file_size (int): Minimum size of the pcb and the top level schematic
+            in bytes.
+
+    Returns:
+        str: Path to the project file.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    project_file = os.path.join(directory, PROJECT_NAME + ".kicad_pro")
+
+    with open(project_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            "meta": {"filename": PROJECT_NAME + ".kicad_pro", "version": 1},
+            "sheets": [[_uuid("sheet", sheet), f"Sheet{sheet}"]
+                       for sheet in range(sheets)],
+        }, f, indent=2)
+
+    symbols = [[] for _ in range(sheets + 1)]
+
+    root_path = "/" + _uuid("schematic", PROJECT_NAME)
+    paths = [root_path] + [f"{root_path}/{_uuid('sheet', sheet)}"
+                           for sheet in range(sheets)]
+
+    for index in range(footprints):
+        sheet = index % (sheets + 1)
+        symbols[sheet].append(_symbol(index, paths[sheet]))
+
+    with open(os.path.join(directory, PROJECT_NAME + ".kicad_sch"), 'w',
+              encoding='utf-8') as f:
+        f.write(_schematic(PROJECT_NAME, symbols[0],
+                           [_sheet_symbol(sheet) for sheet in range(sheets)],
+                           file_size, True))
+
+    for sheet in range(sheets):
+        with open(os.path.join(directory, f"sheet{sheet}.kicad_sch"), 'w',
+                  encoding='utf-8') as f:
+            f.write(_schematic(f"sheet{sheet}", symbols[sheet + 1], [], 0,
+                               False))
+
+    with open(os.path.join(directory, PROJECT_NAME + ".kicad_pcb"), 'w',
+              encoding='utf-8') as f:
+        f.write(_pcb(layers, footprints, file_size))
+
+    return project_file
@@ -0,0 +1,204 @@
+import copy
+import glob
+import io
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager, redirect_stdout
+
+# Limits the number of kicad-cli processes running at the same time. In a
+# batch run it is shared by all projects, otherwise it is set up by
+# limitKicadCli(). None means no limit.
+kicad_cli_slots = None
+
+
+def limitKicadCli(count):
+    """
+    Limit the number of kicad-cli processes a single run starts at the same
+    time, across the jobs and the layer plots inside them.
+    """
+    global kicad_cli_slots
+    kicad_cli_slots = threading.BoundedSemaphore(max(count or 1, 1))
+
+
+@contextmanager
+def kicadCliSlot():
+    """
+    Wait for a free kicad-cli slot and hold it while the block is executed.
+    Does nothing if the number of kicad-cli processes isn't limited.
+    """
+    if kicad_cli_slots is None:
+        yield
+        return
+
+    with kicad_cli_slots:
+        yield
+
+
+def findBatchProjects(patterns):
+    """
+    Resolve the projects given to --batch.
+
+    Args:
+        patterns (list): Project directories, project files or glob patterns
+            matching either of them.
+
+    Returns:
+        list: Tuples of the absolute project directory and the project file
+        name, which is None if the project file is found automatically.
+    """
+    projects = []
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+
+        for match in matches:
+            if match.endswith(".kicad_pro"):
+                project = (os.path.abspath(os.path.dirname(match) or "."),
+                           os.path.basename(match))
+            else:
+                project = (os.path.abspath(match), None)
+
+            if project not in projects:
+                projects.append(project)
+
+    return projects
+
+
+def getProjectName(project):
+    """
+    Return the name a batch project is reported by, its directory relative
+    to the working directory and its project file if one was given.
+    """
+    project_dir, project_file = project
+    name = os.path.relpath(project_dir)
+
+    return os.path.join(name, project_file) if project_file else name
+
+
+def _initWorker(slots):
+    global kicad_cli_slots
+    kicad_cli_slots = slots
+
+
+def _generateInDirectory(generate_project, project_dir, cli_args):
+    output = io.StringIO()
+    success = False
+
+    with redirect_stdout(output):
+        try:
+            os.chdir(project_dir)
+            generate_project(cli_args)
+            success = True
+        except SystemExit as e:
+            success = e.code in (None, 0)
+        except Exception:
+            traceback.print_exc(file=output)
+
+    return success, output.getvalue()
+
+
+def runBatch(cli_args, generate_project):
+    """
+    Generate several projects in parallel.
+
+    Every project is generated in its own process, so the global state of the
+    generator is kept per project. Projects in the same directory share the
+    output directories, they are generated one after the other. The number
+    of kicad-cli processes is limited by --jobs for the whole batch, not per
+    project. The output of a project is printed in one block once it is
+    done.
+
+    Args:
+        cli_args (argparse.Namespace): Parsed command line arguments.
+        generate_project (function): Generates the project in the current
+            working directory from the given command line arguments.
+
+    Returns:
+        int: The exit code, which is 1 if any project failed.
+    """
+    projects = findBatchProjects(cli_args.batch)
+
+    if not projects:
+        print("Error: No projects found for batch mode.")
+        return 1
+
+    project_args = {}
+
+    for project in projects:
+        project_dir, project_file = project
+        args = copy.copy(cli_args)
+        args.batch = None
+        args.project_file = project_file
+
+        # the projects are generated in their own directory
+        if args.cache_dir:
+            args.cache_dir = os.path.abspath(args.cache_dir)
+        if args.drawing_sheet_file:
+            args.drawing_sheet_file = os.path.abspath(args.drawing_sheet_file)
+        if os.sep in args.kicad_cli:
+            args.kicad_cli = os.path.abspath(args.kicad_cli)
+        if args.trace:
+            name, extension = os.path.splitext(os.path.abspath(args.trace))
+            project_name = os.path.basename(project_dir)
+
+            if project_file:
+                project_name += "_" + os.path.splitext(project_file)[0]
+
+            args.trace = f"{name}_{project_name}{extension}"
+
+        project_args[project] = args
+
+    # projects waiting for the one before them in the same directory
+    waiting = {}
+
+    for project in projects:
+        waiting.setdefault(project[0], []).append(project)
+
+    results = {}
+    slots = multiprocessing.BoundedSemaphore(max(cli_args.jobs or 1, 1))
+    max_workers = min(len(projects), max(cli_args.batch_projects or 1, 1))
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_initWorker,
+                             initargs=(slots,)) as executor:
+        futures = {}
+
+        def submit(project_dir):
+            project = waiting[project_dir].pop(0)
+            future = executor.submit(_generateInDirectory, generate_project,
+                                     project_dir, project_args[project])
+            futures[future] = project
+
+        for project_dir in waiting:
+            submit(project_dir)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                project = futures.pop(future)
+
+                try:
+                    success, output = future.result()
+                except Exception as e:
+                    success, output = False, f"Error: {e}\n"
+
+                results[project] = success
+
+                print(f"==================== {getProjectName(project)} ====================")
+                print(output)
+
+                if waiting[project[0]]:
+                    submit(project[0])
+
+    print("======================= Batch ==============================\n")
+
+    for project in projects:
+        state = "OK" if results.get(project) else "FAILED"
+        print(f"{state:<7}: {getProjectName(project)}")
+
+    print()
+
+    return 0 if all(results.values()) else 1
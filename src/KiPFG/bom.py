@@ -0,0 +1,266 @@
+import os
+import re
+
+import sexpdata
+
+from sexp_scanner import iter_top_level_nodes
+
+QUANTITY_FIELD = "${QUANTITY}"
+
+# Top level nodes of a schematic the bill of materials is built from. Library
+# symbols, wires and everything else are skipped without being parsed.
+BOM_NODES = ["uuid", "symbol", "sheet", "symbol_instances"]
+
+
+def _natural_key(text):
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', text)]
+
+
+def _children(node, name):
+    for element in node:
+        if isinstance(element, list) and element and \
+                isinstance(element[0], sexpdata.Symbol) and \
+                str(element[0]) == name:
+            yield element
+
+
+def _child(node, name):
+    return next(_children(node, name), None)
+
+
+def _properties(node):
+    return {
+        element[1]: str(element[2])
+        for element in _children(node, "property")
+        if len(element) > 2
+    }
+
+
+def _instance_references(node):
+    """
+    Return the references of a symbol by sheet path, as stored by KiCad 7
+    and later.
+    """
+    references = {}
+
+    for instances in _children(node, "instances"):
+        for project in _children(instances, "project"):
+            for path in _children(project, "path"):
+                reference = _child(path, "reference")
+
+                if reference is not None:
+                    references[path[1]] = str(reference[1])
+
+    return references
+
+
+class _Sheet:
+    """
+    The symbols and sub sheets of one schematic file.
+    """
+
+    def __init__(self, file_name):
+        self.uuid = None
+        self.symbols = []
+        self.sheets = []
+        self.symbol_instances = {}
+
+        for node in iter_top_level_nodes(file_name, BOM_NODES):
+            if not isinstance(node, list):
+                continue
+
+            name = str(node[0])
+
+            if name == "uuid":
+                self.uuid = str(node[1])
+
+            elif name == "symbol":
+                self.symbols.append(node)
+
+            elif name == "sheet":
+                uuid = _child(node, "uuid")
+                properties = _properties(node)
+                sheet_file = properties.get("Sheetfile") or \
+                    properties.get("Sheet file")
+
+                if uuid is not None and sheet_file:
+                    self.sheets.append((str(uuid[1]), sheet_file))
+
+            elif name == "symbol_instances":
+                # KiCad 6 keeps the references of all sheets in the root
+                for path in _children(node, "path"):
+                    reference = _child(path, "reference")
+
+                    if reference is not None:
+                        self.symbol_instances[path[1]] = str(reference[1])
+
+
+def read_bom_symbols(schematic_file_name):
+    """
+    Read the symbols placed in a schematic and all of its hierarchical
+    sheets.
+
+    Every sheet file is read once, even if it is used by several sheets.
+    Symbols on sheets used more than once are returned once per use, with the
+    reference of that use. Symbols excluded from the bill of materials and
+    power symbols are left out. Symbols with several units are returned once.
+
+    Args:
+        schematic_file_name (str): Path to the top level schematic.
+
+    Returns:
+        list: One dict per part, mapping field names to values. The
+        reference is stored as "Reference".
+    """
+    sheets = {}
+
+    def load(file_name):
+        file_name = os.path.normpath(file_name)
+
+        if file_name not in sheets:
+            sheets[file_name] = _Sheet(file_name)
+
+        return sheets[file_name]
+
+    root = load(schematic_file_name)
+    root_path = "/" + root.uuid if root.uuid else ""
+
+    symbols = {}
+    pending = [(schematic_file_name, root_path, "")]
+
+    while pending:
+        file_name, path, legacy_path = pending.pop(0)
+
+        if not os.path.isfile(file_name):
+            continue
+
+        sheet = load(file_name)
+
+        for node in sheet.symbols:
+            in_bom = _child(node, "in_bom")
+
+            if in_bom is not None and str(in_bom[1]) == "no":
+                continue
+
+            fields = _properties(node)
+            references = _instance_references(node)
+            uuid = _child(node, "uuid")
+
+            reference = references.get(path) or references.get(legacy_path)
+
+            if reference is None and uuid is not None:
+                reference = root.symbol_instances.get(
+                    legacy_path + "/" + str(uuid[1]))
+
+            if reference is None:
+                reference = fields.get("Reference", "")
+
+            if not reference or reference.startswith("#"):
+                continue
+
+            fields["Reference"] = reference
+
+            if "Description" not in fields and "ki_description" in fields:
+                fields["Description"] = fields["ki_description"]
+
+            # every unit of a symbol is placed separately
+            symbols.setdefault(reference, fields)
+
+        sheet_dir = os.path.dirname(file_name)
+
+        for sheet_uuid, sheet_file in sheet.sheets:
+            pending.append((os.path.join(sheet_dir, sheet_file),
+                            path + "/" + sheet_uuid,
+                            legacy_path + "/" + sheet_uuid))
+
+    return list(symbols.values())
+
+
+def group_bom(symbols, fields, group_by):
+    """
+    Group parts that are the same into the rows of a bill of materials.
+
+    Args:
+        symbols (list): Parts as returned by read_bom_symbols.
+        fields (list): Fields of a row. QUANTITY_FIELD is the number of parts
+            in the row, "Reference" lists their references.
+        group_by (list): Fields that have to be equal for parts to share a
+            row.
+
+    Returns:
+        list: The rows as lists of strings, sorted by their first reference.
+    """
+    groups = {}
+
+    for symbol in symbols:
+        key = tuple(symbol.get(field, "") for field in group_by)
+        groups.setdefault(key, []).append(symbol)
+
+    rows = []
+
+    for parts in groups.values():
+        parts.sort(key=lambda part: _natural_key(part["Reference"]))
+        row = []
+
+        for field in fields:
+            if field == QUANTITY_FIELD:
+                row.append(str(len(parts)))
+            elif field == "Reference":
+                row.append(",".join(part["Reference"] for part in parts))
+            else:
+                row.append(parts[0].get(field, ""))
+
+        rows.append((_natural_key(parts[0]["Reference"]), row))
+
+    rows.sort(key=lambda row: row[0])
+
+    return [row for _, row in rows]
+
+
+class Bom:
+    """
+    A grouped bill of materials, the one model all BOM outputs are written
+    from.
+
+    Args:
+        labels (list): Column labels, in the order of the columns.
+        rows (iterable): The rows as dicts keyed by the labels. Every output
+            iterates over them once, so they can also be read lazily, like
+            bom_formatter.BomCsvRows.
+        project_name (str): Name of the project.
+        revision (str): Revision of the project.
+        variant (str): Assembly variant the parts are fitted in, None for
+            all parts.
+    """
+
+    def __init__(self, labels, rows, project_name, revision, variant=None):
+        self.labels = labels
+        self.rows = rows
+        self.project_name = project_name
+        self.revision = revision
+        self.variant = variant
+
+
+def build_bom(symbols, fields, labels, group_by, project_name, revision,
+              variant=None):
+    """
+    Group the parts of a schematic into a bill of materials.
+
+    Args:
+        symbols (list): Parts as returned by read_bom_symbols.
+        fields (list): Fields of a row, see group_bom.
+        labels (list): Column labels of the fields.
+        group_by (list): Fields that have to be equal for parts to share a
+            row.
+        project_name (str): Name of the project.
+        revision (str): Revision of the project.
+        variant (str): Assembly variant the parts are fitted in.
+
+    Returns:
+        Bom: The grouped bill of materials.
+    """
+    rows = group_bom(symbols, fields, group_by)
+
+    return Bom(labels, [dict(zip(labels, row)) for row in rows],
+               project_name, revision, variant)
@@ -1,117 +1,249 @@
-import xlsxwriter
+import csv
+from datetime import date
 
-workbook = xlsxwriter.Workbook('test.xlsx')
-worksheet = workbook.add_worksheet()
+import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
 
 digits = 1
 continuous = 1
 dotted = 7
 
-ttlbrd = workbook.add_format()
-ttlbrd.set_num_format(digits)
-ttlbrd.set_top(continuous)
-ttlbrd.set_bottom(continuous)
-ttlbrd.set_left(dotted)
-ttlbrd.set_right(dotted)
-ttlbrd.set_align('vcenter')
-
-ttllft = workbook.add_format()
-ttllft.set_num_format(digits)
-ttllft.set_top(continuous)
-ttllft.set_bottom(continuous)
-ttllft.set_left(continuous)
-ttllft.set_right(dotted)
-ttllft.set_align('vcenter')
-
-ttlrgt = workbook.add_format()
-ttlrgt.set_num_format(digits)
-ttlrgt.set_top(continuous)
-ttlrgt.set_bottom(continuous)
-ttlrgt.set_left(dotted)
-ttlrgt.set_right(continuous)
-ttlrgt.set_align('vcenter')
-
-dotbrd = workbook.add_format()
-dotbrd.set_num_format(digits)
-dotbrd.set_bottom(dotted)
-dotbrd.set_left(dotted)
-dotbrd.set_right(dotted)
-dotbrd.set_text_wrap()
-
-numfmt = workbook.add_format()
-numfmt.set_num_format(digits)
-
-cntfmt = workbook.add_format()
-cntfmt.set_num_format(digits)
-cntfmt.set_top(continuous)
-cntfmt.set_bottom(continuous)
-cntfmt.set_left(continuous)
-cntfmt.set_right(continuous)
-
-emptyfmt = workbook.add_format()
-emptyfmt.set_num_format(digits)
-emptyfmt.set_bottom(dotted)
-emptyfmt.set_left(dotted)
-emptyfmt.set_right(dotted)
-emptyfmt.set_text_wrap()
-emptyfmt.set_align('vcenter')
-emptyfmt.set_text_wrap()
-emptyfmt.set_bg_color('yellow')
-
-# configure view
-worksheet.set_paper(9)  # A4
-worksheet.set_landscape()
-worksheet.set_header("&LDatei: &F&RSeite &P/&N")
-worksheet.freeze_panes(5, 0)
-worksheet.repeat_rows(0, 4)
-# worksheet.set_default_row(30, hide_unused_rows=False)
-worksheet.hide_gridlines(1)
-worksheet.fit_to_pages(1, 0)
-
-# write out title block
-row = 0
-worksheet.set_row(row, 16)  # set row height
-worksheet.write(row, 0, r"Gesellschaft für Test Systeme mbH")
-worksheet.write(row, 4, r"Teltower Damm 276")
-worksheet.write(row, 5, r"D-14167 Berlin")
-worksheet.write(row, 6, r"Tel.:+4930/845723-0")
-worksheet.write(row, 7, r"Fax.:+4930/845723-23")
-
-row = 2
-worksheet.set_row(row, 16)  # set row height
-worksheet.write(row, 0, r"Bestelliste Project 1, Project 2 Revision: 1")
-worksheet.write(row, 4, "Erstellt: 2024-11-02")
-worksheet.write(row, 6, "Project Description; revised: 2024-06-22")
-
-row = 3
-worksheet.set_row(row, 16)  # set row height
-worksheet.write(row, 0, r"Anzahl der zu fertigenden Geräte eintragen: ==>")
-worksheet.write(row, 4, 1, cntfmt)
-
-row = 4
-worksheet.set_column(0,  1,  5.00)
-worksheet.write(row, 0, r"Lfn", ttllft)
-worksheet.write(row, 1, r"Stück", ttlbrd)
-worksheet.set_column(2,  2, 16.43)
-worksheet.write(row, 2, r"Referenz", ttlbrd)
-worksheet.set_column(3,  3, 20.71)
-worksheet.write(row, 3, r"Wert", ttlbrd)
-worksheet.set_column(4,  4, 25.00)
-worksheet.write(row, 4, r"Bezeichnung", ttlbrd)
-worksheet.set_column(5,  6, 27.86)
-worksheet.write(row, 5, r"Toleranz/Spannung", ttlbrd)
-worksheet.write(row, 6, r"Bauform", ttlbrd)
-worksheet.set_column(7,  7, 13.57)
-worksheet.write(row, 7, r"Hersteller", ttlbrd)
-worksheet.set_column(8,  11, 20.71)
-worksheet.write(row, 8, r"Bestellnummer", ttlbrd)
-worksheet.write(row, 9, r"Alternative BE", ttlbrd)
-worksheet.write(row, 10, r"wh Artikelnummer", ttlbrd)
-worksheet.write(row, 11, r"Bemerkung", ttlbrd)
-
-worksheet.set_column(12, 13,  5.00)
-worksheet.write(row, 12, r"Soll", ttlbrd)
-worksheet.write(row, 13, r"Ist", ttlbrd)
-worksheet.write(row, 14, r"Variante", ttlrgt)
-
-workbook.close()
+# Company block in the first row of the order list, as (column, text).
+COMPANY_HEADER = [
+    (0, r"Gesellschaft für Test Systeme mbH"),
+    (4, r"Teltower Damm 276"),
+    (5, r"D-14167 Berlin"),
+    (6, r"Tel.:+4930/845723-0"),
+    (7, r"Fax.:+4930/845723-23"),
+]
+
+# Columns of the order list: title, width and the BOM field shown in it.
+# Columns without a field are filled in by hand.
+ORDER_LIST_COLUMNS = [
+    ("Lfn", 5.00, None),
+    ("Stück", 5.00, "Quantity"),
+    ("Referenz", 16.43, "Reference"),
+    ("Wert", 20.71, "Value"),
+    ("Bezeichnung", 25.00, "Description"),
+    ("Toleranz/Spannung", 27.86, "Tol/Rat/Mat"),
+    ("Bauform", 27.86, "Footprint"),
+    ("Hersteller", 13.57, "Manufacturer"),
+    ("Bestellnummer", 20.71, "Order Number"),
+    ("Alternative BE", 20.71, None),
+    ("wh Artikelnummer", 20.71, None),
+    ("Bemerkung", 20.71, None),
+    ("Soll", 5.00, None),
+    ("Ist", 5.00, None),
+    ("Variante", 5.00, "fit_field"),
+]
+
+# Fields that are needed to order a part. Empty ones are highlighted.
+REQUIRED_FIELDS = {"Value", "Footprint", "Manufacturer", "Order Number"}
+
+TITLE_ROWS = 5
+DEVICE_COUNT_CELL = "$E$4"
+
+
+def _create_formats(workbook):
+    """
+    Create every cell format of the order list once, so rows only reference
+    them.
+    """
+    ttlbrd = workbook.add_format()
+    ttlbrd.set_num_format(digits)
+    ttlbrd.set_top(continuous)
+    ttlbrd.set_bottom(continuous)
+    ttlbrd.set_left(dotted)
+    ttlbrd.set_right(dotted)
+    ttlbrd.set_align('vcenter')
+
+    ttllft = workbook.add_format()
+    ttllft.set_num_format(digits)
+    ttllft.set_top(continuous)
+    ttllft.set_bottom(continuous)
+    ttllft.set_left(continuous)
+    ttllft.set_right(dotted)
+    ttllft.set_align('vcenter')
+
+    ttlrgt = workbook.add_format()
+    ttlrgt.set_num_format(digits)
+    ttlrgt.set_top(continuous)
+    ttlrgt.set_bottom(continuous)
+    ttlrgt.set_left(dotted)
+    ttlrgt.set_right(continuous)
+    ttlrgt.set_align('vcenter')
+
+    dotbrd = workbook.add_format()
+    dotbrd.set_num_format(digits)
+    dotbrd.set_bottom(dotted)
+    dotbrd.set_left(dotted)
+    dotbrd.set_right(dotted)
+    dotbrd.set_text_wrap()
+
+    cntfmt = workbook.add_format()
+    cntfmt.set_num_format(digits)
+    cntfmt.set_top(continuous)
+    cntfmt.set_bottom(continuous)
+    cntfmt.set_left(continuous)
+    cntfmt.set_right(continuous)
+
+    emptyfmt = workbook.add_format()
+    emptyfmt.set_num_format(digits)
+    emptyfmt.set_bottom(dotted)
+    emptyfmt.set_left(dotted)
+    emptyfmt.set_right(dotted)
+    emptyfmt.set_text_wrap()
+    emptyfmt.set_align('vcenter')
+    emptyfmt.set_bg_color('yellow')
+
+    return {
+        "ttlbrd": ttlbrd,
+        "ttllft": ttllft,
+        "ttlrgt": ttlrgt,
+        "dotbrd": dotbrd,
+        "cntfmt": cntfmt,
+        "emptyfmt": emptyfmt,
+    }
+
+
+def read_bom_csv(file_name):
+    """
+    Iterate over the rows of a BOM CSV written by exportBom.
+
+    Yields:
+        dict: One row, mapping the column labels to the values.
+    """
+    with open(file_name, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+class BomCsvRows:
+    """
+    The rows of a BOM CSV, read from the file again every time they are
+    iterated. Several outputs can be written from them without holding all
+    rows in memory.
+
+    Args:
+        file_name (str): Path to the BOM CSV.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def __iter__(self):
+        return read_bom_csv(self.file_name)
+
+
+def _write_title(worksheet, formats, title, description, created):
+    # configure view
+    worksheet.set_paper(9)  # A4
+    worksheet.set_landscape()
+    worksheet.set_header("&LDatei: &F&RSeite &P/&N")
+    worksheet.freeze_panes(TITLE_ROWS, 0)
+    worksheet.repeat_rows(0, TITLE_ROWS - 1)
+    worksheet.hide_gridlines(1)
+    worksheet.fit_to_pages(1, 0)
+
+    for column, (_, width, _) in enumerate(ORDER_LIST_COLUMNS):
+        worksheet.set_column(column, column, width)
+
+    # write out title block
+    row = 0
+    worksheet.set_row(row, 16)  # set row height
+    for column, text in COMPANY_HEADER:
+        worksheet.write(row, column, text)
+
+    row = 2
+    worksheet.set_row(row, 16)  # set row height
+    worksheet.write(row, 0, title)
+    worksheet.write(row, 4, f"Erstellt: {created}")
+    worksheet.write(row, 6, description)
+
+    row = 3
+    worksheet.set_row(row, 16)  # set row height
+    worksheet.write(row, 0, r"Anzahl der zu fertigenden Geräte eintragen: ==>")
+    worksheet.write(row, 4, 1, formats["cntfmt"])
+
+    row = 4
+    last_column = len(ORDER_LIST_COLUMNS) - 1
+
+    for column, (name, _, _) in enumerate(ORDER_LIST_COLUMNS):
+        if column == 0:
+            cell_format = formats["ttllft"]
+        elif column == last_column:
+            cell_format = formats["ttlrgt"]
+        else:
+            cell_format = formats["ttlbrd"]
+
+        worksheet.write(row, column, name, cell_format)
+
+
+def write_order_list(output_file_name, rows, title, description="",
+                     created=None):
+    """
+    Write a bill of materials as formatted order list.
+
+    The workbook is written in xlsxwriter's constant memory mode: every row
+    is flushed to disk once the next one is started, so the memory used does
+    not grow with the number of rows. Rows are consumed one at a time and
+    can come straight from read_bom_csv or BomCsvRows.
+
+    Args:
+        output_file_name (str): Path to the xlsx file.
+        rows (iterable): BOM rows as dicts keyed by the CSV labels.
+        title (str): Title of the order list, like project and revision.
+        description (str): Text shown next to the title.
+        created (str): Creation date shown in the title block, today if None.
+
+    Returns:
+        int: Number of BOM rows written.
+    """
+    workbook = xlsxwriter.Workbook(output_file_name,
+                                   {"constant_memory": True})
+    worksheet = workbook.add_worksheet()
+    formats = _create_formats(workbook)
+
+    _write_title(worksheet, formats, title, description,
+                 created or date.today().isoformat())
+
+    quantity_column = next(
+        column for column, (_, _, field) in enumerate(ORDER_LIST_COLUMNS)
+        if field == "Quantity"
+    )
+    quantity_cell = xl_col_to_name(quantity_column)
+
+    count = 0
+
+    for count, bom_row in enumerate(rows, 1):
+        row = TITLE_ROWS + count - 1
+
+        for column, (name, _, field) in enumerate(ORDER_LIST_COLUMNS):
+            if name == "Lfn":
+                worksheet.write_number(row, column, count, formats["dotbrd"])
+
+            elif name == "Soll":
+                worksheet.write_formula(
+                    row, column,
+                    f"={quantity_cell}{row + 1}*{DEVICE_COUNT_CELL}",
+                    formats["dotbrd"]
+                )
+
+            elif field is None:
+                worksheet.write_blank(row, column, None, formats["dotbrd"])
+
+            else:
+                value = bom_row.get(field) or ""
+
+                if not value and field in REQUIRED_FIELDS:
+                    worksheet.write_blank(row, column, None,
+                                          formats["emptyfmt"])
+                elif field == "Quantity" and value.isdigit():
+                    worksheet.write_number(row, column, int(value),
+                                           formats["dotbrd"])
+                else:
+                    worksheet.write_string(row, column, value,
+                                           formats["dotbrd"])
+
+    workbook.close()
+
+    return count
@@ -0,0 +1,136 @@
+import csv
+import json
+
+from bom_formatter import write_order_list
+
+# Registered writers by output name, as (function, file name suffix). Every
+# writer is called with the output file name and the Bom to write.
+BOM_WRITERS = {}
+
+# Columns of the supplier upload files, as (title, BOM field). Columns without
+# a field are left empty.
+MOUSER_COLUMNS = [
+    ("Mouser No", None),
+    ("Mfr. No", "Order Number"),
+    ("Manufacturer", "Manufacturer"),
+    ("Description", "Description"),
+    ("Customer No", "Reference"),
+    ("Quantity 1", "Quantity"),
+]
+
+DIGIKEY_COLUMNS = [
+    ("Digi-Key Part Number", None),
+    ("Manufacturer Part Number", "Order Number"),
+    ("Manufacturer", "Manufacturer"),
+    ("Description", "Description"),
+    ("Reference Designator", "Reference"),
+    ("Quantity", "Quantity"),
+]
+
+
+def bom_writer(name, suffix):
+    """
+    Register a function writing a bill of materials output.
+
+    Args:
+        name (str): Name of the output, as selected on the command line.
+        suffix (str): Appended to the project name and revision to get the
+            file name of the output.
+    """
+    def decorator(function):
+        BOM_WRITERS[name] = (function, suffix)
+        return function
+
+    return decorator
+
+
+@bom_writer("csv", "_BOM.csv")
+def write_bom_csv(file_name, bom):
+    """
+    Write a bill of materials as CSV with every field quoted, like kicad-cli
+    does.
+    """
+    with open(file_name, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        writer.writerow(bom.labels)
+
+        for row in bom.rows:
+            writer.writerow([row.get(label, "") for label in bom.labels])
+
+
+@bom_writer("xlsx", "_BOM.xlsx")
+def write_bom_xlsx(file_name, bom):
+    """
+    Write a bill of materials as formatted order list.
+    """
+    title = f"Bestelliste {bom.project_name} Revision: {bom.revision}"
+
+    if bom.variant:
+        title += f" Variante: {bom.variant}"
+
+    write_order_list(file_name, bom.rows, title)
+
+
+def _write_supplier_csv(file_name, bom, columns):
+    """
+    Write the orderable rows of a bill of materials as supplier upload CSV.
+
+    Rows without an order number cannot be looked up by the supplier and are
+    left out.
+    """
+    with open(file_name, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow([title for title, _ in columns])
+
+        for row in bom.rows:
+            if not row.get("Order Number"):
+                continue
+
+            writer.writerow([row.get(field, "") if field else ""
+                             for _, field in columns])
+
+
+@bom_writer("mouser", "_BOM_Mouser.csv")
+def write_bom_mouser(file_name, bom):
+    """
+    Write a bill of materials for the Mouser BOM upload.
+    """
+    _write_supplier_csv(file_name, bom, MOUSER_COLUMNS)
+
+
+@bom_writer("digikey", "_BOM_DigiKey.csv")
+def write_bom_digikey(file_name, bom):
+    """
+    Write a bill of materials for the Digi-Key BOM manager upload.
+    """
+    _write_supplier_csv(file_name, bom, DIGIKEY_COLUMNS)
+
+
+@bom_writer("json", "_BOM.json")
+def write_bom_json(file_name, bom):
+    """
+    Write a bill of materials as JSON, with the quantities as numbers.
+    """
+    rows = [
+        {
+            label: int(value) if label == "Quantity" and value.isdigit()
+            else value
+            for label, value in row.items()
+        }
+        for row in bom.rows
+    ]
+
+    document = {
+        "project": bom.project_name,
+        "revision": bom.revision,
+    }
+
+    if bom.variant:
+        document["variant"] = bom.variant
+
+    document["columns"] = bom.labels
+    document["rows"] = rows
+
+    with open(file_name, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+        f.write("\n")
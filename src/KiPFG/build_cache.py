@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def hash_file(file_name):
+    """
+    Return the sha256 hex digest of a file's content.
+
+    Args:
+        file_name (str): Path to the file.
+    """
+    file_hash = hashlib.sha256()
+
+    with open(file_name, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+class BuildCache:
+    """
+    Content addressed cache for files generated by kicad-cli.
+
+    Every entry is a directory named after the hash of everything that
+    influences the generated files. It holds a copy of those files and a
+    manifest listing them. evict() deletes the least recently used entries
+    once the cache has grown beyond max_size. It scans the whole cache, so it
+    is called once per generation and not for every stored entry.
+
+    Args:
+        cache_dir (str): Directory the cache is stored in.
+        max_size (int): Maximum size of the cache in bytes.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._file_hashes = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def hashFile(self, file_name):
+        """
+        Return the sha256 hex digest of a file.
+
+        Digests are remembered by path, size and modification time, so files
+        used by several exports are only read once.
+        """
+        stat = os.stat(file_name)
+        signature = (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            digest = self._file_hashes.get(signature)
+
+        if digest is None:
+            digest = hash_file(file_name)
+
+            with self._lock:
+                self._file_hashes[signature] = digest
+
+        return digest
+
+    def key(self, args, input_files, extra=None, output_files=None):
+        """
+        Build the cache key for one kicad-cli invocation.
+
+        Args:
+            args (list): Command line arguments. Paths inside the current
+                working directory are made relative, so the same project
+                checked out in a different location shares its entries.
+            input_files (list): Files whose content the outputs depend on.
+            extra (list): Any further strings the outputs depend on, like the
+                kicad-cli version.
+            output_files (list): Files generated by the command. Only their
+                names are part of the key, so outputs written to temporary
+                directories can be restored as well.
+
+        Returns:
+            str: The hex digest identifying the cache entry.
+        """
+        cwd = os.getcwd() + os.sep
+        output_names = {
+            output_file: os.path.basename(output_file)
+            for output_file in output_files or []
+        }
+
+        key_hash = hashlib.sha256()
+        key_hash.update(json.dumps({
+            "args": [
+                output_names.get(arg, arg.replace(cwd, "")) for arg in args
+            ],
+            "inputs": sorted(
+                [os.path.relpath(input_file), self.hashFile(input_file)]
+                for input_file in input_files
+            ),
+            "extra": list(extra or []),
+        }).encode("utf-8"))
+
+        return key_hash.hexdigest()
+
+    def _entryPath(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def restore(self, key, output_files):
+        """
+        Restore the output files of a cache entry.
+
+        Args:
+            key (str): The cache key.
+            output_files (list): Paths the outputs are restored to. Files
+                are matched to the entry by their name.
+
+        Returns:
+            bool: True if the entry existed and the files were restored.
+        """
+        entry_path = self._entryPath(key)
+        manifest_file = os.path.join(entry_path, "manifest.json")
+
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                cached_files = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return False
+
+        try:
+            for output_file in output_files:
+                name = os.path.basename(output_file)
+
+                if name in cached_files:
+                    os.makedirs(os.path.dirname(output_file) or ".",
+                                exist_ok=True)
+                    shutil.copy2(os.path.join(entry_path, name), output_file)
+
+        except FileNotFoundError:
+            # evicted while it was being restored
+            with self._lock:
+                self.misses += 1
+            return False
+
+        # the entry's modification time is its last use for eviction
+        os.utime(entry_path)
+
+        with self._lock:
+            self.hits += 1
+
+        return True
+
+    def store(self, key, output_files):
+        """
+        Store the given output files under a cache key.
+
+        Output files that don't exist are left out of the entry. The entry
+        is written to a temporary directory first and then moved into place,
+        so parallel runs never see half written entries.
+
+        Args:
+            key (str): The cache key.
+            output_files (list): Paths of the generated files.
+        """
+        entry_path = self._entryPath(key)
+
+        if os.path.isdir(entry_path):
+            return
+
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        staging_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+
+        cached_files = []
+
+        try:
+            for output_file in output_files:
+                if os.path.isfile(output_file):
+                    name = os.path.basename(output_file)
+                    shutil.copy2(output_file, os.path.join(staging_path, name))
+                    cached_files.append(name)
+
+            with open(os.path.join(staging_path, "manifest.json"), 'w',
+                      encoding='utf-8') as f:
+                json.dump({"files": cached_files, "created": time.time()}, f)
+
+            os.replace(staging_path, entry_path)
+
+        except OSError:
+            # another run stored the same entry in the meantime
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits into its
+        maximum size.
+        """
+        entries = []
+        total_size = 0
+
+        for prefix in os.scandir(self.cache_dir):
+            if not prefix.is_dir() or prefix.name.startswith("."):
+                continue
+
+            for entry in os.scandir(prefix.path):
+                try:
+                    size = sum(
+                        item.stat().st_size for item in os.scandir(entry.path)
+                    )
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except FileNotFoundError:
+                    # evicted by a parallel job or run
+                    continue
+
+                total_size += size
+
+        entries.sort()
+
+        for _, size, entry_path in entries:
+            if total_size <= self.max_size:
+                break
+
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
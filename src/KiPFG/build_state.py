@@ -0,0 +1,119 @@
+import json
+import os
+
+from build_cache import hash_file
+
+STATE_FILE_NAME = ".kipfg_state.json"
+
+
+class BuildState:
+    """
+    Remembers which inputs produced the artifacts of the last run.
+
+    The state is kept per side of the project, like the schematic or the
+    pcb. A side is up to date if the content of all of its inputs is
+    unchanged and all artifacts it produced last time still exist as they
+    were written.
+
+    Args:
+        state_file_name (str): Path to the state file.
+    """
+
+    def __init__(self, state_file_name=STATE_FILE_NAME):
+        self.state_file_name = state_file_name
+
+        try:
+            with open(state_file_name, 'r', encoding='utf-8') as f:
+                self.sides = json.load(f)
+        except (OSError, ValueError):
+            self.sides = {}
+
+    @staticmethod
+    def _fileSignature(file_name):
+        stat = os.stat(file_name)
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def _inputUnchanged(self, file_name, recorded):
+        if not recorded or not os.path.isfile(file_name):
+            return False
+
+        # Files that were only touched still count as unchanged.
+        if self._fileSignature(file_name) == recorded["signature"]:
+            return True
+
+        return hash_file(file_name) == recorded["sha256"]
+
+    def isUpToDate(self, side, input_files):
+        """
+        Check whether the artifacts of a side can be reused.
+
+        Args:
+            side (str): Name of the side.
+            input_files (list): Files the side is generated from.
+
+        Returns:
+            bool: True if neither the inputs nor the artifacts changed since
+            the side was recorded.
+        """
+        state = self.sides.get(side)
+
+        if not state:
+            return False
+
+        if sorted(state["inputs"]) != sorted(input_files):
+            return False
+
+        for input_file in input_files:
+            if not self._inputUnchanged(input_file,
+                                        state["inputs"][input_file]):
+                return False
+
+        for artifact, signature in state["artifacts"].items():
+            if not os.path.isfile(artifact):
+                return False
+            if self._fileSignature(artifact) != signature:
+                return False
+
+        return True
+
+    def record(self, side, input_files, artifacts):
+        """
+        Record the inputs and artifacts of a side that was just generated.
+
+        Args:
+            side (str): Name of the side.
+            input_files (list): Files the side was generated from.
+            artifacts (list): Files generated for the side. If one of them
+                is missing the side is not recorded, so it is generated again
+                next time.
+        """
+        if not all(os.path.isfile(artifact) for artifact in artifacts):
+            self.sides.pop(side, None)
+            return
+
+        self.sides[side] = {
+            "inputs": {
+                input_file: {
+                    "signature": self._fileSignature(input_file),
+                    "sha256": hash_file(input_file),
+                }
+                for input_file in input_files
+            },
+            "artifacts": {
+                artifact: self._fileSignature(artifact)
+                for artifact in artifacts
+            },
+        }
+
+    def forget(self, side):
+        """
+        Remove a side, so it is generated again next time.
+        """
+        self.sides.pop(side, None)
+
+    def save(self):
+        """
+        Write the state file.
+        """
+        with open(self.state_file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.sides, f, indent=2)
@@ -1,14 +1,35 @@
 #!/usr/bin/env python3
 
+import errno
+import glob
 import os
 import re
 import sys
-import subprocess
+import shutil
+import tempfile
+import contextvars
+import threading
+import traceback
 import fitz
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from project_information import ProjectInformation
+from project_information import ProjectInformation, createCliArgParser
 from post_process import *
+from bom import Bom, build_bom, read_bom_symbols
+from bom_formatter import BomCsvRows
+from bom_writers import BOM_WRITERS
+from position_file import read_placements, write_position_file
+from variants import fitted_symbols, unfitted_references, write_variant_board
+from step_geometry import read_step_geometry
+from process_runner import runProcess, runner
+from plot_backend import createPlotBackend
+from build_cache import BuildCache
+from build_state import BuildState
+from scheduler import Job, Scheduler
+from batch import kicadCliSlot, limitKicadCli, runBatch
+from watcher import FileWatcher
+import tracing
 
 output_path_pdf = "PDF"
 output_path_gerber = "FAB_tmp"
@@ -16,19 +37,233 @@ output_path_bom = "BOM"
 output_path_3d = "3D"
 output_path_rule_checks = "RCH"
 
+ram_staging_path = "/dev/shm"
+# Free space the RAM backed file system needs to be used for staging, and
+# below which a failed staging write is taken for a full staging directory.
+ram_staging_min_free = 512 * 1024 * 1024
+staging_full_free = 1024 * 1024
+
+cam_path = "CAM"
+fab_path = "FAB"
+project_path = "PRJ"
+
+# Directories the project snapshot never descends into
+snapshot_prune_list = [
+    output_path_pdf,
+    output_path_gerber,
+    output_path_bom,
+    output_path_3d,
+    output_path_rule_checks,
+    cam_path,
+    fab_path,
+    project_path,
+    "*-backups",
+    ".git",
+    ".hg",
+    ".svn",
+    "__pycache__",
+]
+
+print_lock = threading.Lock()
+
+# Directories everything but the rule check reports is generated into.
+output_directories = [
+    output_path_pdf,
+    output_path_gerber,
+    output_path_bom,
+    output_path_3d,
+    cam_path,
+    fab_path,
+    project_path,
+]
+
+# Summary lines of kicad-cli rule checks, like "Found 3 violations".
+rule_check_summary = re.compile(
+    r"Found (\d+) (violations|unconnected items|schematic parity issues)"
+)
+
+# Stages that are skipped together when a side of the project is unchanged
+# in incremental mode.
+incremental_stages = {
+    "schematic": ["exportPdfSch", "exportBom"],
+    "pcb": ["exportStep", "exportPdfPcb", "exportGerbers",
+            "exportPickAndPlace"],
+    "erc": ["ERC"],
+    "drc": ["DRC"],
+}
+
+# Stages by side with assembly variants. The parts fitted in a variant are
+# selected in the schematic, so the outputs of the variants depend on both
+# the schematic and the pcb. They form the assembly side, whose stages run
+# once per variant.
+variant_incremental_stages = {
+    "schematic": ["exportPdfSch"],
+    "pcb": ["exportStep", "exportPdfPcb", "exportGerbers"],
+    "assembly": ["exportBom", "exportPickAndPlace", "exportPdfFab"],
+    "erc": ["ERC"],
+    "drc": ["DRC"],
+}
+
+# Packaging manifest: every entry is one archive with the generated files it
+# contains, as glob patterns in the directories the files were generated in.
+# "{prefix}" is replaced by the project name and revision, "{now}" by the
+# time stamp of the run and "{staging}" by a temporary directory for archives
+# that only end up inside other archives. The inputs are the artifacts the
+# archive has to wait for.
+#
+# Archives marked "per_assembly" are created once per assembly variant.
+# "{assembly}" is replaced by the prefix and the name of the variant and
+# "{variant}" in their inputs by the suffix of the artifacts of the variant.
+# Without variants both are the same as for the other archives.
+packaging_manifest = [
+    {
+        "name": "GERBER",
+        "archive": os.path.join(cam_path, "{prefix}_GERBER_{now}.zip"),
+        "files": [
+            os.path.join(output_path_gerber, "{prefix}-*.gbr"),
+            os.path.join(output_path_gerber, "{prefix}-*.drl"),
+            os.path.join(output_path_gerber, "{prefix}-*.gbrjob"),
+        ],
+        "exclude": ["*_Fab.gbr"],
+        "inputs": ["gerbers", "drill"],
+        "link_files_to": cam_path,
+        "link_archive_to": fab_path,
+    },
+    {
+        "name": "FAB",
+        "archive": os.path.join("{staging}", "{assembly}_FAB_{now}.zip"),
+        "files": [
+            os.path.join(output_path_gerber, "{assembly}-*-pos.csv"),
+            os.path.join(output_path_gerber, "{prefix}-*_Fab.gbr"),
+        ],
+        "inputs": ["gerbers", "pos{variant}"],
+        "per_assembly": True,
+    },
+    {
+        "name": "FRT",
+        "archive": os.path.join(fab_path, "{assembly}_FRT_{now}.zip"),
+        "files": [
+            os.path.join(output_path_bom, "{assembly}_BOM.csv"),
+            os.path.join(output_path_pdf, "{assembly}_[FB].Fab.pdf"),
+            os.path.join("{staging}", "{assembly}_FAB_{now}.zip"),
+            os.path.join(cam_path, "{prefix}_GERBER_{now}.zip"),
+        ],
+        "inputs": ["bom{variant}", "pdf_fab{variant}", "archive_FAB{variant}",
+                   "archive_GERBER"],
+        "per_assembly": True,
+    },
+]
+
+# kicad-cli emulator selected with "--kicad-cli stub"
+kicad_cli_stub = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "kicad_cli_stub.py")
+
+build_cache = None
+kicad_cli_command = ["kicad-cli"]
+kicad_cli_version = None
+kicad_cli_version_lock = threading.Lock()
+plot_backend = None
+staging_dir = None
+bom_outputs = []
+variants = []
+# parts of the schematic, read once per run by getBomSymbols()
+bom_symbols = None
+bom_symbols_lock = threading.Lock()
+
 
 class GeneratorError(Exception):
     pass
 
 
+def printStatus(message):
+    # Jobs run in parallel, so every status line is printed in one piece.
+    with print_lock:
+        print(message)
+
+
 def rreplace(s, old, new, occurrence):
     li = s.rsplit(old, occurrence)
     return new.join(li)
 
 
-def exportPdfPcb(input_file, layers, revision):
-    print("* Generating pcb pdf files...", end="")
+def plotPdfLayer(input_file, layer, output, variables=None,
+                 crossout_dnp=False):
+    plot_backend.plotPdf(input_file, [layer, "Edge.Cuts"], output,
+                         {"LAYER": layer, **(variables or {})}, crossout_dnp)
+
+    return output
+
+
+def getStagingDirectory():
+    """
+    Return the directory temporary files are created in, the one given with
+    --staging-dir if any. Otherwise a RAM backed file system is preferred, so
+    temporary files never reach the disk, as long as it has enough free
+    space. Container runtimes often give it only a few MiB. None selects the
+    default temporary directory.
+    """
+    if staging_dir:
+        return staging_dir
+
+    if os.path.isdir(ram_staging_path) and \
+            os.access(ram_staging_path, os.W_OK) and \
+            shutil.disk_usage(ram_staging_path).free >= ram_staging_min_free:
+        return ram_staging_path
+
+    return None
+
+
+def isOutOfSpace(error):
+    """
+    Check whether an error, or one it was raised from, is a write to a full
+    file system.
+    """
+    while error is not None:
+        if isinstance(error, OSError) and error.errno == errno.ENOSPC:
+            return True
 
+        error = error.__cause__ or error.__context__
+
+    return False
+
+
+def isStagingFull(error, staging_path):
+    """
+    Check whether an error was caused by the staging directory running out of
+    space. kicad-cli only reports a failed write through its exit code, so a
+    nearly full staging directory counts as well.
+    """
+    return isOutOfSpace(error) or \
+        shutil.disk_usage(staging_path).free < staging_full_free
+
+
+def runStaged(function, prefix="kipfg-"):
+    """
+    Call a function with a new temporary staging directory and return its
+    result.
+
+    If the function fails because the staging directory is full, it is called
+    again with a directory in the default temporary directory on disk.
+    """
+    directory = getStagingDirectory()
+
+    if directory is not None:
+        with tempfile.TemporaryDirectory(dir=directory,
+                                         prefix=prefix) as staging_path:
+            try:
+                return function(staging_path)
+            except Exception as e:
+                if not isStagingFull(e, staging_path):
+                    raise
+
+        printStatus(f"* Staging directory {directory} is full, retrying "
+                    "on disk...\n")
+
+    with tempfile.TemporaryDirectory(prefix=prefix) as staging_path:
+        return function(staging_path)
+
+
+def exportPdfPcb(input_file, layers, revision, plot_jobs=None):
     pcb_name = getFilenameWithouthExtension(input_file)
 
     if not os.path.isdir(output_path_pdf):
@@ -45,63 +280,127 @@ def exportPdfPcb(input_file, layers, revision):
         'B.Fab',
     ]
 
-    pcb_pdf_layers = layers + pcb_basic_pdf_layers
-
-    # generate temporary single pdf files for each layer
-    for layer in pcb_pdf_layers:
-
-        output_path = os.path.join(os.getcwd(), output_path_pdf)
-        output_filename = pcb_name + '_R' + revision + '_' + layer + '.pdf'
-        output = os.path.join(output_path, output_filename)
-
-        if prin.drawing_sheet_file_name:
-            args = ['kicad-cli', 'pcb', 'export', 'pdf', '--ibt',
-                    '--drawing-sheet', prin.drawing_sheet_file_name]
-        else:
-            args = ['kicad-cli', 'pcb', 'export', 'pdf', '--ibt']
-
-        args += ['-l', layer + ",Edge.Cuts", '--define-var', 'LAYER=' + layer,
-                 '--output', output, input_file]
-
-        subprocess.call(args, stdout=subprocess.DEVNULL,
-                        stderr=subprocess.STDOUT)
-
-    result = fitz.open()
+    # single layer pdf files that are kept in the PDF directory
+    pcb_kept_pdf_layers = ['F.Fab', 'B.Fab']
 
-    for layer in pcb_pdf_layers:
-
-        output_path = os.path.join(os.getcwd(), output_path_pdf)
-        output_filename = pcb_name + '_R' + revision + '_' + layer + '.pdf'
-        pdf_file = os.path.join(output_path, output_filename)
-
-        with fitz.open(pdf_file) as mfile:
-            result.insert_pdf(mfile)
+    pcb_pdf_layers = layers + pcb_basic_pdf_layers
 
-    pdf_save_path = os.path.join(os.getcwd(), output_path_pdf)
-    pdf_save_path = os.path.join(pdf_save_path, pcb_name + '_R' + revision +
+    output_path = os.path.join(os.getcwd(), output_path_pdf)
+    pdf_save_path = os.path.join(output_path, pcb_name + '_R' + revision +
                                  '_PCB.pdf')
 
-    result.save(pdf_save_path)
+    def plotAndMerge(staging_path):
+        merged_pdf_file = os.path.join(staging_path, "merged.pdf")
+        result = None
+
+        try:
+            # plot the single layer pdf files in parallel into the staging
+            # directory and merge them in layer order as soon as the next one
+            # is available
+            with ThreadPoolExecutor(max_workers=plot_jobs) as executor:
+                # the plots run in the context of the job, within its time
+                # limit
+                plots = [
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        plotPdfLayer,
+                        input_file,
+                        layer,
+                        os.path.join(staging_path, pcb_name + '_R' +
+                                     revision + '_' + layer + '.pdf')
+                    )
+                    for layer in pcb_pdf_layers
+                ]
+
+                for layer, plot in zip(pcb_pdf_layers, plots):
+                    try:
+                        layer_pdf_file = plot.result()
+                    except BaseException:
+                        # the other layers are of no use without this one
+                        for pending_plot in plots:
+                            pending_plot.cancel()
+                        raise
+
+                    with open(layer_pdf_file, 'rb') as f:
+                        layer_pdf = f.read()
+
+                    os.remove(layer_pdf_file)
+
+                    if layer in pcb_kept_pdf_layers:
+                        with open(os.path.join(
+                                output_path,
+                                os.path.basename(layer_pdf_file)),
+                                'wb') as f:
+                            f.write(layer_pdf)
+
+                    with fitz.open(stream=layer_pdf, filetype="pdf") as mfile:
+                        if result is None:
+                            result = fitz.open()
+                            result.insert_pdf(mfile)
+                            result.save(merged_pdf_file)
+                            result.close()
+                            result = fitz.open(merged_pdf_file)
+                        else:
+                            # only append the new pages to the merged file
+                            result.insert_pdf(mfile)
+                            result.saveIncr()
+
+            # one bookmark per layer, the pages are matched by them in a diff
+            result.set_toc([[1, layer, page + 1]
+                            for page, layer in enumerate(pcb_pdf_layers)])
+            result.saveIncr()
+        finally:
+            if result is not None:
+                result.close()
+
+        shutil.move(merged_pdf_file, pdf_save_path)
+
+    runStaged(plotAndMerge)
+
+    printStatus("* Generating pcb pdf files...Done.\n")
+
+
+def exportPdfFab(input_file, revision, variant):
+    """
+    Plot the fabrication layers of an assembly variant.
+
+    The footprints of the parts that are not fitted in the variant are
+    marked "do not populate" in a copy of the board, so kicad-cli crosses
+    them out. The copy is written next to a copy of the project file into
+    the temporary gerber directory.
+    """
+    if not os.path.isdir(output_path_pdf):
+        os.makedirs(output_path_pdf)
 
-    for layer in pcb_pdf_layers:
+    assembly = getAssemblyPrefix(revision, variant)
+    board_path = os.path.join(os.getcwd(), output_path_gerber, assembly)
+    board_file = os.path.join(board_path, os.path.basename(input_file))
 
-        if layer == "F.Fab":
-            continue
+    if not os.path.isdir(board_path):
+        os.makedirs(board_path)
 
-        if layer == "B.Fab":
-            continue
+    shutil.copyfile(prin.project_file_name,
+                    os.path.join(board_path,
+                                 os.path.basename(prin.project_file_name)))
+    write_variant_board(
+        input_file, board_file,
+        unfitted_references(getBomSymbols(prin.schematic_file_name), variant)
+    )
 
-        output_path = os.path.join(os.getcwd(), output_path_pdf)
-        output_filename = pcb_name + '_R' + revision + '_' + layer + '.pdf'
-        pdf_file = os.path.join(output_path, output_filename)
-        os.remove(pdf_file)
+    for layer in ['F.Fab', 'B.Fab']:
+        plotPdfLayer(
+            board_file,
+            layer,
+            os.path.join(os.getcwd(), output_path_pdf,
+                         assembly + '_' + layer + '.pdf'),
+            {"VARIANT": variant},
+            crossout_dnp=True
+        )
 
-    print("Done.\n")
+    printStatus(f"* Generating fab pdf files of variant {variant}...Done.\n")
 
 
 def exportErc(input_file, revision):
-    print("* Executing electrical rule check...", end="")
-
     if not os.path.isdir(output_path_rule_checks):
         os.makedirs(output_path_rule_checks)
 
@@ -122,23 +421,18 @@ def exportErc(input_file, revision):
         input_file
     ]
 
-    output = subprocess.check_output(args).decode("utf-8")
-
-    violations = re.search(r"Found (\d+) violations", output)
-
-    num_violations = int(violations.group(1)) if violations else 0
+    counts = runRuleCheck(args)
+    num_violations = counts.get("violations", 0)
 
     if not num_violations:
-        print("Done.\n")
+        printStatus("* Executing electrical rule check...Done.\n")
     else:
-        print("Error.")
-        print(f"  Found {num_violations} violations.\n")
+        printStatus("* Executing electrical rule check...Error.\n"
+                    f"  Found {num_violations} violations.\n")
         raise GeneratorError("Electrical rule check has errors.")
 
 
 def exportDrc(input_file, revision):
-    print("* Executing design rule check...", end="")
-
     if not os.path.isdir(output_path_rule_checks):
         os.makedirs(output_path_rule_checks)
 
@@ -160,30 +454,23 @@ def exportDrc(input_file, revision):
             input_file
     ]
 
-    output = subprocess.check_output(args).decode("utf-8")
-
-    violations = re.search(r"Found (\d+) violations", output)
-    nc_items = re.search(r"Found (\d+) unconnected items", output)
-    schpissue = re.search(r"Found (\d+) schematic parity issues", output)
-
-    num_violations = int(violations.group(1)) if violations else 0
-    num_nc_items = int(nc_items.group(1)) if nc_items else 0
-    num_schpissue = int(schpissue.group(1)) if schpissue else 0
+    counts = runRuleCheck(args)
+    num_violations = counts.get("violations", 0)
+    num_nc_items = counts.get("unconnected items", 0)
+    num_schpissue = counts.get("schematic parity issues", 0)
 
     if not num_violations and not num_nc_items and not num_schpissue:
-        print("Done.\n")
+        printStatus("* Executing design rule check...Done.\n")
     else:
-        print("Error.")
-        print(f"  Found {num_violations} violations, \
-              {num_nc_items} unconnected items and {num_schpissue} schematic \
-              parity issues.\n")
+        printStatus("* Executing design rule check...Error.\n"
+                    f"  Found {num_violations} violations, {num_nc_items} "
+                    f"unconnected items and {num_schpissue} schematic parity "
+                    "issues.\n")
 
         raise GeneratorError("Design rule check has errors.")
 
 
 def exportGerbers(input_file, copper_layer_list, revision):
-    print("* Generating gerber files...", end="")
-
     if not os.path.isdir(output_path_gerber):
         os.makedirs(output_path_gerber)
 
@@ -200,88 +487,13 @@ def exportGerbers(input_file, copper_layer_list, revision):
     ]
 
     gerber_layers = copper_layer_list + pcb_basic_gerber_layers
+    output_dir = os.path.join(os.getcwd(), output_path_gerber)
 
-    # Gerber files
-    args = [
-            "kicad-cli",
-            "pcb",
-            "export",
-            "gerbers",
-            "--layers",
-            ",".join(gerber_layers),
-            "--use-drill-file-origin",
-            "--no-protel-ext",
-            "--output",
-            os.path.join(os.getcwd(), output_path_gerber),
-            input_file
-    ]
-
-    subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-    for layer in gerber_layers:
-        filename = os.path.join(os.getcwd(),
-                                output_path_gerber,
-                                project_name + "-" + layer.replace(".", "_") +
-                                ".gbr")
-
-        new_filename = rreplace(filename, project_name, project_name + "_R" +
-                                revision, 1)
-
-        if os.path.isfile(filename):
-            if os.path.isfile(new_filename):
-                os.remove(new_filename)
-
-            os.rename(filename, new_filename)
-
-    # Drill files
-    args = [
-            "kicad-cli",
-            "pcb",
-            "export",
-            "drill",
-            "--drill-origin",
-            "plot",
-            "--excellon-separate-th",
-            "--generate-map",
-            "--map-format",
-            "gerberx2",
-            "--output",
-            os.path.join(os.getcwd(), output_path_gerber),
-            input_file
-    ]
-
-    subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-
-    filenames = [
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "-NPTH.drl"
-        ),
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "-NPTH-drl_map.gbr"
-        ),
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "-PTH.drl"
-        ),
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "-PTH-drl_map.gbr"
-        ),
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "-job.gbrjob"
-        ),
-    ]
+    filenames = plot_backend.plotGerbers(input_file, gerber_layers,
+                                         output_dir)
+    filenames += plot_backend.plotDrill(input_file, output_dir)
 
     for filename in filenames:
-
         new_filename = rreplace(
             filename,
             project_name,
@@ -294,15 +506,51 @@ def exportGerbers(input_file, copper_layer_list, revision):
 
             os.rename(filename, new_filename)
 
-    print("Done.\n")
+    printStatus("* Generating gerber files...Done.\n")
 
 
-def exportPickAndPlace(input_file, revision):
-    print("* Generating pick and place files...", end="")
+def exportPickAndPlace(input_file, revision, engine="native", variant=None):
+    """
+    Export the position files of both sides, all footprints of the top and
+    the SMD footprints of the bottom.
 
+    The native engine reads the board once and writes both files from it,
+    with the positions in mm relative to the drill/place file origin like
+    kicad-cli. The "kicad-cli" engine runs kicad-cli once per side.
+
+    The position files of an assembly variant are always written natively,
+    without the footprints of the parts that are not fitted in it.
+    """
     if not os.path.isdir(output_path_gerber):
         os.makedirs(output_path_gerber)
 
+    assembly = getAssemblyPrefix(revision, variant)
+    output = os.path.join(os.getcwd(), output_path_gerber,
+                          assembly + "-top-pos.csv")
+    output_bottom = os.path.join(os.getcwd(), output_path_gerber,
+                                 assembly + "-bottom-pos.csv")
+
+    if engine == "native" or variant is not None:
+        origin, placements = read_placements(input_file)
+
+        if variant is not None:
+            unfitted = unfitted_references(
+                getBomSymbols(prin.schematic_file_name), variant)
+            placements = [placement for placement in placements
+                          if placement["reference"] not in unfitted]
+
+            status = f"* Generating pick and place files of variant " \
+                     f"{variant}...Done.\n"
+        else:
+            status = "* Generating pick and place files...Done.\n"
+
+        write_position_file(output, placements, "top", origin)
+        write_position_file(output_bottom, placements, "bottom", origin,
+                            smd_only=True)
+
+        printStatus(status)
+        return
+
     args = [
         "kicad-cli",
         "pcb",
@@ -316,15 +564,13 @@ def exportPickAndPlace(input_file, revision):
         "mm",
         "--use-drill-file-origin",
         "--output",
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "_R" + revision + "-top-pos.csv"
-        ),
+        output,
         input_file
     ]
 
-    subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    runKicadCli(args, [input_file], [output])
+
+    output = output_bottom
 
     args = [
         "kicad-cli",
@@ -340,24 +586,29 @@ def exportPickAndPlace(input_file, revision):
         "--use-drill-file-origin",
         "--smd-only",
         "--output",
-        os.path.join(
-            os.getcwd(),
-            output_path_gerber,
-            project_name + "_R" + revision + "-bottom-pos.csv"
-        ),
+        output,
         input_file
     ]
 
-    subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    print("Done.\n")
+    runKicadCli(args, [input_file], [output])
+    printStatus("* Generating pick and place files...Done.\n")
 
 
 def exportStep(input_file, revision):
-    print("* Generating 3D step file...", end="")
-
+    """
+    Export the 3D step file of the board.
+
+    The step file only depends on the geometry of the board, the placement
+    of the footprints and their 3D models, so it is cached under these
+    instead of the whole board file. Changing texts, silkscreen, tracks or
+    fields restores it from the build cache.
+    """
     if not os.path.isdir(output_path_3d):
         os.makedirs(output_path_3d)
 
+    output = os.path.join(os.getcwd(), output_path_3d,
+                          project_name + "_R" + revision + "_3D.step")
+
     args = [
         "kicad-cli",
         "pcb",
@@ -368,17 +619,122 @@ def exportStep(input_file, revision):
         "--no-optimize-step",
         "--subst-models",
         "--output",
-        os.path.join(
-            os.getcwd(),
-            output_path_3d,
-            project_name + "_R" + revision + "_3D.step"
-        ),
+        output,
         input_file
     ]
 
-    subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    if build_cache is None:
+        runKicadCli(args, [input_file], [output])
+    else:
+        geometry, model_files = read_step_geometry(input_file)
+        runKicadCli(args, model_files, [output], [geometry])
+
+    printStatus("* Generating 3D step file...Done.\n")
+
+
+def getKicadCliCommand(kicad_cli):
+    """
+    Return the command kicad-cli is run with. "stub" selects the bundled
+    emulator.
+    """
+    if kicad_cli == "stub":
+        return [sys.executable, kicad_cli_stub]
+
+    return [kicad_cli]
+
+
+def kicadCliArgs(args):
+    """
+    Return a kicad-cli command line with the selected kicad-cli.
+    """
+    return kicad_cli_command + args[1:]
+
+
+def getKicadCliVersion():
+    global kicad_cli_version
+
+    with kicad_cli_version_lock:
+        if kicad_cli_version is None:
+            with kicadCliSlot():
+                _, output = runProcess(
+                    kicadCliArgs(["kicad-cli", "version"]),
+                    capture_output=True,
+                    check=True
+                )
+            kicad_cli_version = output.decode("utf-8").strip()
+
+    return kicad_cli_version
+
+
+def runRuleCheck(args):
+    """
+    Run a kicad-cli rule check and return the numbers of problems it found.
+
+    The summary lines are parsed while kicad-cli prints them.
+
+    Returns:
+        dict: The number of problems by kind, like "violations" or
+        "unconnected items".
+    """
+    report_file = args[args.index("--output") + 1]
+    counts = {}
+
+    def parseLine(line):
+        match = rule_check_summary.search(line)
+
+        if match:
+            counts[match.group(2)] = int(match.group(1))
+
+    with kicadCliSlot():
+        runProcess(kicadCliArgs(args), output_files=[report_file],
+                   on_line=parseLine, check=True)
+
+    return counts
 
-    print("Done.\n")
+
+def runKicadCli(args, input_files, output_files, extra=()):
+    """
+    Run kicad-cli.
+
+    If the build cache is enabled and kicad-cli was run with the same
+    arguments, input files, project file, drawing sheet and kicad-cli version
+    before, the output files are restored from the cache instead.
+
+    Args:
+        args (list): The kicad-cli command line.
+        input_files (list): Source files the outputs are generated from.
+        output_files (list): Files generated by the command.
+        extra (list): Further strings the outputs depend on, like a digest
+            of the relevant parts of a file that isn't an input.
+
+    Raises:
+        subprocess.CalledProcessError: If kicad-cli failed.
+    """
+    if build_cache is None:
+        with kicadCliSlot():
+            runProcess(kicadCliArgs(args), output_files=output_files,
+                       check=True)
+        return
+
+    input_files = list(input_files) + [prin.project_file_name]
+
+    if prin.drawing_sheet_file_name:
+        input_files.append(prin.drawing_sheet_file_name)
+
+    key = build_cache.key(args, input_files,
+                          [getKicadCliVersion()] + list(extra), output_files)
+
+    with tracing.span("restore " + " ".join(args[1:3]), "cache"):
+        restored = build_cache.restore(key, output_files)
+        tracing.annotate(restored=restored)
+
+    if restored:
+        return
+
+    with kicadCliSlot():
+        runProcess(kicadCliArgs(args), output_files=output_files, check=True)
+
+    build_cache.store(key, output_files)
 
 
 def getFilenameWithouthExtension(filename):
@@ -386,11 +742,12 @@ def getFilenameWithouthExtension(filename):
 
 
 def exportPdfSch(schematic_file_name, revision):
-    print("* Generating schematic pdf file...", end="")
-
     if not os.path.isdir(output_path_pdf):
         os.makedirs(output_path_pdf)
 
+    output = os.path.join(os.getcwd(), output_path_pdf,
+                          project_name + "_R" + revision + "_SCH.pdf")
+
     if prin.drawing_sheet_file_name:
         args = [
             "kicad-cli",
@@ -400,11 +757,7 @@ def exportPdfSch(schematic_file_name, revision):
             "--drawing-sheet",
             prin.drawing_sheet_file_name,
             "--output",
-            os.path.join(
-                os.getcwd(),
-                output_path_pdf,
-                project_name + "_R" + revision + "_SCH.pdf"
-            ),
+            output,
             schematic_file_name
         ]
     else:
@@ -414,29 +767,59 @@ def exportPdfSch(schematic_file_name, revision):
             "export",
             "pdf",
             "--output",
-            os.path.join(
-                os.getcwd(),
-                output_path_pdf,
-                project_name + "_R" + revision + "_SCH.pdf"
-            ),
+            output,
             schematic_file_name
         ]
 
-    output = subprocess.call(
+    runKicadCli(
         args,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
+        prin.getSchematicSheetFileNames(),
+        [output]
     )
 
-    if not output:
-        print("Done.\n")
-    else:
-        print("Error.\n")
+    printStatus("* Generating schematic pdf file...Done.\n")
+
+
+def getBomSymbols(schematic_file_name):
+    """
+    Return the parts of the schematic. They are read once per run and shared
+    by the bill of materials and the jobs of all assembly variants.
+    """
+    global bom_symbols
+
+    with bom_symbols_lock:
+        if bom_symbols is None:
+            bom_symbols = read_bom_symbols(schematic_file_name)
+
+        return bom_symbols
+
+
+def getAssemblyPrefix(revision, variant=None):
+    """
+    Return the prefix of the files of an assembly variant, the project name
+    and revision followed by the name of the variant.
+    """
+    prefix = project_name + "_R" + revision
+
+    return prefix if variant is None else prefix + "_" + variant
+
 
+def exportBom(schematic_file_name, revision, engine="native", outputs=(),
+              variant=None):
+    """
+    Export the bill of materials as CSV and the selected other outputs.
 
-def exportBom(schematic_file_name, revision):
-    print("* Export bill of materials...", end="")
+    The native engine reads the symbols of all sheets directly from the
+    schematic files and groups them like kicad-cli would, without starting
+    KiCad and loading the whole schematic. The "kicad-cli" engine lets
+    kicad-cli export the CSV, whose rows are read back from it row by row
+    for every output, so they are never all held in memory. The native
+    engine groups all parts in memory. Either way every output is written
+    from one bill of materials by its writer in BOM_WRITERS.
 
+    The bill of materials of an assembly variant is always built natively,
+    from the parts fitted in it.
+    """
     if not os.path.isdir(output_path_bom):
         os.makedirs(output_path_bom)
 
@@ -464,6 +847,33 @@ def exportBom(schematic_file_name, revision):
         "fit_field",
     ]
 
+    group_by_array = [
+        "Value",
+        "Footprint",
+        "Order Number",
+        "fit_field",
+    ]
+
+    output = os.path.join(os.getcwd(), getBomFileName(revision, "csv"))
+
+    if variant is not None:
+        symbols = fitted_symbols(getBomSymbols(schematic_file_name), variant)
+        bom = build_bom(symbols, fields_array, labels_array, group_by_array,
+                        project_name, revision, variant)
+        writeBomOutputs(bom, ["csv"] + list(outputs))
+
+        printStatus(f"* Export bill of materials of variant {variant}"
+                    "...Done.\n")
+        return
+
+    if engine == "native":
+        bom = build_bom(getBomSymbols(schematic_file_name), fields_array,
+                        labels_array, group_by_array, project_name, revision)
+        writeBomOutputs(bom, ["csv"] + list(outputs))
+
+        printStatus("* Export bill of materials...Done.\n")
+        return
+
     args = [
         "kicad-cli",
         "sch",
@@ -476,174 +886,808 @@ def exportBom(schematic_file_name, revision):
         "--labels",
         ",".join(labels_array),
         "--group-by",
-        "Value,Footprint,Order Number,fit_field",
+        ",".join(group_by_array),
         "--output",
-        os.path.join(
-            os.getcwd(),
-            output_path_bom,
-            project_name + "_R" + revision + "_BOM.csv"
-        ),
+        output,
         schematic_file_name
     ]
 
-    output = subprocess.call(
+    runKicadCli(
         args,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
+        prin.getSchematicSheetFileNames(),
+        [output]
+    )
+
+    # the exported rows are only read while an output is written
+    bom = Bom(labels_array, BomCsvRows(output), project_name, revision)
+    writeBomOutputs(bom, outputs)
+
+    printStatus("* Export bill of materials...Done.\n")
+
+
+def getBomFileName(revision, output, variant=None):
+    """
+    Return the file name of a bill of materials output.
+    """
+    _, suffix = BOM_WRITERS[output]
+
+    return os.path.join(output_path_bom,
+                        getAssemblyPrefix(revision, variant) + suffix)
+
+
+def writeBomOutputs(bom, outputs):
+    """
+    Write a bill of materials with the writers of the given outputs.
+    """
+    for output in outputs:
+        writer, _ = BOM_WRITERS[output]
+
+        with tracing.span("write " + output, "bom"):
+            writer(getBomFileName(bom.revision, output, bom.variant), bom)
+
+
+def packageArchive(package, substitutions, compression, compresslevel,
+                   max_workers=None):
+    """
+    Create one archive of the packaging manifest.
+
+    The files are read straight from the directories they were generated
+    in and compressed by up to max_workers threads. If the manifest asks for
+    it, the packaged files or the archive itself are linked into further
+    directories.
+    """
+    archive = package["archive"].format(**substitutions)
+    files = [pattern.format(**substitutions) for pattern in package["files"]]
+    exclude = package.get("exclude", [])
+
+    create_directory(os.path.dirname(archive))
+    create_archive(archive, files, exclude, compression, compresslevel,
+                   max_workers)
+
+    if "link_files_to" in package:
+        link_files(files, package["link_files_to"], exclude)
+
+    if "link_archive_to" in package:
+        link_files([archive], package["link_archive_to"])
+
+    if substitutions.get("variant"):
+        printStatus(f"* Package {package['name']} archive of variant "
+                    f"{substitutions['variant']}...Done.\n")
+    else:
+        printStatus(f"* Package {package['name']} archive...Done.\n")
+
+
+def removeIntermediates(revision):
+    """
+    Remove the temporary gerber directory and the single layer fabrication
+    pdf files of all assembly variants once everything has been packaged.
+    """
+    delete_directory(output_path_gerber)
+    delete_files_and_directories(
+        [os.path.join(output_path_pdf,
+                      project_name + "_R" + revision + "_*.Fab.pdf")]
     )
+    printStatus("* Remove intermediate files...Done.\n")
+
+
+def processPrjDirectory(revision, from_sheets=False):
+    """
+    Take a snapshot of the KiCad project files in the PRJ directory.
+
+    The project directory is scanned without descending into generated,
+    backup and version control directories. With from_sheets, nothing is
+    scanned and the snapshot holds the project file, the pcb and the
+    schematic sheets referenced by the schematic.
 
-    if not output:
-        print("Done.\n")
+    The revision is added to the file names while copying. Files that are
+    unchanged since the last snapshot are skipped, new ones are reflinked
+    where the file system supports it.
+    """
+    create_directory(project_path)
+
+    def addRevision(file_name):
+        name, extension = os.path.splitext(file_name)
+        return name + "_R" + revision + extension
+
+    if from_sheets:
+        copy_file_list(
+            [prin.project_file_name, prin.pcb_file_name] +
+            prin.getSchematicSheetFileNames(),
+            os.getcwd(),
+            project_path,
+            sync=True,
+            link="reflink",
+            rename=addRevision
+        )
     else:
-        print("Error.\n")
+        copy_files_and_directories(
+            os.getcwd(),
+            project_path,
+            ["*.kicad_pro", "*.kicad_pcb", "*.kicad_sch"],
+            sync=True,
+            link="reflink",
+            rename=addRevision,
+            prune_list=snapshot_prune_list
+        )
 
+    printStatus("* Process PRJ directory...Done.\n")
 
-prin = ProjectInformation()
-project_name = getFilenameWithouthExtension(prin.project_file_name)
 
-cli_args = prin.cli_arg_parser.parse_args()
+def getIncrementalStages():
+    """
+    Return the stages of the sides of the project, which depend on whether
+    assembly variants are built.
+    """
+    return variant_incremental_stages if variants else incremental_stages
 
-if not cli_args.no_erc or not cli_args.no_drc:
-    print("====================== Rule checks =========================\n")
 
-if not cli_args.no_drc:
-    try:
-        exportDrc(prin.pcb_file_name, prin.revision)
-    except GeneratorError as e:
-        print(f"Error: {e}")
-        print("Terminating...")
-        sys.exit()
+def getIncrementalInputs(side):
+    """
+    Return the source files a side of the project is generated from.
+    """
+    input_files = [prin.project_file_name]
 
-if not cli_args.no_erc:
-    try:
-        # put erc into this also
-        exportErc(prin.schematic_file_name, prin.revision)
-    except GeneratorError as e:
-        print(f"Error: {e}")
-        print("Terminating...")
-        sys.exit()
+    if prin.drawing_sheet_file_name:
+        input_files.append(prin.drawing_sheet_file_name)
 
-print("======================= Generate ===========================\n")
+    # the design rule check compares the pcb against the schematic
+    if side in ("schematic", "erc", "drc"):
+        input_files += prin.getSchematicSheetFileNames()
 
-# Schematic
-exportPdfSch(prin.schematic_file_name, prin.revision)
-exportBom(prin.schematic_file_name, prin.revision)
+    if side == "assembly":
+        input_files += prin.getSchematicSheetFileNames()
 
-# PCB
-exportPdfPcb(prin.pcb_file_name, prin.copper_layers, prin.revision)
-exportGerbers(prin.pcb_file_name, prin.copper_layers, prin.revision)
-exportPickAndPlace(prin.pcb_file_name, prin.revision)
-exportStep(prin.pcb_file_name, prin.revision)
-# exportAsm(prin.pcb_file_name, prin.revision)
+    if side in ("pcb", "assembly", "drc"):
+        input_files.append(prin.pcb_file_name)
 
-print("====================== Post-Processing =====================\n")
+    return input_files
 
-today = datetime.now()
-now = today.strftime("%Y%m%d_%H%M%S")
 
-cam_path = "CAM"
-fab_path = "FAB"
-pdf_path = "PDF"
-project_path = "PRJ"
-step_path = "3D"
-
-# CAM Files (Gerber)
-print("* Process CAM directory...", end="")
-create_directory(cam_path)
-copy_files(output_path_gerber, cam_path)
-delete_files_and_directories(
-    [os.path.join(cam_path, "*.csv"),os.path.join(cam_path, "*_Fab.gbr")]
-)
+def getIncrementalArtifacts(side, revision):
+    """
+    Return the files generated for a side of the project.
+    """
+    prefix = project_name + "_R" + revision
 
-create_archive(
-    os.path.join(
-        cam_path,
-        project_name + "_R" + prin.revision + "_GERBER_" + now + ".zip"
-    ),
-    [
-        os.path.join(cam_path, "*.gbr"),
-        os.path.join(cam_path, "*.drl"),
-        os.path.join(cam_path, "*.gbrjob")
-    ]
-)
+    if side == "schematic":
+        artifacts = [os.path.join(output_path_pdf, prefix + "_SCH.pdf")]
 
-print("Done.")
+        if not variants:
+            artifacts += [getBomFileName(revision, output)
+                          for output in ["csv"] + bom_outputs]
 
-# FAB files
-print("\n* Process FAB directory...", end="")
-create_directory(fab_path)
-copy_files(cam_path, fab_path)
+        return artifacts
 
-delete_files_and_directories(
-    [os.path.join(fab_path, "*")], [os.path.join(fab_path, "*.zip")]
-)
+    if side == "pcb":
+        # with variants the position files belong to the assembly side
+        return [
+            os.path.join(output_path_pdf, prefix + "_PCB.pdf"),
+            os.path.join(output_path_pdf, prefix + "_F.Fab.pdf"),
+            os.path.join(output_path_pdf, prefix + "_B.Fab.pdf"),
+            os.path.join(output_path_3d, prefix + "_3D.step"),
+        ] + sorted(
+            file_name
+            for file_name in glob.glob(os.path.join(output_path_gerber, "*"))
+            if os.path.isfile(file_name) and
+            not (variants and file_name.endswith("-pos.csv"))
+        )
 
-copy_files(output_path_bom, fab_path)
-copy_files(output_path_pdf, fab_path)
+    if side == "assembly":
+        artifacts = []
+
+        for variant in variants or [None]:
+            assembly = getAssemblyPrefix(revision, variant)
+            artifacts += [getBomFileName(revision, output, variant)
+                          for output in ["csv"] + bom_outputs]
+            artifacts += [
+                os.path.join(output_path_gerber, assembly + "-top-pos.csv"),
+                os.path.join(output_path_gerber,
+                             assembly + "-bottom-pos.csv"),
+            ]
+
+            if variant is not None:
+                artifacts += [
+                    os.path.join(output_path_pdf, assembly + "_F.Fab.pdf"),
+                    os.path.join(output_path_pdf, assembly + "_B.Fab.pdf"),
+                ]
+
+        return artifacts
+
+    if side == "erc":
+        return [os.path.join(output_path_rule_checks, prefix + "_ERC.json")]
+
+    if side == "drc":
+        return [os.path.join(output_path_rule_checks, prefix + "_DRC.json")]
+
+    return []
+
+
+def addGenerateJobs(scheduler, now, cli_args, staging_path, reused_sides=()):
+    """
+    Add all export and post-processing jobs to the scheduler.
+
+    Artifacts are named after the export that produces them. Source files
+    are used directly as inputs. The step export is by far the slowest one,
+    it runs in the background lane so it doesn't hold up the other jobs.
+    Exports of reused sides are left out, their artifacts already exist.
+    Archives that are only packaged into other archives are written to the
+    staging path.
+
+    With assembly variants the bill of materials, the position files and the
+    fabrication layer pdf files are exported by one job per variant, which
+    run in parallel. Everything else is exported once and shared by all
+    variants.
+    """
+    sch = prin.schematic_file_name
+    pcb = prin.pcb_file_name
+    revision = prin.revision
+
+    if "pcb" not in reused_sides:
+        scheduler.add(Job("exportStep", exportStep, (pcb, revision),
+                          inputs=[pcb], outputs=["step"], background=True))
+
+    if "schematic" not in reused_sides:
+        scheduler.add(Job("exportPdfSch", exportPdfSch, (sch, revision),
+                          inputs=[sch], outputs=["pdf_sch"]))
+
+    if "pcb" not in reused_sides:
+        # the fabrication layers of the variants are plotted separately
+        scheduler.add(Job("exportPdfPcb", exportPdfPcb,
+                          (pcb, prin.copper_layers, revision,
+                           cli_args.plot_jobs or cli_args.jobs),
+                          inputs=[pcb],
+                          outputs=["pdf_pcb"] + ([] if variants
+                                                 else ["pdf_fab"])))
+        scheduler.add(Job("exportGerbers", exportGerbers,
+                          (pcb, prin.copper_layers, revision),
+                          inputs=[pcb], outputs=["gerbers", "drill"]))
+
+    assemblies = variants or [None]
+
+    if not variants:
+        if "schematic" not in reused_sides:
+            scheduler.add(Job("exportBom", exportBom,
+                              (sch, revision, cli_args.bom_engine,
+                               cli_args.bom_outputs),
+                              inputs=[sch], outputs=["bom"]))
+
+        if "pcb" not in reused_sides:
+            scheduler.add(Job("exportPickAndPlace", exportPickAndPlace,
+                              (pcb, revision, cli_args.pos_engine),
+                              inputs=[pcb], outputs=["pos"]))
+    elif "assembly" not in reused_sides:
+        for variant in variants:
+            name, suffix = "_" + variant, ":" + variant
+
+            scheduler.add(Job("exportBom" + name, exportBom,
+                              (sch, revision, cli_args.bom_engine,
+                               cli_args.bom_outputs, variant),
+                              inputs=[sch], outputs=["bom" + suffix]))
+            scheduler.add(Job("exportPickAndPlace" + name,
+                              exportPickAndPlace,
+                              (pcb, revision, cli_args.pos_engine, variant),
+                              inputs=[sch, pcb], outputs=["pos" + suffix]))
+            scheduler.add(Job("exportPdfFab" + name, exportPdfFab,
+                              (pcb, revision, variant),
+                              inputs=[sch, pcb],
+                              outputs=["pdf_fab" + suffix]))
+
+    archives = []
+
+    for package in packaging_manifest:
+        for variant in assemblies if package.get("per_assembly") else [None]:
+            name, suffix = ("", "") if variant is None else \
+                ("_" + variant, ":" + variant)
+            substitutions = {
+                "prefix": project_name + "_R" + revision,
+                "assembly": getAssemblyPrefix(revision, variant),
+                "now": now,
+                "staging": staging_path,
+                "variant": variant,
+            }
+            archive = "archive_" + package["name"] + suffix
+
+            scheduler.add(Job("package" + package["name"] + name,
+                              packageArchive,
+                              (package, substitutions,
+                               cli_args.archive_compression,
+                               cli_args.archive_level, cli_args.jobs),
+                              inputs=[artifact.format(variant=suffix)
+                                      for artifact in package["inputs"]],
+                              outputs=[archive]))
+            archives.append(archive)
+
+    # the intermediate files are reused in incremental mode
+    if not cli_args.incremental:
+        scheduler.add(Job("removeIntermediates", removeIntermediates,
+                          (revision,), inputs=archives))
+
+    scheduler.add(Job("processPrjDirectory", processPrjDirectory,
+                      (revision, cli_args.snapshot_from_sheets),
+                      inputs=[sch, pcb]))
+
+
+def loadProject(cli_args):
+    """
+    Read the project information of the project in the current working
+    directory.
+    """
+    global prin, project_name, kicad_cli_command, kicad_cli_version, \
+        staging_dir, plot_backend, bom_outputs, variants
+
+    prin = ProjectInformation(cli_args)
+    project_name = getFilenameWithouthExtension(prin.project_file_name)
+
+    kicad_cli_command = getKicadCliCommand(cli_args.kicad_cli)
+    kicad_cli_version = None
+    staging_dir = cli_args.staging_dir
+    plot_backend = createPlotBackend(cli_args.plot_backend, runKicadCli,
+                                     prin.drawing_sheet_file_name)
+    bom_outputs = cli_args.bom_outputs
+    variants = list(dict.fromkeys(cli_args.variants))
+
+
+def getReusedSides(build_state):
+    """
+    Return the sides of the project whose artifacts are still up to date.
+
+    A side is also generated again if one of its artifacts is missing, like
+    a newly selected BOM output.
+    """
+    reused_sides = set()
+
+    for side in getIncrementalStages():
+        artifacts = getIncrementalArtifacts(side, prin.revision)
+
+        if build_state.isUpToDate(side, getIncrementalInputs(side)) and \
+                all(os.path.isfile(artifact) for artifact in artifacts):
+            reused_sides.add(side)
+
+    if reused_sides:
+        reused_stages = [
+            stage
+            for side, stages in getIncrementalStages().items()
+            if side in reused_sides
+            for stage in stages
+        ]
+        print("* Unchanged since the last run, reusing: " +
+              ", ".join(reused_stages) + "\n")
 
-delete_files_and_directories(
-    [os.path.join(fab_path, "*PCB.pdf"), os.path.join(fab_path, "*SCH.pdf")]
-)
-copy_files_and_directories(
-    output_path_gerber, fab_path, 
-    ["*-pos.csv", "*_Fab.gbr"]
-)
+    return reused_sides
 
-create_archive(
-    os.path.join(
-        fab_path,
-        project_name + "_R" + prin.revision + "_FAB_" + now + ".zip"
-    ),
-    [os.path.join(fab_path, "*-pos.csv"), os.path.join(fab_path, "*_Fab.gbr")]
-)
 
-delete_files_and_directories(
-    [os.path.join(fab_path, "*-pos.csv"), os.path.join(fab_path, "*_Fab.gbr")]
-)
+def generate(cli_args, build_state=None, reused_sides=()):
+    """
+    Run the rule checks and generate everything of the loaded project that
+    isn't reused.
 
-create_archive(
-    os.path.join(
-        fab_path,
-        project_name + "_R" + prin.revision + "_FRT_" + now + ".zip"
-    ),
-    [
-        os.path.join(fab_path, "*.csv"),
-        os.path.join(fab_path, "*.pdf"),
-        os.path.join(fab_path, "*FAB*.zip"),
-        os.path.join(fab_path, "*GERBER*.zip")
-    ]
-)
+    Args:
+        cli_args (argparse.Namespace): Parsed command line arguments.
+        build_state (BuildState): State the generated sides are recorded in,
+            None if the run isn't incremental.
+        reused_sides (set): Sides of the project that are up to date.
+
+    Raises:
+        GeneratorError: If a rule check found errors or a job failed.
+    """
+    global bom_symbols
+
+    # the schematic may have changed since the last run in watch mode
+    bom_symbols = None
+
+    run_drc = not cli_args.no_drc and "drc" not in reused_sides
+    run_erc = not cli_args.no_erc and "erc" not in reused_sides
+    speculative = cli_args.speculative and (run_erc or run_drc)
+
+    # The checks run in parallel. Speculatively, the generation runs
+    # alongside them and is cancelled as soon as one of them fails.
+    def createCheckJobs():
+        check_jobs = []
 
-delete_files_and_directories(
-    [
-        os.path.join(fab_path, "*.csv"),
-        os.path.join(fab_path, "*_Fab.gbr"),
-        os.path.join(fab_path, "*.pdf"),
-        os.path.join(fab_path, "*FAB*.zip")
+        if run_drc:
+            check_jobs.append(Job("DRC", exportDrc,
+                                  (prin.pcb_file_name, prin.revision),
+                                  inputs=[prin.pcb_file_name],
+                                  outputs=["drc"],
+                                  cancel_on_failure=speculative))
+
+        if run_erc:
+            check_jobs.append(Job("ERC", exportErc,
+                                  (prin.schematic_file_name, prin.revision),
+                                  inputs=[prin.schematic_file_name],
+                                  outputs=["erc"],
+                                  cancel_on_failure=speculative))
+
+        return check_jobs
+
+    check_jobs = [] if speculative else createCheckJobs()
+
+    if check_jobs:
+        print("====================== Rule checks =========================\n")
+
+        scheduler = Scheduler(cli_args.jobs, timeout=cli_args.timeout)
+
+        for job in check_jobs:
+            scheduler.add(job)
+
+        failed_checks = scheduler.run()
+
+        if failed_checks:
+            recordSides(build_state, check_jobs, reused_sides)
+
+            for job in failed_checks:
+                print(f"Error: {job.name}: {job.error}")
+            raise GeneratorError("Rule checks have errors.")
+
+    check_jobs_done = check_jobs
+
+    if speculative:
+        print("============ Rule checks, Generate and Process =============\n")
+    else:
+        print("=================== Generate and Process ===================\n")
+
+    today = datetime.now()
+    now = today.strftime("%Y%m%d_%H%M%S")
+    output_snapshot = getOutputSnapshot() if speculative else None
+
+    def runJobs(staging_path):
+        check_jobs = createCheckJobs() if speculative else []
+        scheduler = Scheduler(cli_args.jobs, on_cancel=runner.cancelAll,
+                              timeout=cli_args.timeout,
+                              fail_fast=cli_args.fail_fast)
+
+        for job in check_jobs:
+            scheduler.add(job)
+
+        addGenerateJobs(scheduler, now, cli_args, staging_path, reused_sides)
+
+        try:
+            failed_jobs = scheduler.run()
+            background_jobs = scheduler.backgroundJobs()
+
+            if background_jobs:
+                printStatus("* Waiting for the background jobs: " +
+                            ", ".join(job.name for job in background_jobs) +
+                            "\n")
+
+            failed_jobs += scheduler.waitForBackground()
+        finally:
+            runner.reset()
+            # boards loaded in process are loaded again on the next run
+            plot_backend.close()
+
+        # archives staged for other archives didn't fit, all jobs are run
+        # again with the staging directory on disk
+        for job in failed_jobs:
+            if isOutOfSpace(job.error):
+                raise job.error
+
+        return scheduler, check_jobs, failed_jobs
+
+    scheduler, check_jobs, failed_jobs = runStaged(runJobs)
+
+    # once per run, evicting scans the whole cache
+    if build_cache is not None:
+        with tracing.span("evict", "cache"):
+            build_cache.evict()
+
+    if speculative and scheduler.cancelled_by in check_jobs:
+        removeNewOutputs(output_snapshot)
+        # only the checks are recorded, the generated sides were removed
+        recordSides(build_state, check_jobs, reused_sides)
+
+        # the other jobs were stopped, their errors are only a consequence
+        job = scheduler.cancelled_by
+        print(f"Error: {job.name}: {job.error}")
+        raise GeneratorError("Rule checks have errors, generation was "
+                             "cancelled and its outputs removed.")
+
+    recordSides(build_state, check_jobs_done + scheduler.jobs, reused_sides)
+
+    if failed_jobs:
+        for job in failed_jobs:
+            print(f"Error: {job.name}: {job.error}")
+        raise GeneratorError(f"{len(failed_jobs)} jobs failed.")
+
+    if build_cache is not None:
+        print(f"* Build cache: {build_cache.hits} restored, "
+              f"{build_cache.misses} generated.")
+
+    print("\n======================= Success ===========================\n")
+
+
+def recordSides(build_state, jobs, reused_sides):
+    """
+    Record the sides whose stages all finished in the build state and forget
+    the ones with a failed stage, then save it. Does nothing if the run
+    isn't incremental.
+    """
+    if build_state is None:
+        return
+
+    job_states = {job.name: job.state for job in jobs}
+
+    for side, stages in getIncrementalStages().items():
+        # the jobs of assembly variants are named stage_variant
+        stages = [name for name in job_states
+                  if name.split("_", 1)[0] in stages]
+
+        if side in reused_sides or not stages:
+            continue
+
+        if all(job_states[stage] == "done" for stage in stages):
+            build_state.record(side, getIncrementalInputs(side),
+                               getIncrementalArtifacts(side, prin.revision))
+        else:
+            build_state.forget(side)
+
+    build_state.save()
+
+
+def getOutputSnapshot():
+    """
+    Return the files in the output directories with their modification
+    times, and the directories with None.
+    """
+    snapshot = {}
+
+    for directory in output_directories:
+        for root, _, files in os.walk(directory):
+            snapshot[root] = None
+
+            for name in files:
+                file_name = os.path.join(root, name)
+                snapshot[file_name] = os.stat(file_name).st_mtime_ns
+
+    return snapshot
+
+
+def removeNewOutputs(snapshot):
+    """
+    Remove the files written to the output directories since the snapshot
+    was taken, and the directories that were created for them.
+    """
+    for directory in output_directories:
+        for root, _, files in os.walk(directory, topdown=False):
+            for name in files:
+                file_name = os.path.join(root, name)
+
+                if snapshot.get(file_name) != os.stat(file_name).st_mtime_ns:
+                    os.remove(file_name)
+
+            if root not in snapshot and not os.listdir(root):
+                os.rmdir(root)
+
+    printStatus("* Remove outputs of the cancelled generation...Done.\n")
+
+
+def generateProject(cli_args):
+    """
+    Generate the production files of the project in the current working
+    directory.
+
+    Args:
+        cli_args (argparse.Namespace): Parsed command line arguments.
+    """
+    global build_cache
+
+    loadProject(cli_args)
+
+    build_cache = None
+
+    if cli_args.cache_dir:
+        build_cache = BuildCache(cli_args.cache_dir,
+                                 cli_args.cache_size * 1024 * 1024)
+
+    build_state = None
+    reused_sides = set()
+
+    if cli_args.incremental:
+        build_state = BuildState()
+        reused_sides = getReusedSides(build_state)
+
+    if cli_args.trace:
+        tracing.start()
+
+    try:
+        generate(cli_args, build_state, reused_sides)
+    except GeneratorError as e:
+        print(f"Error: {e}")
+        print("Terminating...")
+        sys.exit(1)
+    finally:
+        if cli_args.trace:
+            tracing.stop(cli_args.trace)
+
+
+def diffRevisions(cli_args):
+    """
+    Compare the pcb pdf files of two revisions of the project in the current
+    working directory and write an overlay of the changes of every layer.
+
+    The pdf files of both revisions have to be in the PDF directory. With one
+    revision given, it is compared to the current revision of the project.
+
+    Args:
+        cli_args (argparse.Namespace): Parsed command line arguments.
+    """
+    # numpy is only needed for diffs
+    from pdf_diff import diff_pdfs
+
+    loadProject(cli_args)
+
+    old_revision = cli_args.diff[0]
+    new_revision = cli_args.diff[1] if len(cli_args.diff) > 1 \
+        else prin.revision
+    pcb_name = getFilenameWithouthExtension(prin.pcb_file_name)
+
+    pdf_files = [
+        os.path.join(output_path_pdf, pcb_name + "_R" + revision + "_PCB.pdf")
+        for revision in (old_revision, new_revision)
     ]
-)
 
-delete_directory(output_path_gerber)
-print("Done.")
+    for pdf_file in pdf_files:
+        if not os.path.isfile(pdf_file):
+            print(f"Error: {pdf_file} doesn't exist, generate the revision "
+                  "first.")
+            print("Terminating...")
+            sys.exit(1)
 
-# PDF files
-print("\n* Process PDF directory...", end="")
-delete_files_and_directories([os.path.join(output_path_pdf, "*.Fab.pdf")])
-print("Done.")
+    output = os.path.join(output_path_pdf,
+                          pcb_name + "_R" + old_revision + "_R" +
+                          new_revision + "_DIFF.pdf")
 
-# PRJ Files
-print("\n* Process PDF directory...", end="")
-create_directory(project_path)
+    print("======================== Diff ==============================\n")
 
-copy_files_and_directories(
-    os.getcwd(),
-    project_path,
-    ["*.kicad_pro", "*.kicad_pcb", "*.kicad_sch"]
-)
+    results = diff_pdfs(pdf_files[0], pdf_files[1], output,
+                        cli_args.diff_dpi, cli_args.jobs)
+
+    for result in results:
+        if result["drawn_pixels"] is None:
+            print(f"{result['layer']:<16} {'':>8} (unchanged)")
+        else:
+            print(f"{result['layer']:<16} {result['score']:>8.2%} "
+                  f"({result['changed_pixels']} of "
+                  f"{result['drawn_pixels']} pixels)")
 
-delete_directory(os.path.join(os.getcwd(), project_path, project_path))
-insert_string_before_extension(project_path, "_R" + prin.revision)
-print("Done.")
+    print(f"\n* Overlay written to {output}\n")
+
+
+def getWatchedFiles():
+    """
+    Return every source file of the loaded project.
+    """
+    return sorted({
+        input_file
+        for side in getIncrementalStages()
+        for input_file in getIncrementalInputs(side)
+    })
+
+
+def watchProject(cli_args):
+    """
+    Generate the project and regenerate it whenever one of its source files
+    is saved.
+
+    Watching builds on the incremental mode, so only the sides of the project
+    affected by a change are generated again. The project information is only
+    read again if the project file, the top level schematic or the pcb
+    changed. Without a build cache directory, kicad-cli outputs are cached in
+    the default temporary directory for as long as the project is watched, so
+    undoing a change restores the previous outputs instead of generating them
+    again. The cache isn't staged in RAM, it can grow to the full cache size.
+
+    Args:
+        cli_args (argparse.Namespace): Parsed command line arguments.
+    """
+    global build_cache
+
+    cli_args.incremental = True
+
+    loadProject(cli_args)
+
+    with tempfile.TemporaryDirectory(prefix="kipfg-cache-") as cache_path:
+        build_cache = BuildCache(cli_args.cache_dir or cache_path,
+                                 cli_args.cache_size * 1024 * 1024)
+        build_state = BuildState()
+        watcher = FileWatcher(getWatchedFiles(), cli_args.watch_debounce)
+        reload_files = {
+            os.path.abspath(file_name)
+            for file_name in (prin.project_file_name,
+                              prin.schematic_file_name, prin.pcb_file_name)
+        }
+
+        try:
+            while True:
+                # every run is traced on its own
+                if cli_args.trace:
+                    tracing.start()
+
+                try:
+                    generate(cli_args, build_state,
+                             getReusedSides(build_state))
+                except GeneratorError as e:
+                    print(f"Error: {e}\n")
+                except Exception:
+                    # like a file read while it was half saved, the next
+                    # save fixes it
+                    traceback.print_exc()
+                    print("Error: Generating the project failed.\n")
+                finally:
+                    if cli_args.trace:
+                        tracing.stop(cli_args.trace)
+
+                print("* Watching for changes, press Ctrl+C to stop...\n")
+
+                changed_files = watcher.wait()
+
+                print("* Changed: " + ", ".join(
+                    sorted(os.path.relpath(file_name)
+                           for file_name in changed_files)) + "\n")
+
+                reload = bool(changed_files & reload_files)
+
+                while True:
+                    try:
+                        if reload:
+                            loadProject(cli_args)
+                        else:
+                            # sheets might have been added or removed
+                            prin.schematic_sheet_file_names = None
+
+                        watcher.setFiles(getWatchedFiles())
+                        break
+                    except SystemExit:
+                        pass
+                    except Exception:
+                        traceback.print_exc()
+
+                    print("* Waiting for the project to be fixed...\n")
+                    watcher.wait()
+                    reload = True
+
+        except KeyboardInterrupt:
+            print("\n* Stopped watching.")
+
+        finally:
+            watcher.close()
+
+
+def main():
+    cli_arg_parser = createCliArgParser()
+    cli_args = cli_arg_parser.parse_args()
+
+    if cli_args.batch and cli_args.watch:
+        cli_arg_parser.error("--watch can't be combined with --batch")
+
+    for variant in cli_args.variants:
+        if not re.fullmatch(r"[\w.-]+", variant):
+            cli_arg_parser.error(f"invalid variant name '{variant}', only "
+                                 "letters, digits, '_', '.' and '-' are "
+                                 "allowed")
+
+    if cli_args.diff is not None:
+        if len(cli_args.diff) > 2:
+            cli_arg_parser.error("--diff takes one or two revisions")
+
+        if cli_args.batch or cli_args.watch:
+            cli_arg_parser.error("--diff can't be combined with --batch or "
+                                 "--watch")
+
+        diffRevisions(cli_args)
+        return
+
+    if cli_args.batch:
+        sys.exit(runBatch(cli_args, generateProject))
+
+    # the layer plots run inside the jobs, so kicad-cli is limited globally
+    limitKicadCli(cli_args.jobs)
+
+    if cli_args.watch:
+        watchProject(cli_args)
+    else:
+        generateProject(cli_args)
 
 
-print("\n======================= Success ===========================\n")
+if __name__ == "__main__":
+    main()
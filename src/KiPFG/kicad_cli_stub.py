@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Stand-in for kicad-cli that writes placeholder outputs.
+
+It understands the commands KiPFG runs: schematic and pcb pdf, gerbers,
+drill, position, step and BOM exports and the electrical and design rule
+checks. The outputs have the names and the structure kicad-cli would write,
+so everything after the exports runs unchanged, but without KiCad. Select it
+with `--kicad-cli stub`.
+
+The stub is configured through environment variables:
+
+    KIPFG_STUB_DELAY       Seconds every call takes (default: 0).
+    KIPFG_STUB_SIZE        Approximate size of every generated file in bytes
+                           (default: 0, as small as possible).
+    KIPFG_STUB_VIOLATIONS  Number of violations the rule checks report
+                           (default: 0).
+
+The outputs only depend on the command line, the input files and these
+settings, so runs are reproducible.
+"""
+import os
+import re
+import sys
+import time
+
+import fitz
+
+VERSION = "8.0.0 (KiPFG stub)"
+
+REFERENCE = re.compile(
+    r'\(property "Reference" "([^"]+)".*?\(property "Value" "([^"]*)"'
+    r'(?:.*?\(property "Footprint" "([^"]*)")?', re.S
+)
+FOOTPRINT = re.compile(
+    r'\(footprint "([^"]+)"\s*\(layer "([FB])\.Cu"\).*?\(at ([-\d.]+) ([-\d.]+)'
+    r'.*?\(property "Reference" "([^"]+)".*?\(property "Value" "([^"]*)"',
+    re.S
+)
+
+
+def setting(name, default, cast=int):
+    value = os.environ.get("KIPFG_STUB_" + name)
+    return cast(value) if value else default
+
+
+def option(args, *names):
+    for name in names:
+        if name in args:
+            return args[args.index(name) + 1]
+    return None
+
+
+def padding(size, line, used=0):
+    """
+    Return copies of a filler line making up the remaining size of a file.
+    """
+    if size <= used:
+        return ""
+
+    return line * ((size - used) // len(line) + 1)
+
+
+def write_text(file_name, head, filler, tail=""):
+    """
+    Write a text file, padded with filler lines between head and tail to the
+    configured size.
+    """
+    body = padding(setting("SIZE", 0), filler, len(head) + len(tail))
+
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.write(head + body + tail)
+
+
+def write_pdf(file_name, pages, text):
+    document = fitz.open()
+    # the same stroke over and over, stored uncompressed like the vector
+    # content of a real plot
+    filler = padding(setting("SIZE", 0) // pages, "72 100 m 82 105 l S\n")
+
+    for page_number in range(pages):
+        page = document.new_page()
+        page.insert_text((72, 72), f"{text} ({page_number + 1}/{pages})")
+
+        if filler:
+            xref = page.get_contents()[0]
+            content = document.xref_stream(xref) + \
+                f"\nq 0.1 w\n{filler}Q\n".encode("ascii")
+            document.update_stream(xref, content, compress=False)
+
+    document.save(file_name)
+
+
+def read_schematics(file_name):
+    """
+    Return the content of a schematic and all sheets next to it.
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".kicad_sch"):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                yield f.read()
+
+
+def export_bom(args, input_file, output):
+    groups = {}
+
+    for content in read_schematics(input_file):
+        for reference, value, footprint in REFERENCE.findall(content):
+            groups.setdefault((value, footprint or ""), []).append(reference)
+
+    labels = (option(args, "--labels") or "Reference,Value").split(",")
+    lines = [",".join(f'"{label}"' for label in labels) + "\n"]
+
+    for (value, footprint), references in sorted(groups.items()):
+        row = [str(len(references)), " ".join(references), value, footprint]
+        row += [""] * (len(labels) - len(row))
+        lines.append(",".join(f'"{field}"' for field in row) + "\n")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
+
+
+def export_pos(args, input_file, output):
+    side = option(args, "--side") or "both"
+
+    with open(input_file, encoding='utf-8') as f:
+        footprints = FOOTPRINT.findall(f.read())
+
+    lines = ["Ref,Val,Package,PosX,PosY,Rot,Side\n"]
+
+    for package, layer, x, y, reference, value in footprints:
+        layer_side = "front" if layer == "F" else "back"
+
+        if side in ("both", layer_side):
+            lines.append(f'"{reference}","{value}","{package.split(":")[-1]}",'
+                         f'{x},{y},0,{"top" if layer == "F" else "bottom"}\n')
+
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
+
+
+def export_gerbers(args, name, output):
+    for layer in option(args, "--layers", "-l").split(","):
+        write_text(
+            os.path.join(output, f"{name}-{layer.replace('.', '_')}.gbr"),
+            "%TF.GenerationSoftware,KiCad,Pcbnew,stub*%\n"
+            f"%TF.FileFunction,{layer}*%\n"
+            "%FSLAX46Y46*%\n%MOMM*%\n%ADD10C,0.100000*%\nD10*\n",
+            "X1000000Y1000000D02*\nX2000000Y1000000D01*\n",
+            "M02*\n"
+        )
+
+    with open(os.path.join(output, f"{name}-job.gbrjob"), 'w',
+              encoding='utf-8') as f:
+        f.write('{"Header": {"GenerationSoftware": {"Application": "stub"}}}\n')
+
+
+def export_drill(name, output):
+    for suffix in ("-NPTH.drl", "-PTH.drl"):
+        write_text(os.path.join(output, name + suffix),
+                   "M48\n; DRILL file {KiCad stub}\nFMAT,2\nMETRIC\n"
+                   "T1C0.300\n%\nG90\nG05\nT1\n",
+                   "X10.0Y10.0\n",
+                   "M30\n")
+
+    for suffix in ("-NPTH-drl_map.gbr", "-PTH-drl_map.gbr"):
+        write_text(os.path.join(output, name + suffix),
+                   "%TF.FileFunction,Drillmap*%\n%FSLAX46Y46*%\n%MOMM*%\n",
+                   "X1000000Y1000000D03*\n")
+
+
+def rule_check(output):
+    violations = setting("VIOLATIONS", 0)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write('{"violations": [' + ", ".join(
+            '{"type": "stub", "severity": "error"}'
+            for _ in range(violations)
+        ) + ']}\n')
+
+    print(f"Found {violations} violations")
+
+
+def main(args):
+    time.sleep(setting("DELAY", 0.0, float))
+
+    if args[:1] == ["version"]:
+        print(VERSION)
+        return 0
+
+    input_file = args[-1]
+    output = option(args, "--output", "-o")
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    command = args[:3]
+
+    if command == ["pcb", "export", "pdf"]:
+        write_pdf(output, 1, " ".join(args[:-1]))
+
+    elif command == ["sch", "export", "pdf"]:
+        write_pdf(output, len(list(read_schematics(input_file))),
+                  " ".join(args[:-1]))
+
+    elif command == ["pcb", "export", "gerbers"]:
+        export_gerbers(args, name, output)
+
+    elif command == ["pcb", "export", "drill"]:
+        export_drill(name, output)
+
+    elif command == ["pcb", "export", "pos"]:
+        export_pos(args, input_file, output)
+
+    elif command == ["pcb", "export", "step"]:
+        write_text(output,
+                   "ISO-10303-21;\nHEADER;\nFILE_DESCRIPTION(('stub'),'2;1');\n"
+                   "ENDSEC;\nDATA;\n",
+                   "#1=CARTESIAN_POINT('',(0.,0.,0.));\n",
+                   "ENDSEC;\nEND-ISO-10303-21;\n")
+
+    elif command == ["sch", "export", "bom"]:
+        export_bom(args, input_file, output)
+
+    elif args[:2] in (["sch", "erc"], ["pcb", "drc"]):
+        rule_check(output)
+
+    else:
+        print(f"kicad-cli stub: unsupported command {' '.join(args)}",
+              file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
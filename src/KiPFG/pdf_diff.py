@@ -0,0 +1,338 @@
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import numpy as np
+
+# Edge length of the tiles pages are rendered in, in pixels. Only a few tiles
+# are held in memory at a time, whatever the size of the page and the
+# resolution.
+TILE_SIZE = 1024
+
+# Gray level below which a pixel counts as drawn.
+INK_THRESHOLD = 128
+
+# Colors of the overlay by pixel state: nothing changed, drawn only in the
+# old revision and drawn only in the new one. Unchanged pixels are
+# transparent, the new revision shows through.
+OVERLAY_PALETTE = np.array([
+    (0, 0, 0, 0),
+    (220, 0, 0, 255),
+    (0, 150, 0, 255),
+    (0, 0, 0, 0),
+], dtype=np.uint8)
+
+# documents opened by the worker processes, by file name
+_documents = {}
+
+
+def _document(file_name):
+    if file_name not in _documents:
+        _documents[file_name] = fitz.open(file_name)
+
+    return _documents[file_name]
+
+
+def _bookmarked_pages(document):
+    """
+    Return the page numbers of an open pcb pdf file by the layer names of
+    their bookmarks, None if not every page has one.
+    """
+    toc = document.get_toc()
+
+    if len(toc) != document.page_count:
+        return None
+
+    return {title: page - 1 for _, title, page in toc}
+
+
+def get_layer_pages(file_name):
+    """
+    Return the layers of a pcb pdf file with their page numbers.
+
+    The layers are read from the bookmarks exportPdfPcb adds to every page.
+    Files without bookmarks have their pages named by number.
+
+    Args:
+        file_name (str): Path to the pdf file.
+
+    Returns:
+        dict: Page numbers, starting at 0, by layer name.
+    """
+    with fitz.open(file_name) as document:
+        pages = _bookmarked_pages(document)
+
+        if pages is not None:
+            return pages
+
+        return {f"Page {page + 1}": page
+                for page in range(document.page_count)}
+
+
+def match_layer_pages(old_file, new_file):
+    """
+    Match the pages of the layers of two pcb pdf files.
+
+    Layers are matched by the names of their bookmarks. Pcb pdf files written
+    by kicad-cli alone, or by older versions, have no bookmarks. If either
+    file has none, or the files have no layer name in common, the pages are
+    matched by their position instead, and named after the bookmarks of the
+    other file if it has some.
+
+    Args:
+        old_file (str): Pdf file of the old revision.
+        new_file (str): Pdf file of the new revision.
+
+    Returns:
+        list: Tuples of the layer name and its page numbers in the old and
+        the new file, None where the file doesn't have the layer.
+    """
+    with fitz.open(old_file) as old_document, \
+            fitz.open(new_file) as new_document:
+        old_layers = _bookmarked_pages(old_document)
+        new_layers = _bookmarked_pages(new_document)
+        old_count = old_document.page_count
+        new_count = new_document.page_count
+
+    if old_layers and new_layers and old_layers.keys() & new_layers.keys():
+        layers = list(new_layers) + [layer for layer in old_layers
+                                     if layer not in new_layers]
+
+        return [(layer, old_layers.get(layer), new_layers.get(layer))
+                for layer in layers]
+
+    names = {}
+
+    for layers in (old_layers, new_layers):
+        for layer, page in (layers or {}).items():
+            names[page] = layer
+
+    return [(names.get(page, f"Page {page + 1}"),
+             page if page < old_count else None,
+             page if page < new_count else None)
+            for page in range(max(old_count, new_count))]
+
+
+def _render(file_name, page_number, clip, zoom, shape):
+    """
+    Render a part of a page as gray levels with the given shape. Parts
+    outside of the page and missing pages are white.
+    """
+    pixels = np.full(shape, 255, dtype=np.uint8)
+
+    if page_number is None:
+        return pixels
+
+    page = _document(file_name)[page_number]
+    clip = fitz.Rect(clip) & page.rect
+
+    if clip.is_empty:
+        return pixels
+
+    pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip,
+                             colorspace=fitz.csGRAY, alpha=False)
+    tile = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(
+        pixmap.height, pixmap.stride)[:, :pixmap.width]
+
+    height = min(shape[0], tile.shape[0])
+    width = min(shape[1], tile.shape[1])
+    pixels[:height, :width] = tile[:height, :width]
+
+    return pixels
+
+
+def diff_tile(old_file, old_page, new_file, new_page, clip, zoom):
+    """
+    Compare one tile of a layer in two revisions.
+
+    Args:
+        old_file (str): Pdf file of the old revision.
+        old_page (int): Page of the layer in it, None if it doesn't exist.
+        new_file (str): Pdf file of the new revision.
+        new_page (int): Page of the layer in it, None if it doesn't exist.
+        clip (tuple): The tile as rectangle in points.
+        zoom (float): Pixels per point.
+
+    Returns:
+        tuple: The number of changed and of drawn pixels, and the changes of
+        the tile as transparent png, None if nothing changed.
+    """
+    x0, y0, x1, y1 = clip
+    shape = (max(1, round((y1 - y0) * zoom)), max(1, round((x1 - x0) * zoom)))
+
+    old_ink = _render(old_file, old_page, clip, zoom, shape) < INK_THRESHOLD
+    new_ink = _render(new_file, new_page, clip, zoom, shape) < INK_THRESHOLD
+
+    drawn_pixels = int(np.count_nonzero(old_ink | new_ink))
+    changed_pixels = int(np.count_nonzero(old_ink ^ new_ink))
+
+    if not changed_pixels:
+        return 0, drawn_pixels, None
+
+    # 0 unchanged, 1 removed, 2 added, 3 drawn in both
+    state = old_ink.view(np.uint8) | (new_ink.view(np.uint8) << 1)
+    overlay = OVERLAY_PALETTE[state]
+
+    pixmap = fitz.Pixmap(fitz.csRGB, shape[1], shape[0], overlay.tobytes(),
+                         True)
+
+    return changed_pixels, drawn_pixels, pixmap.tobytes("png")
+
+
+def _tiles(rect, zoom):
+    """
+    Split a page into tiles of TILE_SIZE pixels, as rectangles in points.
+    """
+    step = TILE_SIZE / zoom
+    y = rect.y0
+
+    while y < rect.y1:
+        x = rect.x0
+
+        while x < rect.x1:
+            yield (x, y, min(x + step, rect.x1), min(y + step, rect.y1))
+            x += step
+
+        y += step
+
+
+def _is_identical(old_document, old_page, new_document, new_page):
+    """
+    Check whether a layer is drawn the same in both revisions, without
+    rendering it.
+    """
+    if old_page is None or new_page is None:
+        return False
+
+    old = old_document[old_page]
+    new = new_document[new_page]
+
+    return old.rect == new.rect and old.read_contents() == new.read_contents()
+
+
+def _map_bounded(executor, function, arguments, window):
+    """
+    Like executor.map, but only a window of calls is submitted ahead of the
+    result consumed, so the results don't pile up in memory.
+    """
+    pending = collections.deque()
+
+    for args in arguments:
+        pending.append(executor.submit(function, *args))
+
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def diff_pdfs(old_file, new_file, output_file, dpi=300, max_workers=None):
+    """
+    Compare the layers of two pcb pdf files and write an overlay of every
+    layer.
+
+    Layers are matched by name, or by page without bookmarks, see
+    match_layer_pages. Layers whose pages have the same content are
+    unchanged. The pages of the others are rendered in tiles by a pool of
+    processes, and the tiles are compared as arrays. Only a few tiles more
+    than there are processes are in flight at a time, the tiles of the next
+    layer are rendered while the overlay of a layer is built. Every page of
+    the overlay shows the layer of the new revision, with removed lines in
+    red and added ones in green on top. The score of a layer is the share of
+    its drawn pixels that changed.
+
+    Args:
+        old_file (str): Pdf file of the old revision.
+        new_file (str): Pdf file of the new revision.
+        output_file (str): Path to the overlay pdf file.
+        dpi (int): Resolution the pages are compared at.
+        max_workers (int): Number of processes rendering tiles, None for
+            the number of CPUs.
+
+    Returns:
+        list: One dict per layer with the keys "layer", "changed_pixels",
+        "drawn_pixels" and "score". The drawn pixels of unchanged layers
+        aren't counted and are None.
+    """
+    layers = match_layer_pages(old_file, new_file)
+    zoom = dpi / 72
+
+    old_document = fitz.open(old_file)
+    new_document = fitz.open(new_file)
+    output = fitz.open()
+    results = []
+
+    # tiles of the layers that changed, in layer order
+    diffs = {}
+
+    for layer, old_page, new_page in layers:
+        if not _is_identical(old_document, old_page, new_document, new_page):
+            rect = (new_document[new_page] if new_page is not None
+                    else old_document[old_page]).rect
+            diffs[layer] = (old_page, new_page, list(_tiles(rect, zoom)))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # the tiles of all layers are queued in one stream, so the pool never
+        # waits for a layer, but only a window of them at a time
+        tile_diffs = _map_bounded(
+            executor,
+            diff_tile,
+            ((old_file, old_page, new_file, new_page, tile, zoom)
+             for old_page, new_page, tiles in diffs.values()
+             for tile in tiles),
+            2 * (max_workers or os.cpu_count() or 1)
+        )
+
+        for layer, old_page, new_page in layers:
+            source, source_page = (new_document, new_page) \
+                if new_page is not None else (old_document, old_page)
+            rect = source[source_page].rect
+
+            page = output.new_page(width=rect.width, height=rect.height)
+            page.show_pdf_page(page.rect, source, source_page)
+
+            changed_pixels = 0
+            drawn_pixels = None
+
+            if layer in diffs:
+                drawn_pixels = 0
+
+                for tile in diffs[layer][2]:
+                    changed, drawn, png = next(tile_diffs)
+                    changed_pixels += changed
+                    drawn_pixels += drawn
+
+                    if png is not None:
+                        x0, y0, x1, y1 = tile
+                        page.insert_image(
+                            fitz.Rect(x0 - rect.x0, y0 - rect.y0,
+                                      x1 - rect.x0, y1 - rect.y0),
+                            stream=png)
+
+            score = changed_pixels / drawn_pixels if drawn_pixels else 0.0
+
+            page.insert_text((20, 20), f"{layer}: {score:.2%} changed",
+                             fontsize=10, color=(0, 0, 1))
+            results.append({
+                "layer": layer,
+                "changed_pixels": changed_pixels,
+                "drawn_pixels": drawn_pixels,
+                "score": score,
+            })
+
+    output.set_toc([[1, result["layer"], page + 1]
+                    for page, result in enumerate(results)])
+
+    output_dir = os.path.dirname(output_file)
+
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    output.save(output_file, garbage=3, deflate=True)
+    output.close()
+    old_document.close()
+    new_document.close()
+
+    return results
@@ -0,0 +1,352 @@
+import abc
+import importlib
+import os
+import tempfile
+import threading
+
+import tracing
+
+# Drill and drill map files of a board, as suffixes of its name.
+DRILL_FILE_SUFFIXES = [
+    "-NPTH.drl",
+    "-NPTH-drl_map.gbr",
+    "-PTH.drl",
+    "-PTH-drl_map.gbr",
+]
+
+
+def getBoardName(input_file):
+    return os.path.splitext(os.path.basename(input_file))[0]
+
+
+def getGerberFileName(input_file, output_dir, layer):
+    """
+    Return the file a layer is plotted to as gerber, named like kicad-cli
+    names it without protel extensions.
+    """
+    return os.path.join(output_dir, getBoardName(input_file) + "-" +
+                        layer.replace(".", "_") + ".gbr")
+
+
+class PlotBackend(abc.ABC):
+    """
+    Plots the layers, gerbers and drill files of a board.
+
+    The export functions of generate.py plot through this interface only, so
+    the backend can be swapped, or replaced by a stand-in that just records
+    the calls. Plots may be requested from several threads at once.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def plotPdf(self, input_file, layers, output, variables=None,
+                crossout_dnp=False):
+        """
+        Plot layers of a board onto one pdf page with the drawing sheet.
+
+        Args:
+            input_file (str): Path to the .kicad_pcb file.
+            layers (list): Names of the layers, like "F.Cu".
+            output (str): Path to the pdf file.
+            variables (dict): Text variables defined for the plot.
+            crossout_dnp (bool): Cross out the footprints marked "do not
+                populate" on the fabrication layers.
+        """
+
+    @abc.abstractmethod
+    def plotGerbers(self, input_file, layers, output_dir):
+        """
+        Plot layers of a board as gerber files with a gerber job file, with
+        the coordinates relative to the drill/place file origin.
+
+        Returns:
+            list: The files written, named like kicad-cli names them.
+        """
+
+    @abc.abstractmethod
+    def plotDrill(self, input_file, output_dir):
+        """
+        Write the Excellon drill files of a board, separately for plated and
+        non plated holes, with a gerber drill map of each.
+
+        Returns:
+            list: The files written, named like kicad-cli names them.
+        """
+
+    def close(self):
+        """
+        Release everything kept between plots, like loaded boards.
+        """
+
+
+class KicadCliBackend(PlotBackend):
+    """
+    Plots by running kicad-cli, which loads the board again for every plot.
+
+    Args:
+        run_kicad_cli (callable): Runs a kicad-cli command line, called with
+            the arguments, the input files and the output files.
+        drawing_sheet (str): Drawing sheet file used instead of the one of
+            the project, None for the one of the project.
+    """
+
+    name = "kicad-cli"
+
+    def __init__(self, run_kicad_cli, drawing_sheet=None):
+        self._run = run_kicad_cli
+        self._drawing_sheet = drawing_sheet
+
+    def plotPdf(self, input_file, layers, output, variables=None,
+                crossout_dnp=False):
+        args = ['kicad-cli', 'pcb', 'export', 'pdf', '--ibt']
+
+        if self._drawing_sheet:
+            args += ['--drawing-sheet', self._drawing_sheet]
+
+        args += ['-l', ",".join(layers)]
+
+        for name, value in (variables or {}).items():
+            args += ['--define-var', name + '=' + value]
+
+        if crossout_dnp:
+            args.append('--crossout-DNP-footprints-on-fab-layers')
+
+        args += ['--output', output, input_file]
+
+        self._run(args, [input_file], [output])
+
+    def plotGerbers(self, input_file, layers, output_dir):
+        args = [
+            "kicad-cli",
+            "pcb",
+            "export",
+            "gerbers",
+            "--layers",
+            ",".join(layers),
+            "--use-drill-file-origin",
+            "--no-protel-ext",
+            "--output",
+            output_dir,
+            input_file
+        ]
+
+        files = [getGerberFileName(input_file, output_dir, layer)
+                 for layer in layers]
+        files.append(os.path.join(output_dir,
+                                  getBoardName(input_file) + "-job.gbrjob"))
+
+        self._run(args, [input_file], files)
+
+        return files
+
+    def plotDrill(self, input_file, output_dir):
+        args = [
+            "kicad-cli",
+            "pcb",
+            "export",
+            "drill",
+            "--drill-origin",
+            "plot",
+            "--excellon-separate-th",
+            "--generate-map",
+            "--map-format",
+            "gerberx2",
+            "--output",
+            output_dir,
+            input_file
+        ]
+
+        files = [os.path.join(output_dir, getBoardName(input_file) + suffix)
+                 for suffix in DRILL_FILE_SUFFIXES]
+
+        self._run(args, [input_file], files)
+
+        return files
+
+
+class PcbnewBackend(PlotBackend):
+    """
+    Plots in this process through the pcbnew module of KiCad.
+
+    Every board is loaded once and kept in memory until it changes on disk,
+    so all layers, gerbers and drill files are plotted from one load. The
+    pcbnew module isn't thread safe, so the plots run one after the other.
+    Unlike a kicad-cli run, a plot can't be killed when its job times out.
+
+    Args:
+        pcbnew (module): The pcbnew module.
+        drawing_sheet (str): Drawing sheet file used instead of the one of
+            the project, None for the one of the project.
+    """
+
+    name = "pcbnew"
+
+    def __init__(self, pcbnew, drawing_sheet=None):
+        self._pcbnew = pcbnew
+        self._drawing_sheet = drawing_sheet
+        self._lock = threading.RLock()
+        self._boards = {}
+
+    def _board(self, input_file):
+        path = os.path.abspath(input_file)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        if path not in self._boards or self._boards[path][0] != version:
+            with tracing.span("load " + os.path.basename(path), "pcbnew"):
+                board = self._pcbnew.LoadBoard(path)
+
+            self._boards[path] = (version, board)
+
+        # loading a board loads the drawing sheet of its project
+        if self._drawing_sheet:
+            self._pcbnew.DS_DATA_MODEL.GetTheInstance().LoadDrawingSheet(
+                os.path.abspath(self._drawing_sheet))
+
+        return self._boards[path][1]
+
+    def _controller(self, board, output_dir):
+        controller = self._pcbnew.PLOT_CONTROLLER(board)
+        options = controller.GetPlotOptions()
+
+        options.SetOutputDirectory(output_dir)
+        options.SetAutoScale(False)
+        options.SetScale(1)
+        options.SetMirror(False)
+        options.SetNegative(False)
+
+        return controller, options
+
+    def plotPdf(self, input_file, layers, output, variables=None,
+                crossout_dnp=False):
+        pcbnew = self._pcbnew
+
+        with self._lock, tracing.span("plot pdf " + layers[0], "pcbnew"):
+            board = self._board(input_file)
+
+            # the variables are board properties, which the board keeps
+            # between plots, so they are reset afterwards
+            original_properties = dict(board.GetProperties())
+            properties = dict(original_properties)
+
+            for name, value in (variables or {}).items():
+                properties[name] = value
+
+            board.SetProperties(properties)
+            output_dir = os.path.dirname(os.path.abspath(output))
+
+            try:
+                with tempfile.TemporaryDirectory(dir=output_dir,
+                                                 prefix="kipfg-") as plot_dir:
+                    controller, options = self._controller(board, plot_dir)
+                    options.SetPlotFrameRef(True)
+                    options.SetUseAuxOrigin(False)
+
+                    if hasattr(options, "SetCrossoutDNPFPsOnFabLayers"):
+                        options.SetCrossoutDNPFPsOnFabLayers(crossout_dnp)
+
+                    controller.OpenPlotfile("plot", pcbnew.PLOT_FORMAT_PDF,
+                                            layers[0])
+
+                    for layer in layers:
+                        controller.SetLayer(board.GetLayerID(layer))
+                        controller.PlotLayer()
+
+                    plot_file = controller.GetPlotFileName()
+                    controller.ClosePlot()
+
+                    os.replace(plot_file, output)
+            finally:
+                board.SetProperties(original_properties)
+
+    def plotGerbers(self, input_file, layers, output_dir):
+        pcbnew = self._pcbnew
+        files = []
+
+        with self._lock, tracing.span("plot gerbers", "pcbnew"):
+            board = self._board(input_file)
+            controller, options = self._controller(board, output_dir)
+
+            options.SetPlotFrameRef(False)
+            options.SetUseAuxOrigin(True)
+            options.SetUseGerberProtelExtensions(False)
+            options.SetUseGerberX2format(True)
+            options.SetIncludeGerberNetlistInfo(True)
+            options.SetSubtractMaskFromSilk(False)
+
+            job_file = pcbnew.GERBER_JOBFILE_WRITER(board)
+
+            for layer in layers:
+                layer_id = board.GetLayerID(layer)
+
+                # the layer is needed for the X2 attributes of the file
+                controller.SetLayer(layer_id)
+                controller.OpenPlotfile(layer.replace(".", "_"),
+                                        pcbnew.PLOT_FORMAT_GERBER, layer)
+                controller.PlotLayer()
+                files.append(controller.GetPlotFileName())
+                controller.ClosePlot()
+
+                job_file.AddGbrFile(layer_id, os.path.basename(files[-1]))
+
+            files.append(os.path.join(output_dir,
+                                      getBoardName(input_file) +
+                                      "-job.gbrjob"))
+            job_file.CreateJobFile(files[-1])
+
+        return files
+
+    def plotDrill(self, input_file, output_dir):
+        pcbnew = self._pcbnew
+
+        with self._lock, tracing.span("plot drill", "pcbnew"):
+            board = self._board(input_file)
+            writer = pcbnew.EXCELLON_WRITER(board)
+
+            # no mirror, full header, plot origin, separate PTH and NPTH
+            writer.SetOptions(False, False, pcbnew.VECTOR2I(0, 0), False)
+            writer.SetFormat(True)
+            writer.SetMapFileFormat(pcbnew.PLOT_FORMAT_GERBER)
+            writer.CreateDrillandMapFilesSet(output_dir, True, True)
+
+        return [os.path.join(output_dir, getBoardName(input_file) + suffix)
+                for suffix in DRILL_FILE_SUFFIXES]
+
+    def close(self):
+        with self._lock:
+            self._boards.clear()
+
+
+def createPlotBackend(name, run_kicad_cli, drawing_sheet=None):
+    """
+    Create the plot backend selected on the command line.
+
+    The pcbnew backend needs the pcbnew module of KiCad. If it can't be
+    imported, or can't load a separate drawing sheet when one is given,
+    kicad-cli is used instead.
+
+    Args:
+        name (str): "kicad-cli" or "pcbnew".
+        run_kicad_cli (callable): Runs a kicad-cli command line, see
+            KicadCliBackend.
+        drawing_sheet (str): Drawing sheet file used instead of the one of
+            the project.
+
+    Returns:
+        PlotBackend: The backend.
+    """
+    if name == "pcbnew":
+        try:
+            pcbnew = importlib.import_module("pcbnew")
+        except ImportError:
+            print("* The pcbnew module can't be imported, plotting with "
+                  "kicad-cli.\n")
+        else:
+            if not drawing_sheet or hasattr(pcbnew, "DS_DATA_MODEL"):
+                return PcbnewBackend(pcbnew, drawing_sheet)
+
+            print("* The pcbnew module can't load the drawing sheet, "
+                  "plotting with kicad-cli.\n")
+
+    return KicadCliBackend(run_kicad_cli, drawing_sheet)
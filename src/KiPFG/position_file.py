@@ -0,0 +1,140 @@
+import re
+
+# A footprint starts a top level node of the board. Its own layer, position,
+# reference, value and attributes are written before any of its graphics and
+# pads, so the first match of each after the start belongs to the footprint.
+_FOOTPRINT = re.compile(r'\(footprint\s+"((?:[^"\\]|\\.)*)"')
+_LAYER = re.compile(r'\(layer\s+"?([FB])\.Cu"?\s*\)')
+_AT = re.compile(r'\(at\s+([-\d.eE+]+)\s+([-\d.eE+]+)(?:\s+([-\d.eE+]+))?')
+_REFERENCE = re.compile(
+    r'\((?:property\s+"Reference"|fp_text\s+reference)\s+"((?:[^"\\]|\\.)*)"')
+_VALUE = re.compile(
+    r'\((?:property\s+"Value"|fp_text\s+value)\s+"((?:[^"\\]|\\.)*)"')
+_ATTR = re.compile(r'\(attr((?:\s+[\w]+)*)\s*\)')
+_AUX_AXIS_ORIGIN = re.compile(
+    r'\(aux_axis_origin\s+([-\d.eE+]+)\s+([-\d.eE+]+)\s*\)')
+_ESCAPE = re.compile(r'\\(.)')
+
+POSITION_FILE_HEADER = "Ref,Val,Package,PosX,PosY,Rot,Side\n"
+
+
+def _unescape(text):
+    return _ESCAPE.sub(r'\1', text)
+
+
+def _natural_key(text):
+    # like the case insensitive reference sorting of KiCad
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', text.lower())]
+
+
+def _normalize_angle(angle):
+    """
+    Return an angle in degrees in the range (-180, 180], like KiCad stores
+    footprint orientations.
+    """
+    angle %= 360
+
+    return angle - 360 if angle > 180 else angle
+
+
+def read_placements(pcb_file_name):
+    """
+    Read the placement of every footprint of a board in one pass.
+
+    The board is not parsed as a whole. Only the head of every footprint is
+    searched for its reference, value, position, rotation, side and
+    attributes, which keeps boards with thousands of footprints fast.
+
+    Args:
+        pcb_file_name (str): Path to the .kicad_pcb file.
+
+    Returns:
+        tuple: The drill/place file origin as (x, y) in mm and a list of
+        dicts with the keys "reference", "value", "package", "x", "y",
+        "rotation", "side" ("top" or "bottom") and "attributes" (set).
+    """
+    with open(pcb_file_name, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    origin_match = _AUX_AXIS_ORIGIN.search(content)
+    origin = (float(origin_match.group(1)), float(origin_match.group(2))) \
+        if origin_match else (0.0, 0.0)
+
+    starts = [(match.start(), match.end(), match.group(1))
+              for match in _FOOTPRINT.finditer(content)]
+    placements = []
+
+    for index, (start, head, footprint_id) in enumerate(starts):
+        end = starts[index + 1][0] if index + 1 < len(starts) else len(content)
+
+        layer = _LAYER.search(content, head, end)
+        at = _AT.search(content, head, end)
+
+        if layer is None or at is None:
+            continue
+
+        reference = _REFERENCE.search(content, head, end)
+        value = _VALUE.search(content, head, end)
+        attributes = _ATTR.search(content, head, end)
+
+        placements.append({
+            "reference": _unescape(reference.group(1)) if reference else "",
+            "value": _unescape(value.group(1)) if value else "",
+            "package": _unescape(footprint_id).split(":")[-1],
+            "x": float(at.group(1)),
+            "y": float(at.group(2)),
+            "rotation": _normalize_angle(float(at.group(3) or 0)),
+            "side": "top" if layer.group(1) == "F" else "bottom",
+            "attributes": set(attributes.group(1).split())
+            if attributes else set(),
+        })
+
+    placements.sort(key=lambda placement:
+                    _natural_key(placement["reference"]))
+
+    return origin, placements
+
+
+def write_position_file(file_name, placements, side, origin=(0.0, 0.0),
+                        smd_only=False):
+    """
+    Write the placements of one side as CSV position file, like
+    `kicad-cli pcb export pos --format csv --units mm` does.
+
+    Positions are relative to the origin with the Y axis pointing up.
+    Footprints excluded from position files are left out.
+
+    Args:
+        file_name (str): Path to the CSV file.
+        placements (list): Placements as returned by read_placements.
+        side (str): "top" or "bottom".
+        origin (tuple): Origin of the positions in board coordinates, the
+            drill/place file origin for --use-drill-file-origin.
+        smd_only (bool): Only write footprints with the SMD attribute.
+
+    Returns:
+        int: Number of placements written.
+    """
+    lines = [POSITION_FILE_HEADER]
+
+    for placement in placements:
+        attributes = placement["attributes"]
+
+        if placement["side"] != side or \
+                "exclude_from_pos_files" in attributes or \
+                (smd_only and "smd" not in attributes):
+            continue
+
+        # adding 0.0 turns -0.0 into 0.0, KiCad computes in integers
+        x = round(placement["x"] - origin[0], 6) + 0.0
+        y = round(origin[1] - placement["y"], 6) + 0.0
+
+        lines.append(f'"{placement["reference"]}","{placement["value"]}",'
+                     f'"{placement["package"]}",'
+                     f'{x:f},{y:f},{placement["rotation"]:f},{side}\n')
+
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
+
+    return len(lines) - 1
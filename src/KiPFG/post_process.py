@@ -1,27 +1,260 @@
+import bz2
+import glob
 import os
 import shutil
+import sys
 import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import fnmatch
 
-def create_archive(output_filename, input_files, exclude_files=None):
+from tracing import annotate, traced
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request to clone a file's extents on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+ARCHIVE_COMPRESSION = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+}
+
+# Python versions whose zipfile internals _write_compressed_member is known to
+# work with. Other versions compress the members one after the other through
+# the public interface of zipfile.
+PARALLEL_COMPRESSION_VERSIONS = {(3, 13)}
+
+# Members with these extensions are compressed already and only stored.
+PRECOMPRESSED_EXTENSIONS = {
+    ".zip", ".pdf", ".xlsx", ".gz", ".bz2", ".xz", ".7z", ".png", ".jpg",
+    ".jpeg",
+}
+
+
+def _compress_member(file, compress_type, compresslevel):
+    zinfo = zipfile.ZipInfo.from_file(file, arcname=file.name)
+    data = file.read_bytes()
+
+    if file.suffix.lower() in PRECOMPRESSED_EXTENSIONS:
+        compress_type = zipfile.ZIP_STORED
+
+    # zlib and bz2 release the GIL, so members compress in parallel
+    if compress_type == zipfile.ZIP_DEFLATED:
+        level = -1 if compresslevel is None else compresslevel
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+    elif compress_type == zipfile.ZIP_BZIP2:
+        level = 9 if compresslevel is None else compresslevel
+        compressed = bz2.compress(data, level)
+    else:
+        compressed = data
+
+    if len(compressed) >= len(data):
+        compress_type = zipfile.ZIP_STORED
+        compressed = data
+
+    zinfo.compress_type = compress_type
+    zinfo.CRC = zlib.crc32(data)
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(compressed)
+
+    return zinfo, compressed
+
+
+def _write_compressed_member(archive, zinfo, data):
+    # zipfile can only write data it compresses itself, so the local header
+    # is written here and the member is registered for the central directory
+    # that ZipFile.close() writes. This relies on the internals of ZipFile,
+    # see PARALLEL_COMPRESSION_VERSIONS.
+    zip64 = (zinfo.file_size > zipfile.ZIP64_LIMIT or
+             zinfo.compress_size > zipfile.ZIP64_LIMIT)
+
+    zinfo.header_offset = archive.fp.tell()
+    archive.fp.write(zinfo.FileHeader(zip64))
+    archive.fp.write(data)
+    archive.filelist.append(zinfo)
+    archive.NameToInfo[zinfo.filename] = zinfo
+    archive.start_dir = archive.fp.tell()
+
+
+def _write_archive_parallel(output_filename, files, compress_type,
+                            compresslevel, max_workers):
+    with zipfile.ZipFile(output_filename, 'w') as archive, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # only a few members are held in memory at a time
+        pending = deque()
+
+        for file in files:
+            if len(pending) >= 2 * max_workers:
+                _write_compressed_member(archive, *pending.popleft().result())
+
+            pending.append(executor.submit(_compress_member, file,
+                                           compress_type, compresslevel))
+
+        while pending:
+            _write_compressed_member(archive, *pending.popleft().result())
+
+
+@traced("post_process")
+def create_archive(output_filename, input_files, exclude_files=None,
+                   compression="deflated", compresslevel=None,
+                   max_workers=None):
     """
     Create a zip archive from a list of input files.
 
+    Members are compressed in a thread pool and written in the order of the
+    input files. Members that are compressed already, like nested archives
+    and PDFs, or that don't get smaller are stored as they are. On Python
+    versions not in PARALLEL_COMPRESSION_VERSIONS the members are compressed
+    one after the other.
+
     Args:
         output_filename (str): Path to the output zip file.
         input_files (list): List of file paths or glob patterns to include in the archive.
         exclude_files (list): List of file names or patterns to exclude from the archive.
+        compression (str): Compression method, one of ARCHIVE_COMPRESSION.
+        compresslevel (int): Compression level, the codec's default if None.
+        max_workers (int): Number of members compressed in parallel, the
+            number of CPUs if None.
     """
     exclude_files = exclude_files or []
+    compress_type = ARCHIVE_COMPRESSION[compression]
+    max_workers = max_workers or os.cpu_count() or 1
+
+    files = [
+        file
+        for pattern in input_files
+        for file in map(Path, glob.glob(pattern))
+        if file.is_file() and not any(fnmatch.fnmatch(file.name, excl) for excl in exclude_files)
+    ]
 
-    with zipfile.ZipFile(output_filename, 'w') as archive:
-        for pattern in input_files:
-            for file in Path().glob(pattern):
-                if file.is_file() and not any(fnmatch.fnmatch(file.name, excl) for excl in exclude_files):
-                    archive.write(file, arcname=file.name)
+    if sys.version_info[:2] in PARALLEL_COMPRESSION_VERSIONS:
+        _write_archive_parallel(output_filename, files, compress_type,
+                                compresslevel, max_workers)
+    else:
+        with zipfile.ZipFile(output_filename, 'w') as archive:
+            for file in files:
+                if file.suffix.lower() in PRECOMPRESSED_EXTENSIONS:
+                    archive.write(file, file.name, zipfile.ZIP_STORED)
+                else:
+                    archive.write(file, file.name, compress_type,
+                                  compresslevel)
 
+    annotate(input_files=len(files),
+             output_bytes=os.path.getsize(output_filename))
+
+
+def is_file_up_to_date(source, destination):
+    """
+    Check whether a destination file already matches its source file, the
+    same file or one with the same size and modification time.
+
+    Args:
+        source (str): Path to the source file.
+        destination (str): Path to the destination file.
+
+    Returns:
+        bool: True if the destination doesn't need to be written again.
+    """
+    try:
+        source_stat = os.stat(source)
+        destination_stat = os.stat(destination)
+    except FileNotFoundError:
+        return False
+
+    if os.path.samestat(source_stat, destination_stat):
+        return True
+
+    return source_stat.st_size == destination_stat.st_size and \
+        source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform.")
+
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        os.unlink(destination)
+        raise
 
+    shutil.copystat(source, destination)
+
+
+def sync_file(source, destination, sync=False, link=None):
+    """
+    Place a copy of a file at the destination.
+
+    Args:
+        source (str): Path to the source file.
+        destination (str): Path to the destination file.
+        sync (bool): Skip the file if the destination is up to date, see
+            is_file_up_to_date.
+        link (str): 'reflink' to share the content copy-on-write or
+            'hardlink' to share the file itself. Both only work within one
+            file system, the file is copied if they fail.
+
+    Returns:
+        bool: True if the destination was written, False if it was skipped.
+    """
+    if sync and is_file_up_to_date(source, destination):
+        return False
+
+    # Never write through an existing file, it might be a hard link.
+    if os.path.lexists(destination):
+        os.unlink(destination)
+
+    try:
+        if link == "hardlink":
+            os.link(source, destination)
+            return True
+        if link == "reflink":
+            _reflink(source, destination)
+            return True
+    except OSError:
+        pass
+
+    shutil.copy2(source, destination)
+    return True
+
+
+@traced("post_process")
+def link_files(input_files, destination_dir, exclude_files=None):
+    """
+    Place files in a directory without copying their content where possible.
+
+    Files are hard linked into the destination directory. If that isn't
+    possible, e.g. because the destination is on another file system, they
+    are copied instead. Existing files in the destination are replaced.
+
+    Args:
+        input_files (list): List of file paths or glob patterns to link.
+        destination_dir (str): Path to the destination directory.
+        exclude_files (list): List of file names or patterns to leave out.
+    """
+    exclude_files = exclude_files or []
+
+    os.makedirs(destination_dir, exist_ok=True)
+
+    for pattern in input_files:
+        for file in map(Path, glob.glob(pattern)):
+            if not file.is_file() or any(fnmatch.fnmatch(file.name, excl) for excl in exclude_files):
+                continue
+
+            sync_file(file, Path(destination_dir) / file.name, sync=True,
+                      link="hardlink")
+
+
+@traced("post_process")
 def copy_files(source_dir, destination_dir):
     """
     Copy all files from the source directory to the destination directory.
@@ -47,6 +280,7 @@ def copy_files(source_dir, destination_dir):
             shutil.copytree(item, dest_path / item.name, dirs_exist_ok=True)
 
 
+@traced("post_process")
 def create_directory(directory_path):
     """
     Create a new directory if it doesn't exist.
@@ -58,6 +292,7 @@ def create_directory(directory_path):
     os.makedirs(directory_path, exist_ok=True)
 
 
+@traced("post_process")
 def delete_files_and_directories(targets, exclude_files=None):
     """
     Delete files and directories matching the provided patterns, excluding specified files or patterns.
@@ -79,7 +314,9 @@ def delete_files_and_directories(targets, exclude_files=None):
                 elif item.is_dir():
                     shutil.rmtree(item)  # Delete the directory
 
-def copy_files_and_directories(source_dir, destination_dir, inclusion_list=None, exclusion_list=None):
+@traced("post_process")
+def copy_files_and_directories(source_dir, destination_dir, inclusion_list=None, exclusion_list=None,
+                               sync=False, link=None, rename=None, prune_list=None):
     """
     Copies files from a source directory to a destination directory based on inclusion and exclusion lists.
 
@@ -87,12 +324,22 @@ def copy_files_and_directories(source_dir, destination_dir, inclusion_list=None,
     :param destination_dir: The destination directory path.
     :param inclusion_list: List of patterns for files to include. If provided, only these files are copied.
     :param exclusion_list: List of patterns for files to exclude. If provided, these files are not copied.
+    :param sync: Skip files that are up to date in the destination.
+    :param link: 'reflink' or 'hardlink' to avoid copying content, see sync_file.
+    :param rename: Function returning the destination file name for a source file name.
+    :param prune_list: List of patterns for directory names that are not descended into.
     """
     if not os.path.exists(destination_dir):
         os.makedirs(destination_dir)
 
     # Get list of all files in source directory
-    for root, _, files in os.walk(source_dir):
+    for root, dirs, files in os.walk(source_dir):
+        if prune_list:
+            dirs[:] = [
+                dir_name for dir_name in dirs
+                if not any(fnmatch.fnmatch(dir_name, pattern) for pattern in prune_list)
+            ]
+
         matching_files = []
         for file_name in files:
             # Check inclusion and exclusion lists
@@ -111,10 +358,41 @@ def copy_files_and_directories(source_dir, destination_dir, inclusion_list=None,
             # Copy only matching files
             for file_name in matching_files:
                 source_file_path = os.path.join(root, file_name)
-                destination_file_path = os.path.join(dest_subdir, file_name)
-                shutil.copy2(source_file_path, destination_file_path)
+                destination_name = rename(file_name) if rename else file_name
+                destination_file_path = os.path.join(dest_subdir, destination_name)
+                sync_file(source_file_path, destination_file_path, sync, link)
+
+
+@traced("post_process")
+def copy_file_list(file_list, source_dir, destination_dir, sync=False, link=None, rename=None):
+    """
+    Copies the given files keeping their path relative to the source directory.
+
+    Files outside of the source directory are copied to the top of the destination directory.
+
+    :param file_list: List of file paths to copy.
+    :param source_dir: The directory the file paths are relative to.
+    :param destination_dir: The destination directory path.
+    :param sync: Skip files that are up to date in the destination.
+    :param link: 'reflink' or 'hardlink' to avoid copying content, see sync_file.
+    :param rename: Function returning the destination file name for a source file name.
+    """
+    for source_file_path in file_list:
+        relative_path = os.path.relpath(source_file_path, source_dir)
+
+        if relative_path.startswith(os.pardir + os.sep):
+            relative_path = os.path.basename(relative_path)
+
+        relative_dir, file_name = os.path.split(relative_path)
+        dest_subdir = os.path.join(destination_dir, relative_dir)
+        os.makedirs(dest_subdir, exist_ok=True)
+
+        destination_name = rename(file_name) if rename else file_name
+        destination_file_path = os.path.join(dest_subdir, destination_name)
+        sync_file(source_file_path, destination_file_path, sync, link)
 
 
+@traced("post_process")
 def delete_directory(directory_path):
     """
     Deletes a directory and all its contents.
@@ -126,6 +404,7 @@ def delete_directory(directory_path):
     except Exception as e:
         print(f"Error: Unable to delete directory '{directory_path}'. {e}")
 
+@traced("post_process")
 def insert_string_before_extension(directory, insert_string):
     """
     Inserts a given string before the file extension for all files in the given directory.
@@ -0,0 +1,325 @@
+import asyncio
+import contextvars
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+
+# Lines of output longer than this are split.
+LINE_LIMIT = 1 << 20
+
+# Time by which the current job has to be finished, see timeLimit().
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class ProcessCancelledError(subprocess.SubprocessError):
+    """
+    Raised for a process that was cancelled by ProcessRunner.cancelAll().
+    """
+
+    def __init__(self, cmd):
+        super().__init__(f"Command '{cmd}' was cancelled.")
+        self.cmd = cmd
+
+
+class ProcessResult:
+    """
+    The outcome of a process run by the ProcessRunner.
+
+    Args:
+        returncode (int): Exit code, negative if the process was killed by a
+            signal.
+        stdout (bytes): The captured output, None if it wasn't captured.
+        usage (resource.struct_rusage): Resources used by the process.
+    """
+
+    def __init__(self, returncode, stdout, usage):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.usage = usage
+
+
+@contextmanager
+def timeLimit(seconds):
+    """
+    Limit the time the processes run inside the block may take together.
+
+    The limit applies to the current thread and to functions run with a
+    copy of its context, like contextvars.copy_context().run. A process
+    still running when the time is up is killed and raises
+    subprocess.TimeoutExpired. None or 0 doesn't limit the time.
+    """
+    if not seconds:
+        yield
+        return
+
+    token = _deadline.set(time.monotonic() + seconds)
+
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class ProcessRunner:
+    """
+    Runs processes on one asyncio event loop in a thread of its own.
+
+    The loop starts the processes, reads their output and waits for them to
+    exit, so any number of processes can run at the same time without a
+    thread waiting for each one. Exits are watched through a pidfd and the
+    process is reaped with wait4, which reports the CPU time and peak memory
+    of that process alone.
+
+    Jobs in other threads call run() and block until their process has
+    finished. cancelAll() kills every running process at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._tasks = set()
+        self._cancelled = False
+
+    def _getLoop(self):
+        with self._lock:
+            # a forked worker of a batch run needs a loop of its own
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._tasks = set()
+
+                threading.Thread(target=self._loop.run_forever,
+                                 name="process-runner", daemon=True).start()
+
+            return self._loop
+
+    @staticmethod
+    async def _waitForExit(process):
+        loop = asyncio.get_running_loop()
+
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            # without pidfd support a thread waits for the process
+            _, status, usage = await loop.run_in_executor(
+                None, os.wait4, process.pid, 0)
+        else:
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or
+                            exited.set_result(None))
+
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+
+            _, status, usage = os.wait4(process.pid, 0)
+
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        return usage
+
+    @staticmethod
+    async def _readLines(process, capture_output, on_line):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=LINE_LIMIT)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), process.stdout)
+        output = []
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    line = await reader.read(LINE_LIMIT)
+
+                if not line:
+                    break
+
+                if capture_output:
+                    output.append(line)
+
+                if on_line is not None:
+                    on_line(line.decode("utf-8", "replace").rstrip("\r\n"))
+        finally:
+            transport.close()
+
+        return b"".join(output) if capture_output else None
+
+    async def runAsync(self, args, capture_output=False, on_line=None,
+                       timeout=None):
+        """
+        Run a process on the loop of the runner.
+
+        Args:
+            args (list): The command line.
+            capture_output (bool): Return the output of the process.
+            on_line (callable): Called with every line of the output, without
+                the line break, as soon as it has been written.
+            timeout (float): Seconds after which the process is killed, None
+                to wait forever.
+
+        Returns:
+            ProcessResult: Exit code, output and resource usage.
+
+        Raises:
+            subprocess.TimeoutExpired: If the process didn't finish in time.
+        """
+        read_output = capture_output or on_line is not None
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if read_output else subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        try:
+            async with asyncio.timeout(timeout):
+                output = None
+
+                if read_output:
+                    output = await self._readLines(process, capture_output,
+                                                   on_line)
+
+                usage = await self._waitForExit(process)
+        except BaseException as e:
+            if process.returncode is None:
+                process.kill()
+                await asyncio.shield(self._waitForExit(process))
+
+            if isinstance(e, TimeoutError):
+                raise subprocess.TimeoutExpired(args, timeout) from None
+            raise
+
+        return ProcessResult(process.returncode, output, usage)
+
+    async def _runTracked(self, args, capture_output, on_line, timeout):
+        if self._cancelled:
+            raise ProcessCancelledError(args)
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+
+        try:
+            return await self.runAsync(args, capture_output, on_line,
+                                       timeout)
+        except asyncio.CancelledError:
+            raise ProcessCancelledError(args) from None
+        finally:
+            self._tasks.discard(task)
+
+    def run(self, args, capture_output=False, on_line=None, timeout=None):
+        """
+        Run a process and wait until it has finished.
+
+        The timeout is shortened to the time left of the job, see
+        timeLimit(). on_line is called from the thread of the runner.
+
+        Args:
+            args (list): The command line.
+            capture_output (bool): Return the output of the process.
+            on_line (callable): Called with every line of the output as soon
+                as it has been written.
+            timeout (float): Seconds after which the process is killed, None
+                to wait forever.
+
+        Returns:
+            ProcessResult: Exit code, output and resource usage.
+
+        Raises:
+            subprocess.TimeoutExpired: If the process didn't finish in time.
+            ProcessCancelledError: If the process was cancelled.
+        """
+        deadline = _deadline.get()
+
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(args, 0)
+
+            timeout = remaining if timeout is None else min(timeout,
+                                                            remaining)
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._runTracked(args, capture_output, on_line, timeout),
+            self._getLoop()
+        )
+
+        return future.result()
+
+    def _setCancelled(self, cancelled):
+        self._cancelled = cancelled
+
+        if cancelled:
+            for task in self._tasks:
+                task.cancel()
+
+    def cancelAll(self):
+        """
+        Kill every running process. Processes started afterwards are
+        cancelled right away, until reset() is called.
+        """
+        self._getLoop().call_soon_threadsafe(self._setCancelled, True)
+
+    def reset(self):
+        """
+        Allow processes to run again after cancelAll().
+        """
+        self._getLoop().call_soon_threadsafe(self._setCancelled, False)
+
+
+# Runner shared by all jobs of a generation.
+runner = ProcessRunner()
+
+
+def runProcess(args, capture_output=False, output_files=(), on_line=None,
+               timeout=None, check=False):
+    """
+    Run a process with the shared runner and record it as a span if tracing
+    is enabled.
+
+    The span holds the exit code, the CPU time and peak resident memory of
+    the process, and the number of bytes it wrote to stdout and to its
+    output files.
+
+    Args:
+        args (list): The command line.
+        capture_output (bool): Return stdout instead of discarding it.
+        output_files (list): Files written by the process.
+        on_line (callable): Called with every line of stdout as it streams.
+        timeout (float): Seconds after which the process is killed.
+        check (bool): Raise subprocess.CalledProcessError if the exit code
+            isn't 0.
+
+    Returns:
+        tuple: The exit code and the captured stdout as bytes, which is None
+        without capture_output.
+    """
+    name = " ".join(os.path.basename(arg) for arg in args[:3])
+
+    with tracing.span(name, "kicad-cli", command=args):
+        result = runner.run(args, capture_output, on_line, timeout)
+        usage = result.usage
+
+        if tracing.tracer is not None:
+            tracing.annotate(
+                exit_code=result.returncode,
+                cpu_ms=(usage.ru_utime + usage.ru_stime) * 1000,
+                max_rss_kib=usage.ru_maxrss,
+                output_bytes=len(result.stdout or b"") +
+                tracing.getFileSize(output_files),
+            )
+
+        if check and result.returncode:
+            raise subprocess.CalledProcessError(result.returncode, args,
+                                                result.stdout)
+
+    return result.returncode, result.stdout
@@ -4,14 +4,228 @@ import re
 import sys
 import sexpdata
 
+from sexp_scanner import iter_top_level_nodes, scan_top_level
+
 
 class ProjectInformationError(Exception):
     pass
 
 
+def createCliArgParser():
+    """
+    Create the parser for the command line arguments of KiPFG.
+    """
+    cli_arg_parser = argparse.ArgumentParser(
+        prog="KiPFG",
+        description="Generate production files for KiCad"
+    )
+
+    cli_arg_parser.add_argument(
+        '-p',
+        '--project-file',
+        help="KiCad project file",
+        type=str
+    )
+
+    cli_arg_parser.add_argument(
+        '-s',
+        '--drawing-sheet-file',
+        help="Drawing sheet file",
+        type=str
+    )
+
+    cli_arg_parser.add_argument(
+        '-e',
+        '--no-erc',
+        help="Disable ERC check",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '-d',
+        '--no-drc',
+        help="Diesable DRC check",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '--timeout',
+        help="Seconds the kicad-cli runs of every job may take, a hung kicad-cli is killed after it (default: 0, no limit)",
+        type=float,
+        default=0
+    )
+
+    cli_arg_parser.add_argument(
+        '--fail-fast',
+        help="Cancel all running and pending jobs as soon as one fails",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '--speculative',
+        help="Start generating while ERC and DRC are running, cancel and remove the outputs if a check fails",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '--kicad-cli',
+        help="kicad-cli executable, 'stub' runs the bundled emulator writing placeholder outputs (default: $KIPFG_KICAD_CLI or kicad-cli)",
+        type=str,
+        default=os.environ.get("KIPFG_KICAD_CLI", "kicad-cli")
+    )
+
+    cli_arg_parser.add_argument(
+        '--bom-engine',
+        help="How the bill of materials is built: natively from the schematic files or by kicad-cli (default: native)",
+        choices=["native", "kicad-cli"],
+        default="native"
+    )
+
+    cli_arg_parser.add_argument(
+        '--pos-engine',
+        help="How the pick and place files are written: natively from one read of the board or by kicad-cli (default: native)",
+        choices=["native", "kicad-cli"],
+        default="native"
+    )
+
+    cli_arg_parser.add_argument(
+        '--plot-backend',
+        help="How the pcb layers, gerbers and drill files are plotted: by kicad-cli, or in process by the pcbnew module of KiCad, which loads the board only once. Falls back to kicad-cli if pcbnew can't be imported (default: kicad-cli)",
+        choices=["kicad-cli", "pcbnew"],
+        default="kicad-cli"
+    )
+
+    cli_arg_parser.add_argument(
+        '--bom-outputs',
+        help="Outputs written from the bill of materials besides the CSV: order list, Mouser and Digi-Key upload files and JSON (default: xlsx)",
+        nargs="*",
+        choices=["xlsx", "mouser", "digikey", "json"],
+        default=["xlsx"]
+    )
+
+    cli_arg_parser.add_argument(
+        '--variants',
+        help="Assembly variants to generate a bill of materials, pick and place files and fab drawings for, selected by the fit_field of the symbols like +NAME, -NAME or DNF. Gerbers, drill files and the other pdf files are shared by all variants",
+        nargs="+",
+        metavar="NAME",
+        default=[]
+    )
+
+    cli_arg_parser.add_argument(
+        '-j',
+        '--jobs',
+        help="Number of exports running in parallel (default: number of CPUs)",
+        type=int,
+        default=os.cpu_count()
+    )
+
+    cli_arg_parser.add_argument(
+        '--plot-jobs',
+        help="Number of pcb pdf layers plotted in parallel, all kicad-cli runs together are still limited by --jobs (default: --jobs)",
+        type=int
+    )
+
+    cli_arg_parser.add_argument(
+        '--staging-dir',
+        help="Directory temporary files are created in (default: /dev/shm if it has enough free space, otherwise the temporary directory of the system)",
+        type=str
+    )
+
+    cli_arg_parser.add_argument(
+        '--cache-dir',
+        help="Restore unchanged outputs from a build cache in this directory",
+        type=str
+    )
+
+    cli_arg_parser.add_argument(
+        '--cache-size',
+        help="Maximum size of the build cache in MiB (default: 2048)",
+        type=int,
+        default=2048
+    )
+
+    cli_arg_parser.add_argument(
+        '--archive-compression',
+        help="Compression of the generated archives (default: deflated)",
+        choices=["stored", "deflated", "bzip2"],
+        default="deflated"
+    )
+
+    cli_arg_parser.add_argument(
+        '--archive-level',
+        help="Compression level of the generated archives",
+        type=int
+    )
+
+    cli_arg_parser.add_argument(
+        '--snapshot-from-sheets',
+        help="Build the PRJ snapshot from the sheets used by the schematic instead of scanning the project directory",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '-i',
+        '--incremental',
+        help="Only regenerate the schematic or pcb outputs if their sources changed",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '--trace',
+        help="Write the timing of every kicad-cli call, job and post processing step to this Chrome trace file",
+        type=str,
+        metavar="FILE"
+    )
+
+    cli_arg_parser.add_argument(
+        '-w',
+        '--watch',
+        help="Keep running and regenerate the affected outputs whenever a source file is saved",
+        action="store_true"
+    )
+
+    cli_arg_parser.add_argument(
+        '--watch-debounce',
+        help="Seconds to wait for further changes before regenerating in watch mode (default: 0.5)",
+        type=float,
+        default=0.5
+    )
+
+    cli_arg_parser.add_argument(
+        '--diff',
+        help="Instead of generating, compare the pcb pdf files of an earlier revision with the current one, or of two revisions, and write an overlay of the changes of every layer",
+        nargs="+",
+        metavar="REVISION"
+    )
+
+    cli_arg_parser.add_argument(
+        '--diff-dpi',
+        help="Resolution the layers are compared at in a diff (default: 300)",
+        type=int,
+        default=300
+    )
+
+    cli_arg_parser.add_argument(
+        '-b',
+        '--batch',
+        help="Generate several projects, given as directories, project files or glob patterns, sharing one pool of kicad-cli workers",
+        nargs="+",
+        metavar="PROJECT"
+    )
+
+    cli_arg_parser.add_argument(
+        '--batch-projects',
+        help="Number of projects generated at the same time in batch mode (default: number of CPUs)",
+        type=int,
+        default=os.cpu_count()
+    )
+
+    return cli_arg_parser
+
+
 class ProjectInformation:
 
-    def __init__(self) -> None:
+    def __init__(self, cli_args=None) -> None:
         self.current_working_dir = os.getcwd()
         self.project_file_name = None
         self.schematic_file_name = None
@@ -21,39 +235,13 @@ class ProjectInformation:
         self.pcb_revision = None
         self.revision = None
         self.drawing_sheet_file_name = None
+        self.schematic_sheet_file_names = None
+
+        self.cli_arg_parser = createCliArgParser()
+        self.cli_args = cli_args
 
-        self.cli_arg_parser = argparse.ArgumentParser(
-            prog="KiPFG",
-            description="Generate production files for KiCad"
-        )
-
-        self.cli_arg_parser.add_argument(
-            '-p',
-            '--project-file',
-            help="KiCad project file",
-            type=str
-        )
-
-        self.cli_arg_parser.add_argument(
-            '-s',
-            '--drawing-sheet-file',
-            help="Drawing sheet file",
-            type=str
-        )
-
-        self.cli_arg_parser.add_argument(
-            '-e',
-            '--no-erc',
-            help="Disable ERC check",
-            action="store_true"
-        )
-
-        self.cli_arg_parser.add_argument(
-            '-d',
-            '--no-drc',
-            help="Diesable DRC check",
-            action="store_true"
-        )
+        if self.cli_args is None:
+            self.cli_args = self.cli_arg_parser.parse_args()
 
         self.__findProjectFileName()
         self.__readProjectInformation()
@@ -62,13 +250,12 @@ class ProjectInformation:
     def __terminateWithError(self, e):
         print(f"Error: {e}")
         print("Terminating...")
-        sys.exit()
+        sys.exit(1)
 
-    def __parseSexpressionFromFile(self, file):
-        with open(file, 'r', encoding='utf-8') as f:
-            data = f.read()
-            parsed_data = sexpdata.loads(data)
-            return parsed_data
+    def __parseSexpressionFromFile(self, file, names):
+        # Only the requested top level nodes are parsed and reading stops once
+        # all of them were found, which keeps large boards cheap to open.
+        return scan_top_level(file, names)
 
     def __readProjectFileNameFromCli(self, cli_args):
 
@@ -152,7 +339,8 @@ class ProjectInformation:
         return layers
 
     def __readSchematicInformation(self):
-        schematic_sexp_data = self.__parseSexpressionFromFile(self.schematic_file_name)
+        schematic_sexp_data = self.__parseSexpressionFromFile(
+            self.schematic_file_name, ["title_block"])
         revision = self.__getRevisionFromSexp(schematic_sexp_data)
 
         if revision:
@@ -161,7 +349,8 @@ class ProjectInformation:
             raise ProjectInformationError("Revision information not found in schematic file.")
 
     def __readPcbInformation(self):
-        pcb_sexp_data = self.__parseSexpressionFromFile(self.pcb_file_name)
+        pcb_sexp_data = self.__parseSexpressionFromFile(
+            self.pcb_file_name, ["title_block", "layers"])
         revision = self.__getRevisionFromSexp(pcb_sexp_data)
         copper_layers = self.__getCopperLayerInformationFromSexp(pcb_sexp_data)
 
@@ -177,7 +366,7 @@ class ProjectInformation:
 
     def __findProjectFileName(self):
 
-        args = self.cli_arg_parser.parse_args()
+        args = self.cli_args
 
         try:
             if args.project_file:
@@ -191,7 +380,7 @@ class ProjectInformation:
             self.__terminateWithError(e)
 
     def __getDrawingSheetFileName(self):
-        args = self.cli_arg_parser.parse_args()
+        args = self.cli_args
 
         try:
             if args.drawing_sheet_file:
@@ -210,7 +399,7 @@ class ProjectInformation:
             self.__readSchematicInformation()
             self.__readPcbInformation()
 
-            if self.schematic_revision is self.pcb_revision:
+            if self.schematic_revision == self.pcb_revision:
                 self.revision = self.schematic_revision
             else:
                 raise ProjectInformationError(f"Revision of schematic '{self.schematic_revision}' and pcb '{self.pcb_revision}' don't match.")
@@ -220,6 +409,45 @@ class ProjectInformation:
         except ProjectInformationError as e:
             self.__terminateWithError(e)
 
+    def getSchematicSheetFileNames(self):
+        """
+        Return the top level schematic and every hierarchical sheet it uses.
+
+        Sheet file names are read from the 'Sheetfile' property of the sheet
+        symbols and are relative to the schematic that references them. The
+        list is only built once.
+        """
+        if self.schematic_sheet_file_names is not None:
+            return self.schematic_sheet_file_names
+
+        sheet_file_names = []
+        pending = [self.schematic_file_name]
+
+        while pending:
+            sheet_file_name = pending.pop(0)
+
+            if sheet_file_name in sheet_file_names:
+                continue
+            if not os.path.isfile(sheet_file_name):
+                continue
+
+            sheet_file_names.append(sheet_file_name)
+            sheet_dir = os.path.dirname(sheet_file_name)
+
+            for node in iter_top_level_nodes(sheet_file_name, ["sheet"]):
+                if not isinstance(node, list):
+                    continue
+
+                for element in node:
+                    if isinstance(element, list) and len(element) > 2:
+                        if str(element[0]) == "property":
+                            if element[1] in ("Sheetfile", "Sheet file"):
+                                pending.append(os.path.normpath(
+                                    os.path.join(sheet_dir, element[2])))
+
+        self.schematic_sheet_file_names = sheet_file_names
+        return sheet_file_names
+
     def printProjectInformation(self):
         print(r"""
 ======================= KiPFG ==============================
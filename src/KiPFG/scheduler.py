@@ -0,0 +1,258 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import tracing
+from process_runner import timeLimit
+
+
+class SchedulerError(Exception):
+    pass
+
+
+class Job:
+    """
+    A unit of work for the scheduler.
+
+    Args:
+        name (str): Unique name of the job, used in status and error messages.
+        function (callable): Function executed by the job.
+        args (tuple): Positional arguments passed to the function.
+        inputs (list): Artifacts the job needs before it can start. Inputs
+            that no job produces are treated as source files that already
+            exist.
+        outputs (list): Artifacts the job provides once it has finished.
+        cancel_on_failure (bool): Cancel all other jobs if this one fails.
+        background (bool): Run the job in the background lane, on its own
+            thread instead of a worker of the pool. No job may depend on it.
+        timeout (float): Seconds the processes of the job may run, the
+            timeout of the scheduler if None.
+    """
+
+    def __init__(self, name, function, args=(), inputs=None, outputs=None,
+                 cancel_on_failure=False, background=False, timeout=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+        self.cancel_on_failure = cancel_on_failure
+        self.background = background
+        self.timeout = timeout
+        self.state = "pending"
+        self.error = None
+
+    def __repr__(self):
+        return f"Job({self.name!r}, state={self.state!r})"
+
+
+class Scheduler:
+    """
+    Runs jobs on a bounded worker pool as soon as all of their inputs exist.
+
+    Jobs are started in the order they were added whenever more than one is
+    ready, so long running jobs should be added first. If a job fails, every
+    job that depends on its outputs is skipped while independent jobs keep
+    running. If a job that cancels on failure fails, every job that hasn't
+    started is cancelled instead, and on_cancel is called to stop the jobs
+    that are running.
+
+    Background jobs don't take a worker from the other jobs and run() doesn't
+    wait for them, so the rest of the work can be reported while they are
+    still running. waitForBackground() waits for them afterwards.
+
+    Args:
+        max_workers (int): Maximum number of jobs running at the same time.
+        on_cancel (callable): Called without arguments when the jobs are
+            cancelled.
+        timeout (float): Seconds the processes of every job may run, see
+            process_runner.timeLimit(). None or 0 doesn't limit the time.
+        fail_fast (bool): Every job cancels all others if it fails.
+    """
+
+    def __init__(self, max_workers=None, on_cancel=None, timeout=None,
+                 fail_fast=False):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.jobs = []
+        self.cancelled_by = None
+        self.on_cancel = on_cancel
+        self.timeout = timeout
+        self.fail_fast = fail_fast
+        self._producers = {}
+        self._background_executor = None
+        self._background_running = {}
+
+    def add(self, job):
+        """
+        Add a job to the scheduler.
+
+        Args:
+            job (Job): The job to add.
+
+        Returns:
+            Job: The added job.
+        """
+        if any(existing.name == job.name for existing in self.jobs):
+            raise SchedulerError(f"Job '{job.name}' was added twice.")
+
+        for output in job.outputs:
+            if output in self._producers:
+                raise SchedulerError(
+                    f"Artifact '{output}' is produced by both "
+                    f"'{self._producers[output].name}' and '{job.name}'."
+                )
+            self._producers[output] = job
+
+        self.jobs.append(job)
+        return job
+
+    def _dependencies(self, job):
+        return [
+            self._producers[artifact]
+            for artifact in job.inputs
+            if artifact in self._producers
+        ]
+
+    def _checkForCycles(self):
+        visiting = set()
+        done = set()
+
+        def visit(job, path):
+            if job.name in done:
+                return
+            if job.name in visiting:
+                cycle = " -> ".join(path + [job.name])
+                raise SchedulerError(f"Dependency cycle detected: {cycle}")
+
+            visiting.add(job.name)
+            for dependency in self._dependencies(job):
+                visit(dependency, path + [job.name])
+            visiting.discard(job.name)
+            done.add(job.name)
+
+        for job in self.jobs:
+            visit(job, [])
+
+    def _checkBackgroundJobs(self):
+        for job in self.jobs:
+            for dependency in self._dependencies(job):
+                if dependency.background:
+                    raise SchedulerError(
+                        f"Job '{job.name}' depends on the background job "
+                        f"'{dependency.name}'."
+                    )
+
+    def _skipDependents(self, failed_job):
+        for job in self.jobs:
+            if job.state != "pending":
+                continue
+            if failed_job in self._dependencies(job):
+                job.state = "skipped"
+                job.error = SchedulerError(
+                    f"Skipped because '{failed_job.name}' did not finish."
+                )
+                self._skipDependents(job)
+
+    def _cancel(self, failed_job):
+        self.cancelled_by = failed_job
+
+        for job in self.jobs:
+            if job.state == "pending":
+                job.state = "cancelled"
+                job.error = SchedulerError(
+                    f"Cancelled because '{failed_job.name}' failed."
+                )
+
+        if self.on_cancel is not None:
+            self.on_cancel()
+
+    def _runJob(self, job):
+        timeout = job.timeout if job.timeout is not None else self.timeout
+
+        with tracing.span(job.name, "job"), timeLimit(timeout):
+            job.function(*job.args)
+
+    def _finish(self, job, future):
+        error = future.exception()
+
+        if error is None:
+            job.state = "done"
+        else:
+            job.state = "failed"
+            job.error = error
+            self._skipDependents(job)
+
+            if (job.cancel_on_failure or self.fail_fast) and \
+                    self.cancelled_by is None:
+                self._cancel(job)
+
+    def run(self):
+        """
+        Run all jobs and wait until all but the background jobs have
+        finished.
+
+        Returns:
+            list: Jobs that failed, were skipped or cancelled, in the order
+            they were added. The list is empty if every job succeeded.
+            Background jobs are not included.
+        """
+        self._checkForCycles()
+        self._checkBackgroundJobs()
+
+        running = {}
+        self._background_executor = ThreadPoolExecutor(
+            max_workers=max(1, sum(job.background for job in self.jobs)),
+            thread_name_prefix="background"
+        )
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                for job in self.jobs:
+                    if job.state != "pending":
+                        continue
+                    if all(dependency.state == "done"
+                           for dependency in self._dependencies(job)):
+                        job.state = "running"
+                        lane = self._background_executor if job.background \
+                            else executor
+                        future = lane.submit(self._runJob, job)
+                        running[future] = job
+
+                if not any(not job.background for job in running.values()):
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    self._finish(running.pop(future), future)
+
+        self._background_running = running
+
+        return [job for job in self.jobs
+                if job.state != "done" and not job.background]
+
+    def backgroundJobs(self):
+        """
+        Return the background jobs that are still running.
+        """
+        return [job for job in self._background_running.values()
+                if job.state == "running"]
+
+    def waitForBackground(self):
+        """
+        Wait until the background jobs started by run() have finished.
+
+        Returns:
+            list: Background jobs that failed, were skipped or cancelled, in
+            the order they were added.
+        """
+        for future in wait(self._background_running).done:
+            self._finish(self._background_running[future], future)
+
+        self._background_running = {}
+
+        if self._background_executor is not None:
+            self._background_executor.shutdown()
+            self._background_executor = None
+
+        return [job for job in self.jobs
+                if job.state != "done" and job.background]
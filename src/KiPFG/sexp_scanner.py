@@ -0,0 +1,119 @@
+import re
+import sexpdata
+
+CHUNK_SIZE = 1 << 20
+
+# Only opening brackets (with the symbol that follows them), closing brackets
+# and strings are of interest. Everything else is skipped by the regex engine.
+# An unterminated string matches up to the end of the buffer, so a string
+# that is split between two chunks is detected and read again.
+_TOKEN = re.compile(r'\(\s*([^\s()"]*)|\)|"(?:[^"\\]|\\.?)*"?', re.S)
+
+
+def iter_top_level_nodes(file_name, names=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream an S-expression file and yield its top level nodes.
+
+    The file is read in chunks and only the nodes whose name is in names are
+    parsed, with the same types sexpdata.loads would produce. Every other
+    node is skipped without building any objects. The caller can stop the
+    iteration at any time, the rest of the file is not read then.
+
+    Args:
+        file_name (str): Path to the S-expression file.
+        names (set): Names of the top level nodes to yield. All top level
+            nodes are yielded if this is None.
+        chunk_size (int): Number of characters read at once.
+
+    Yields:
+        The symbol of the root node first, then each matching top level node
+        as a list.
+    """
+    names = set(names) if names is not None else None
+
+    depth = 0
+    buffer = ""
+    position = 0
+    node_start = None
+
+    with open(file_name, 'r', encoding='utf-8') as f:
+        eof = False
+
+        while not eof:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+            while True:
+                match = _TOKEN.search(buffer, position)
+
+                if match is None:
+                    position = len(buffer)
+                    break
+
+                # A token touching the end of the buffer might continue in
+                # the next chunk.
+                if match.end() == len(buffer) and not eof:
+                    position = match.start()
+                    break
+
+                position = match.end()
+                token = match.group(0)
+
+                if token[0] == '(':
+                    depth += 1
+
+                    if depth == 1:
+                        yield sexpdata.Symbol(match.group(1))
+                    elif depth == 2:
+                        if names is None or match.group(1) in names:
+                            node_start = match.start()
+
+                elif token == ')':
+                    if depth == 2 and node_start is not None:
+                        node = sexpdata.loads(buffer[node_start:position])
+                        node_start = None
+                        yield node
+
+                    depth -= 1
+
+                    if depth == 0:
+                        return
+
+            # Drop everything that has been processed and is not part of a
+            # node that is still being read.
+            keep = position if node_start is None else node_start
+            buffer = buffer[keep:]
+            position -= keep
+            if node_start is not None:
+                node_start = 0
+
+
+def scan_top_level(file_name, names):
+    """
+    Read the given top level nodes from an S-expression file.
+
+    Reading stops as soon as one node of each name has been found, so nodes
+    near the start of a file can be read without going through the rest.
+
+    Args:
+        file_name (str): Path to the S-expression file.
+        names (list): Names of the top level nodes to read.
+
+    Returns:
+        list: The root symbol followed by the nodes found, in file order. This
+        is the tree sexpdata.loads would return with all other nodes removed.
+    """
+    missing = set(names)
+    data = []
+
+    for node in iter_top_level_nodes(file_name, names):
+        data.append(node)
+
+        if isinstance(node, list):
+            missing.discard(str(node[0]))
+
+            if not missing:
+                break
+
+    return data
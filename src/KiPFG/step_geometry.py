@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+
+_STRING = r'"(?:[^"\\]|\\.)*"'
+_BRACKET = re.compile(r'[()]|' + _STRING)
+_FOOTPRINT = re.compile(r'\(footprint\s+(' + _STRING + ')')
+_LAYER = re.compile(r'\(layer\s+"?[FB]\.Cu"?\s*\)')
+_AT = re.compile(r'\(at\s[^()]*\)')
+_ATTR = re.compile(r'\(attr\s[^()]*\)')
+_EDGE_CUTS = re.compile(r'\(layer\s+"?Edge\.Cuts"?\s*\)')
+_HOLE_PAD = re.compile(r'\(pad\s+' + _STRING + r'\s+(?:np_)?thru_hole\s')
+_DRILL = re.compile(r'\(drill\s')
+_MODEL = re.compile(r'\(model\s+(' + _STRING + r'|[^\s()]+)')
+_VIA = re.compile(r'\(via\s')
+_THICKNESS = re.compile(r'\(general\s+\(thickness\s[^()]*\)')
+_STACKUP = re.compile(r'\(stackup\s')
+_ORIGIN = re.compile(r'\(aux_axis_origin\s[^()]*\)')
+# identifiers that change without changing the geometry
+_IDENTIFIERS = re.compile(r'\((?:uuid|tstamp)\s[^()]*\)')
+
+# 3D model files kicad-cli can use for a model, --subst-models replaces VRML
+# models by STEP models of the same name.
+MODEL_EXTENSIONS = [".step", ".stp", ".STEP", ".STP", ".wrl", ".WRL"]
+
+
+def _node(content, start):
+    """
+    Return the node starting at an opening bracket.
+    """
+    depth = 0
+
+    for match in _BRACKET.finditer(content, start):
+        token = match.group(0)
+
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+
+            if depth == 0:
+                return content[start:match.end()]
+
+    return content[start:]
+
+
+def _edge_cuts(content, start, end, prefix):
+    """
+    Return the graphics on the Edge.Cuts layer between start and end.
+    """
+    nodes = []
+
+    for match in _EDGE_CUTS.finditer(content, start, end):
+        node_start = content.rfind(prefix, start, match.start())
+
+        if node_start >= 0:
+            nodes.append(_IDENTIFIERS.sub("", _node(content, node_start)))
+
+    return nodes
+
+
+def _holes(content, start, end, pattern):
+    """
+    Return the position and drill of the pads with holes or the vias between
+    start and end.
+    """
+    holes = []
+
+    for match in pattern.finditer(content, start, end):
+        node = _node(content, match.start())
+        at = _AT.search(node)
+        drill = _DRILL.search(node)
+
+        holes.append((at.group(0) if at else "") +
+                     (_node(node, drill.start()) if drill else ""))
+
+    return holes
+
+
+def _model_files(model, board_dir):
+    """
+    Return the existing files a 3D model path of a footprint can refer to.
+    """
+    path = model.strip('"').replace("${KIPRJMOD}", board_dir)
+    path = os.path.expandvars(path)
+
+    if not os.path.isabs(path):
+        path = os.path.join(board_dir, path)
+
+    base = os.path.splitext(path)[0]
+    candidates = [path] + [base + extension for extension in MODEL_EXTENSIONS]
+
+    return [candidate for candidate in dict.fromkeys(candidates)
+            if os.path.isfile(candidate)]
+
+
+def read_step_geometry(pcb_file_name):
+    """
+    Read everything of a board that its STEP export depends on.
+
+    These are the board thickness and stackup, the drill/place file origin,
+    the outline, the holes of pads and vias and the footprints with their
+    position, side, attributes and 3D models. Texts, silkscreen, tracks,
+    zones, nets and all fields are left out, so changing them does not change
+    the digest.
+
+    Model paths are resolved with the environment and relative to the
+    board. Models that cannot be found are only part of the digest with their
+    path.
+
+    Args:
+        pcb_file_name (str): Path to the .kicad_pcb file.
+
+    Returns:
+        tuple: A hex digest of the geometry and the list of 3D model files
+        the footprints use.
+    """
+    with open(pcb_file_name, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    board_dir = os.path.dirname(os.path.abspath(pcb_file_name))
+    starts = [match.start() for match in _FOOTPRINT.finditer(content)]
+
+    # Footprints are written one after the other, so each one ends where the
+    # next one starts. Only the end of the last one has to be searched.
+    spans = list(zip(starts, starts[1:]))
+
+    if starts:
+        spans.append((starts[-1],
+                      starts[-1] + len(_node(content, starts[-1]))))
+
+    board_start = starts[0] if starts else len(content)
+    board_end = spans[-1][1] if spans else len(content)
+
+    footprints = []
+    model_files = set()
+
+    for start, end in spans:
+        head = content[start:end]
+        name = _FOOTPRINT.match(head).group(1)
+        layer = _LAYER.search(head)
+        at = _AT.search(head)
+        attr = _ATTR.search(head)
+        models = []
+
+        for match in _MODEL.finditer(head):
+            models.append(_node(head, match.start()))
+            model_files.update(_model_files(match.group(1), board_dir))
+
+        footprints.append("\n".join(
+            [name,
+             layer.group(0) if layer else "",
+             at.group(0) if at else "",
+             attr.group(0) if attr else ""]
+            + _edge_cuts(head, 0, len(head), "(fp_")
+            + _holes(head, 0, len(head), _HOLE_PAD)
+            + models
+        ))
+
+    board = []
+
+    for part_start, part_end in ((0, board_start), (board_end, len(content))):
+        board += _edge_cuts(content, part_start, part_end, "(gr_")
+        board += _holes(content, part_start, part_end, _VIA)
+
+    for pattern in (_THICKNESS, _ORIGIN):
+        match = pattern.search(content, 0, board_start)
+        board.append(match.group(0) if match else "")
+
+    stackup = _STACKUP.search(content, 0, board_start)
+    board.append(_node(content, stackup.start()) if stackup else "")
+
+    digest = hashlib.sha256()
+
+    # sorted, so renumbering the footprints doesn't change the digest
+    for part in board + sorted(footprints):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest(), sorted(model_files)
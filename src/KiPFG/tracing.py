@@ -0,0 +1,175 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# The tracer of the running generation, None while tracing is disabled.
+tracer = None
+
+_spans = threading.local()
+
+
+class Tracer:
+    """
+    Collects timed spans and writes them as Chrome trace events.
+
+    Every span becomes a complete event on the thread it ran on, which can be
+    loaded into chrome://tracing or Perfetto. The arguments of an event hold
+    everything recorded for the span, like the CPU time, the exit code and
+    the peak memory of a child process or the number of bytes written.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._start = time.perf_counter_ns()
+
+    def _timestamp(self, counter_ns):
+        return (counter_ns - self._start) / 1000
+
+    def add(self, name, category, start_ns, end_ns, args):
+        """
+        Add a complete event.
+
+        Args:
+            name (str): Name of the event.
+            category (str): Category of the event, like "kicad-cli".
+            start_ns (int): time.perf_counter_ns() when the span started.
+            end_ns (int): time.perf_counter_ns() when the span ended.
+            args (dict): Values shown with the event.
+        """
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._timestamp(start_ns),
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.native_id,
+            "args": args,
+        }
+
+        with self._lock:
+            self.events.append(event)
+            self._threads[thread.native_id] = thread.name
+
+    def save(self, file_name):
+        """
+        Write all events recorded so far to a trace file.
+        """
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self._threads.items()
+        ]
+
+        with self._lock:
+            events = metadata + list(self.events)
+
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def start():
+    """
+    Start recording spans.
+    """
+    global tracer
+    tracer = Tracer()
+
+
+def stop(file_name):
+    """
+    Stop recording spans and write them to a trace file.
+    """
+    global tracer
+
+    if tracer is not None:
+        tracer.save(file_name)
+        tracer = None
+
+
+@contextmanager
+def span(name, category, **args):
+    """
+    Record the block as one span with its wall and CPU time.
+
+    Values can be added to the span from inside the block with annotate().
+    The thread CPU time is recorded, so time spent in child processes or
+    other threads isn't included.
+    """
+    if tracer is None:
+        yield
+        return
+
+    args = dict(args)
+    parent = getattr(_spans, "current", None)
+    _spans.current = args
+
+    start_cpu = time.thread_time()
+    start_ns = time.perf_counter_ns()
+
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = str(e)
+        raise
+    finally:
+        end_ns = time.perf_counter_ns()
+        args.setdefault("cpu_ms", (time.thread_time() - start_cpu) * 1000)
+        _spans.current = parent
+
+        if tracer is not None:
+            tracer.add(name, category, start_ns, end_ns, args)
+
+
+def annotate(**args):
+    """
+    Add values to the innermost span of the current thread.
+    """
+    current = getattr(_spans, "current", None)
+
+    if current is not None:
+        current.update(args)
+
+
+def traced(category):
+    """
+    Decorator recording every call of a function as a span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return function(*args, **kwargs)
+
+            with span(function.__name__, category):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def getFileSize(file_names):
+    """
+    Return the total size of the given files that exist.
+    """
+    size = 0
+
+    for file_name in file_names:
+        try:
+            size += os.path.getsize(file_name)
+        except OSError:
+            pass
+
+    return size
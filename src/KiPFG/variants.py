@@ -0,0 +1,129 @@
+import re
+
+# Field of a symbol that says in which assembly variants it is fitted.
+FIT_FIELD = "fit_field"
+
+# Values of the fit field that leave a part out of every variant.
+NOT_FITTED = {"dnf", "dnp", "nf", "no fit", "nofit", "not fitted",
+              "do not fit", "do not place", "no stuff"}
+
+_STRING = r'"((?:[^"\\]|\\.)*)"'
+_FOOTPRINT = re.compile(r'\(footprint\s+' + _STRING)
+_LAYER = re.compile(r'\(layer\s+"?[FB]\.Cu"?\s*\)')
+_REFERENCE = re.compile(
+    r'\((?:property\s+"Reference"|fp_text\s+reference)\s+' + _STRING)
+_ATTR = re.compile(r'\(attr((?:\s+\w+)*)\s*\)')
+_ESCAPE = re.compile(r'\\(.)')
+
+
+def is_fitted(fit_field, variant):
+    """
+    Check whether a part is fitted in an assembly variant.
+
+    The fit field holds comma separated entries. "+NAME" fits the part only
+    in the named variants, "-NAME" leaves it out of the named variant and
+    values like "DNF" or "DNP" leave it out of every variant. Parts with an
+    empty fit field are fitted in all variants. Variant names are compared
+    without case.
+
+    Args:
+        fit_field (str): Value of the fit field of the part.
+        variant (str): Name of the variant.
+
+    Returns:
+        bool: True if the part is fitted in the variant.
+    """
+    variant = variant.lower()
+    entries = [entry.strip().lower() for entry in (fit_field or "").split(",")]
+    fitted_in = [entry[1:].strip() for entry in entries
+                 if entry.startswith("+")]
+
+    for entry in entries:
+        if entry in NOT_FITTED:
+            return False
+
+        if entry.startswith("-") and entry[1:].strip() == variant:
+            return False
+
+    return not fitted_in or variant in fitted_in
+
+
+def fitted_symbols(symbols, variant):
+    """
+    Return the parts of a bill of materials fitted in a variant.
+
+    Args:
+        symbols (list): Parts as returned by bom.read_bom_symbols.
+        variant (str): Name of the variant.
+    """
+    return [symbol for symbol in symbols
+            if is_fitted(symbol.get(FIT_FIELD, ""), variant)]
+
+
+def unfitted_references(symbols, variant):
+    """
+    Return the references of the parts that are not fitted in a variant.
+
+    Args:
+        symbols (list): Parts as returned by bom.read_bom_symbols.
+        variant (str): Name of the variant.
+    """
+    return {symbol["Reference"] for symbol in symbols
+            if not is_fitted(symbol.get(FIT_FIELD, ""), variant)}
+
+
+def write_variant_board(pcb_file_name, output_file_name, unfitted):
+    """
+    Write a copy of a board with the footprints of unfitted parts marked as
+    "do not populate", so KiCad can cross them out on the fabrication
+    layers.
+
+    Args:
+        pcb_file_name (str): Path to the .kicad_pcb file.
+        output_file_name (str): Path to the copy.
+        unfitted (set): References of the footprints to mark.
+
+    Returns:
+        int: Number of footprints marked.
+    """
+    with open(pcb_file_name, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    starts = [match.start() for match in _FOOTPRINT.finditer(content)]
+    parts = []
+    position = 0
+    marked = 0
+
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(content)
+        reference = _REFERENCE.search(content, start, end)
+
+        if reference is None or \
+                _ESCAPE.sub(r'\1', reference.group(1)) not in unfitted:
+            continue
+
+        attr = _ATTR.search(content, start, end)
+
+        if attr is not None:
+            if "dnp" in attr.group(1).split():
+                continue
+
+            insert_at, text = attr.end(1), " dnp"
+        else:
+            layer = _LAYER.search(content, start, end)
+
+            if layer is None:
+                continue
+
+            insert_at, text = layer.end(), " (attr dnp)"
+
+        parts += [content[position:insert_at], text]
+        position = insert_at
+        marked += 1
+
+    parts.append(content[position:])
+
+    with open(output_file_name, 'w', encoding='utf-8') as f:
+        f.write("".join(parts))
+
+    return marked
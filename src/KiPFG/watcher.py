@@ -0,0 +1,170 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+# inotify event masks, see inotify(7). KiCad writes a file in place or
+# replaces it by renaming a temporary file, so both are watched.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _loadInotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+class FileWatcher:
+    """
+    Wait for files to be saved.
+
+    The directories of the files are watched through inotify, so files that
+    are replaced instead of overwritten are noticed as well. Where inotify
+    is not available, the files are polled instead.
+
+    Args:
+        file_names (list): Files to watch.
+        debounce (float): Seconds without further changes before a change
+            is reported, so saving several files at once is reported once.
+        poll_interval (float): Seconds between two checks when polling.
+    """
+
+    def __init__(self, file_names, debounce=0.5, poll_interval=0.5):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.file_names = set()
+
+        self._directories = {}
+        self._signatures = {}
+        self._libc = _loadInotify()
+        self._fd = None
+
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(os.O_CLOEXEC)
+
+            if fd >= 0:
+                self._fd = fd
+
+        self.setFiles(file_names)
+
+    @property
+    def usesInotify(self):
+        return self._fd is not None
+
+    def setFiles(self, file_names):
+        """
+        Replace the set of watched files, e.g. after sheets were added to
+        the schematic.
+        """
+        self.file_names = {os.path.abspath(name) for name in file_names}
+
+        if self._fd is not None:
+            for directory in {os.path.dirname(name) for name in self.file_names}:
+                if directory in self._directories.values():
+                    continue
+
+                wd = self._libc.inotify_add_watch(
+                    self._fd, os.fsencode(directory),
+                    IN_CLOSE_WRITE | IN_MOVED_TO
+                )
+
+                if wd >= 0:
+                    self._directories[wd] = directory
+
+        self._signatures = self._snapshot()
+
+    def _snapshot(self):
+        signatures = {}
+
+        for file_name in self.file_names:
+            try:
+                stat = os.stat(file_name)
+                signatures[file_name] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                signatures[file_name] = None
+
+        return signatures
+
+    def _readEvents(self, timeout):
+        changed = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+
+        if not ready:
+            return None
+
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+
+        while offset < len(data):
+            wd, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if wd in self._directories and name:
+                file_name = os.path.join(self._directories[wd],
+                                         os.fsdecode(name))
+
+                if file_name in self.file_names:
+                    changed.add(file_name)
+
+        return changed
+
+    def _pollChanges(self):
+        signatures = self._snapshot()
+        changed = {
+            file_name
+            for file_name, signature in signatures.items()
+            if self._signatures.get(file_name) != signature
+        }
+        self._signatures = signatures
+
+        return changed
+
+    def wait(self):
+        """
+        Block until at least one watched file changed and no further change
+        happened for the debounce time.
+
+        Returns:
+            set: Absolute paths of the files that changed.
+        """
+        changed = set()
+
+        if self._fd is not None:
+            while not changed:
+                changed = self._readEvents(None) or set()
+
+            while (events := self._readEvents(self.debounce)) is not None:
+                changed |= events
+        else:
+            while not changed:
+                time.sleep(self.poll_interval)
+                changed = self._pollChanges()
+
+            quiet_since = time.monotonic()
+
+            while time.monotonic() - quiet_since < self.debounce:
+                time.sleep(min(self.poll_interval, self.debounce))
+
+                if events := self._pollChanges():
+                    changed |= events
+                    quiet_since = time.monotonic()
+
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,60 @@
+from bom import QUANTITY_FIELD, build_bom, group_bom
+
+FIELDS = [QUANTITY_FIELD, "Reference", "Value", "Footprint"]
+GROUP_BY = ["Value", "Footprint"]
+
+
+def part(reference, value, footprint="R_0603", **fields):
+    return dict(Reference=reference, Value=value, Footprint=footprint,
+                **fields)
+
+
+def test_equal_parts_share_a_row():
+    symbols = [
+        part("R2", "10k"),
+        part("C1", "100n", "C_0402"),
+        part("R10", "10k"),
+        part("R1", "10k"),
+        part("R3", "10k", "R_0805"),
+    ]
+
+    assert group_bom(symbols, FIELDS, GROUP_BY) == [
+        ["1", "C1", "100n", "C_0402"],
+        ["3", "R1,R2,R10", "10k", "R_0603"],
+        ["1", "R3", "10k", "R_0805"],
+    ]
+
+
+def test_rows_are_sorted_naturally_by_first_reference():
+    symbols = [part("R" + str(number), str(number))
+               for number in (100, 9, 20, 1)]
+
+    rows = group_bom(symbols, ["Reference"], GROUP_BY)
+
+    assert rows == [["R1"], ["R9"], ["R20"], ["R100"]]
+
+
+def test_missing_fields_are_empty_and_group_together():
+    symbols = [
+        part("U1", "MCU", Manufacturer="ST"),
+        part("U2", "MCU"),
+        part("U3", "MCU"),
+    ]
+
+    rows = group_bom(symbols, FIELDS + ["Manufacturer"],
+                     GROUP_BY + ["Manufacturer"])
+
+    assert rows == [
+        ["1", "U1", "MCU", "R_0603", "ST"],
+        ["2", "U2,U3", "MCU", "R_0603", ""],
+    ]
+
+
+def test_build_bom_labels_the_rows():
+    bom = build_bom([part("R1", "10k"), part("R2", "10k")], FIELDS,
+                    ["Quantity", "Reference", "Value", "Footprint"],
+                    GROUP_BY, "DEMO", "2", "A")
+
+    assert bom.rows == [{"Quantity": "2", "Reference": "R1,R2",
+                         "Value": "10k", "Footprint": "R_0603"}]
+    assert (bom.project_name, bom.revision, bom.variant) == ("DEMO", "2", "A")
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from build_cache import BuildCache, hash_file
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """
+    A project directory with a board, used as working directory.
+    """
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "demo.kicad_pcb").write_text("(kicad_pcb (version 1))")
+    monkeypatch.chdir(project_dir)
+    return project_dir
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BuildCache(str(tmp_path / "cache"), 1 << 20)
+
+
+def export_args(project_dir, output):
+    return ["kicad-cli", "pcb", "export", "step", "--output", output,
+            str(project_dir / "demo.kicad_pcb")]
+
+
+def test_hash_file(tmp_path):
+    file_name = tmp_path / "file"
+    file_name.write_bytes(b"abc")
+
+    assert hash_file(file_name) == \
+        "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+def test_key_depends_on_input_content(project, cache):
+    output = str(project / "3D" / "demo.step")
+    args = export_args(project, output)
+    key = cache.key(args, ["demo.kicad_pcb"], output_files=[output])
+
+    assert cache.key(args, ["demo.kicad_pcb"], output_files=[output]) == key
+
+    (project / "demo.kicad_pcb").write_text("(kicad_pcb (version 2))")
+
+    assert cache.key(args, ["demo.kicad_pcb"], output_files=[output]) != key
+
+
+def test_key_depends_on_args_and_extra(project, cache):
+    output = str(project / "demo.step")
+    args = export_args(project, output)
+    key = cache.key(args, ["demo.kicad_pcb"], ["8.0.0"], [output])
+
+    assert cache.key(args + ["--no-dnp"], ["demo.kicad_pcb"], ["8.0.0"],
+                     [output]) != key
+    assert cache.key(args, ["demo.kicad_pcb"], ["8.0.1"], [output]) != key
+
+
+def test_key_ignores_output_directory_and_checkout_location(tmp_path,
+                                                            monkeypatch):
+    cache = BuildCache(str(tmp_path / "cache"), 1 << 20)
+    keys = []
+
+    for checkout in ("a", "b"):
+        project_dir = tmp_path / checkout
+        project_dir.mkdir()
+        (project_dir / "demo.kicad_pcb").write_text("(kicad_pcb)")
+        monkeypatch.chdir(project_dir)
+
+        output = str(tmp_path / ("staging_" + checkout) / "demo.step")
+        keys.append(cache.key(export_args(project_dir, output),
+                              ["demo.kicad_pcb"], output_files=[output]))
+
+    assert keys[0] == keys[1]
+
+
+def test_store_and_restore(project, cache):
+    output = project / "3D" / "demo.step"
+    output.parent.mkdir()
+    output.write_text("ISO-10303-21;")
+    key = cache.key(export_args(project, str(output)), ["demo.kicad_pcb"],
+                    output_files=[str(output)])
+
+    assert not cache.restore(key, [str(output)])
+
+    cache.store(key, [str(output), str(project / "missing.step")])
+    restored = project / "restored" / "demo.step"
+
+    assert cache.restore(key, [str(restored)])
+    assert restored.read_text() == "ISO-10303-21;"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def store_entry(cache, project, name, size, mtime):
+    output = project / name
+    output.write_bytes(b"x" * size)
+    cache.store(name, [str(output)])
+    os.utime(cache._entryPath(name), (mtime, mtime))
+
+
+def test_evict_removes_least_recently_used_entries(project, tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), 2500)
+
+    store_entry(cache, project, "aa-old", 1000, 100)
+    store_entry(cache, project, "bb-used", 1000, 300)
+    store_entry(cache, project, "cc-new", 1000, 200)
+
+    # a restore counts as use
+    assert cache.restore("aa-old", [str(project / "aa-old")])
+
+    cache.evict()
+
+    assert os.path.isdir(cache._entryPath("aa-old"))
+    assert os.path.isdir(cache._entryPath("bb-used"))
+    assert not os.path.isdir(cache._entryPath("cc-new"))
+
+
+def test_store_does_not_evict(project, tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), 0)
+
+    store_entry(cache, project, "aa", 1000, 100)
+    store_entry(cache, project, "bb", 1000, 200)
+
+    assert os.path.isdir(cache._entryPath("aa"))
+
+    cache.evict()
+
+    assert not os.path.isdir(cache._entryPath("aa"))
+    assert not os.path.isdir(cache._entryPath("bb"))
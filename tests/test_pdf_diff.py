@@ -0,0 +1,82 @@
+import fitz
+import pytest
+
+from pdf_diff import diff_pdfs, match_layer_pages
+
+LAYERS = ["F.Cu", "B.Cu", "F.Fab"]
+
+
+def write_pcb_pdf(file_name, shift=0, bookmarks=True):
+    """
+    Write a pcb pdf file with one page per layer, the last layer drawn
+    shifted by the given number of points.
+    """
+    document = fitz.open()
+
+    for index, layer in enumerate(LAYERS):
+        page = document.new_page(width=400, height=300)
+        offset = shift if index == len(LAYERS) - 1 else 0
+        page.draw_rect(fitz.Rect(50 + offset, 50, 250 + offset, 200),
+                       width=4)
+
+    if bookmarks:
+        document.set_toc([[1, layer, page + 1]
+                          for page, layer in enumerate(LAYERS)])
+
+    document.save(file_name)
+    document.close()
+
+    return str(file_name)
+
+
+@pytest.mark.parametrize("old_bookmarks, new_bookmarks",
+                         [(True, True), (True, False), (False, True),
+                          (False, False)])
+def test_identical_content_scores_zero(tmp_path, old_bookmarks,
+                                       new_bookmarks):
+    old_file = write_pcb_pdf(tmp_path / "old.pdf", bookmarks=old_bookmarks)
+    new_file = write_pcb_pdf(tmp_path / "new.pdf", bookmarks=new_bookmarks)
+
+    results = diff_pdfs(old_file, new_file, str(tmp_path / "diff.pdf"),
+                        dpi=72, max_workers=1)
+
+    assert len(results) == len(LAYERS)
+    assert all(result["score"] == 0 for result in results)
+    assert all(result["changed_pixels"] == 0 for result in results)
+
+
+def test_changed_layer_is_scored(tmp_path):
+    old_file = write_pcb_pdf(tmp_path / "old.pdf")
+    new_file = write_pcb_pdf(tmp_path / "new.pdf", shift=20)
+
+    results = diff_pdfs(old_file, new_file, str(tmp_path / "diff.pdf"),
+                        dpi=72, max_workers=1)
+    scores = {result["layer"]: result["score"] for result in results}
+
+    assert scores["F.Cu"] == 0
+    assert scores["B.Cu"] == 0
+    assert 0 < scores["F.Fab"] <= 1
+
+    with fitz.open(str(tmp_path / "diff.pdf")) as overlay:
+        assert [title for _, title, _ in overlay.get_toc()] == LAYERS
+
+
+def test_pages_without_bookmarks_are_matched_by_position(tmp_path):
+    old_file = write_pcb_pdf(tmp_path / "old.pdf", bookmarks=False)
+    new_file = write_pcb_pdf(tmp_path / "new.pdf")
+
+    assert match_layer_pages(old_file, new_file) == [
+        ("F.Cu", 0, 0), ("B.Cu", 1, 1), ("F.Fab", 2, 2)]
+
+
+def test_layers_missing_in_one_revision(tmp_path):
+    old_file = write_pcb_pdf(tmp_path / "old.pdf")
+    new_file = tmp_path / "new.pdf"
+
+    with fitz.open(old_file) as document:
+        document.delete_page(1)
+        document.set_toc([[1, "F.Cu", 1], [1, "F.Fab", 2]])
+        document.save(str(new_file))
+
+    assert match_layer_pages(old_file, str(new_file)) == [
+        ("F.Cu", 0, 0), ("F.Fab", 2, 1), ("B.Cu", 1, None)]
@@ -0,0 +1,99 @@
+import pytest
+
+from position_file import (POSITION_FILE_HEADER, read_placements,
+                           write_position_file)
+
+BOARD = r'''(kicad_pcb (version 20240108) (generator "pcbnew")
+  (setup
+    (aux_axis_origin 100 150)
+  )
+  (footprint "Resistor_SMD:R_0603" (layer "F.Cu")
+    (at 110.5 140.25 90)
+    (property "Reference" "R2" (at 0 -1.5 90) (layer "F.SilkS"))
+    (property "Value" "10k" (at 0 1.5 90) (layer "F.Fab"))
+    (attr smd)
+    (pad "1" smd rect (at -0.8 0 90) (size 0.8 0.9) (layers "F.Cu"))
+  )
+  (footprint "Capacitor_SMD:C_0402" (layer "B.Cu")
+    (at 120 160 270)
+    (property "Reference" "C1" (at 0 -1 270) (layer "B.SilkS"))
+    (property "Value" "100n" (at 0 1 270) (layer "B.Fab"))
+    (attr smd)
+  )
+  (footprint "Connector:Pin_Header" (layer "B.Cu")
+    (at 95 150 -180)
+    (property "Reference" "J1" (at 0 0 0) (layer "B.SilkS"))
+    (property "Value" "Conn \"A\"" (at 0 0 0) (layer "B.Fab"))
+    (attr through_hole)
+  )
+  (footprint "Fiducial:Fiducial" (layer "B.Cu")
+    (at 130 170)
+    (property "Reference" "FID1" (at 0 0 0) (layer "B.SilkS"))
+    (property "Value" "Fiducial" (at 0 0 0) (layer "B.Fab"))
+    (attr smd exclude_from_pos_files)
+  )
+)
+'''
+
+
+@pytest.fixture
+def placements(tmp_path):
+    board = tmp_path / "demo.kicad_pcb"
+    board.write_text(BOARD, encoding="utf-8")
+    return read_placements(str(board))
+
+
+def read_lines(file_name):
+    with open(file_name, encoding="utf-8") as f:
+        return f.readlines()
+
+
+def test_read_placements(placements):
+    origin, footprints = placements
+
+    assert origin == (100.0, 150.0)
+    assert [footprint["reference"] for footprint in footprints] == \
+        ["C1", "FID1", "J1", "R2"]
+
+    c1, _, j1, r2 = footprints
+
+    assert (c1["side"], c1["x"], c1["y"], c1["rotation"]) == \
+        ("bottom", 120.0, 160.0, -90.0)
+    assert (j1["value"], j1["package"], j1["rotation"]) == \
+        ('Conn "A"', "Pin_Header", 180.0)
+    assert (r2["side"], r2["attributes"]) == ("top", {"smd"})
+
+
+def test_top_side(tmp_path, placements):
+    origin, footprints = placements
+    output = tmp_path / "top-pos.csv"
+
+    assert write_position_file(str(output), footprints, "top", origin) == 1
+    assert read_lines(output) == [
+        POSITION_FILE_HEADER,
+        '"R2","10k","R_0603",10.500000,9.750000,90.000000,top\n',
+    ]
+
+
+def test_bottom_side_y_points_up_and_rotation_is_kept(tmp_path, placements):
+    origin, footprints = placements
+    output = tmp_path / "bottom-pos.csv"
+
+    # X isn't mirrored, Y is measured upwards from the origin like on top
+    assert write_position_file(str(output), footprints, "bottom",
+                               origin) == 2
+    assert read_lines(output) == [
+        POSITION_FILE_HEADER,
+        '"C1","100n","C_0402",20.000000,-10.000000,-90.000000,bottom\n',
+        '"J1","Conn "A"","Pin_Header",-5.000000,0.000000,180.000000,'
+        'bottom\n',
+    ]
+
+
+def test_bottom_side_smd_only(tmp_path, placements):
+    origin, footprints = placements
+    output = tmp_path / "bottom-pos.csv"
+
+    assert write_position_file(str(output), footprints, "bottom", origin,
+                               smd_only=True) == 1
+    assert read_lines(output)[1].startswith('"C1",')
@@ -0,0 +1,120 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+import post_process
+from post_process import create_archive
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    """
+    Write a few members of different kinds: repetitive text, incompressible
+    data and an already compressed pdf.
+    """
+    source = tmp_path / "source"
+    source.mkdir()
+    contents = {
+        "board-F_Cu.gbr": b"G01X100Y200D01*\n" * 5000,
+        "random.bin": os.urandom(64 * 1024),
+        "board.pdf": b"%PDF-1.7\n" + os.urandom(1024),
+        "empty.txt": b"",
+    }
+
+    for name, data in contents.items():
+        (source / name).write_bytes(data)
+
+    return source, contents
+
+
+def check_archive(archive_name, contents):
+    with zipfile.ZipFile(archive_name) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == sorted(contents)
+
+        for name, data in contents.items():
+            assert archive.read(name) == data
+
+        return {info.filename: info.compress_type
+                for info in archive.infolist()}
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+@pytest.mark.parametrize("compression", ["stored", "deflated", "bzip2"])
+def test_archive_round_trip(tmp_path, monkeypatch, input_files, parallel,
+                            compression):
+    source, contents = input_files
+
+    if not parallel:
+        monkeypatch.setattr(post_process, "PARALLEL_COMPRESSION_VERSIONS",
+                            set())
+
+    archive_name = str(tmp_path / "out.zip")
+    create_archive(archive_name, [str(source / "*")],
+                   compression=compression, max_workers=2)
+    compress_types = check_archive(archive_name, contents)
+
+    assert compress_types["board.pdf"] == zipfile.ZIP_STORED
+
+    if compression != "stored":
+        assert compress_types["board-F_Cu.gbr"] == \
+            post_process.ARCHIVE_COMPRESSION[compression]
+
+
+def test_archive_excludes_files(tmp_path, input_files):
+    source, contents = input_files
+    archive_name = str(tmp_path / "out.zip")
+
+    create_archive(archive_name, [str(source / "*")], ["*.bin", "*.txt"])
+
+    check_archive(archive_name, {name: data for name, data in contents.items()
+                                 if name.endswith((".gbr", ".pdf"))})
+
+
+def test_archive_uses_max_workers(tmp_path, monkeypatch, input_files):
+    source, _ = input_files
+    monkeypatch.setattr(post_process, "PARALLEL_COMPRESSION_VERSIONS",
+                        {sys.version_info[:2]})
+    pool_sizes = []
+    executor = post_process.ThreadPoolExecutor
+
+    def record_pool_size(max_workers):
+        pool_sizes.append(max_workers)
+        return executor(max_workers=max_workers)
+
+    monkeypatch.setattr(post_process, "ThreadPoolExecutor", record_pool_size)
+
+    create_archive(str(tmp_path / "out.zip"), [str(source / "*")],
+                   max_workers=3)
+
+    assert pool_sizes == [3]
+
+
+def test_sync_file_skips_up_to_date_files(tmp_path):
+    source = tmp_path / "board.kicad_pcb"
+    destination = tmp_path / "board_R1.kicad_pcb"
+    source.write_text("(kicad_pcb)")
+
+    assert post_process.sync_file(source, destination, sync=True)
+    assert not post_process.sync_file(source, destination, sync=True)
+
+    source.write_text("(kicad_pcb (version 2))")
+
+    assert post_process.sync_file(source, destination, sync=True)
+    assert destination.read_text() == "(kicad_pcb (version 2))"
+
+
+def test_sync_file_never_writes_through_hard_links(tmp_path):
+    source = tmp_path / "new.gbr"
+    destination = tmp_path / "out.gbr"
+    linked = tmp_path / "linked.gbr"
+    source.write_text("new")
+    linked.write_text("old")
+    os.link(linked, destination)
+
+    post_process.sync_file(source, destination)
+
+    assert destination.read_text() == "new"
+    assert linked.read_text() == "old"
@@ -0,0 +1,77 @@
+import pytest
+import sexpdata
+
+from sexp_scanner import iter_top_level_nodes, scan_top_level
+
+SCHEMATIC = r'''(kicad_sch
+  (version 20231120)
+  (generator "eeschema")
+  (uuid "0b6e2a7c-6f4d-4b55-a0a1-9d3c2f1e4b7a")
+  (paper "A4")
+  (title_block
+    (title "Demo (rev \"B\")")
+    (rev "2")
+    (comment 1 "ends with a backslash \\")
+  )
+  (lib_symbols
+    (symbol "Device:R" (pin_names (offset 0)) (property "Value" "R"))
+  )
+  (symbol (lib_id "Device:R") (at 10.16 20.32 90)
+    (property "Reference" "R1")
+    (property "Value" "10k (0.1%)")
+  )
+  (sheet_instances (path "/" (page "1")))
+)
+'''
+
+
+@pytest.fixture
+def schematic(tmp_path):
+    file_name = tmp_path / "demo.kicad_sch"
+    file_name.write_text(SCHEMATIC, encoding="utf-8")
+    return str(file_name)
+
+
+def expected_nodes(names=None):
+    tree = sexpdata.loads(SCHEMATIC)
+    return [tree[0]] + [node for node in tree[1:]
+                        if names is None or str(node[0]) in names]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 20])
+def test_all_nodes_match_sexpdata(schematic, chunk_size):
+    nodes = list(iter_top_level_nodes(schematic, chunk_size=chunk_size))
+
+    assert nodes == expected_nodes()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_only_named_nodes_are_parsed(schematic, chunk_size):
+    names = {"title_block", "symbol"}
+    nodes = list(iter_top_level_nodes(schematic, names, chunk_size))
+
+    assert nodes == expected_nodes(names)
+    assert nodes[1][1] == [sexpdata.Symbol("title"), 'Demo (rev "B")']
+
+
+def test_scan_stops_after_the_last_name(schematic, monkeypatch):
+    yielded = []
+    original = iter_top_level_nodes
+
+    def recording(*args, **kwargs):
+        for node in original(*args, **kwargs):
+            yielded.append(node)
+            yield node
+
+    monkeypatch.setattr("sexp_scanner.iter_top_level_nodes", recording)
+
+    data = scan_top_level(schematic, ["version", "paper"])
+
+    assert data == expected_nodes({"version", "paper"})
+    # nothing after the paper node is parsed
+    assert yielded[-1] == [sexpdata.Symbol("paper"), "A4"]
+
+
+def test_missing_names_read_the_whole_file(schematic):
+    assert scan_top_level(schematic, ["paper", "bus_alias"]) == \
+        expected_nodes({"paper"})
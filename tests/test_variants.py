@@ -0,0 +1,67 @@
+import pytest
+
+from variants import (fitted_symbols, is_fitted, unfitted_references,
+                      write_variant_board)
+
+
+@pytest.mark.parametrize("fit_field, variant, fitted", [
+    ("", "A", True),
+    (None, "A", True),
+    ("+A", "A", True),
+    ("+A", "B", False),
+    ("+A, +B", "B", True),
+    ("-A", "A", False),
+    ("-A", "B", True),
+    ("+a", "A", True),
+    ("DNF", "A", False),
+    ("dnp", "B", False),
+    ("Do not place", "A", False),
+    ("+A, DNF", "A", False),
+    ("-B, +A", "A", True),
+])
+def test_is_fitted(fit_field, variant, fitted):
+    assert is_fitted(fit_field, variant) == fitted
+
+
+SYMBOLS = [
+    {"Reference": "R1", "fit_field": ""},
+    {"Reference": "R2", "fit_field": "+A"},
+    {"Reference": "R3", "fit_field": "-A"},
+    {"Reference": "R4"},
+]
+
+
+def test_fitted_and_unfitted_parts():
+    assert [symbol["Reference"] for symbol in fitted_symbols(SYMBOLS, "A")] \
+        == ["R1", "R2", "R4"]
+    assert unfitted_references(SYMBOLS, "B") == {"R2"}
+
+
+def test_write_variant_board_marks_unfitted_footprints(tmp_path):
+    board = tmp_path / "demo.kicad_pcb"
+    board.write_text('''(kicad_pcb
+  (footprint "R_0603" (layer "F.Cu") (at 1 2)
+    (property "Reference" "R1")
+    (attr smd)
+  )
+  (footprint "R_0603" (layer "F.Cu") (at 3 4)
+    (property "Reference" "R2")
+  )
+  (footprint "R_0603" (layer "F.Cu") (at 5 6)
+    (property "Reference" "R3")
+    (attr smd dnp)
+  )
+)
+''', encoding="utf-8")
+    output = tmp_path / "variant.kicad_pcb"
+
+    assert write_variant_board(str(board), str(output),
+                               {"R1", "R2", "R3"}) == 2
+
+    content = output.read_text(encoding="utf-8")
+
+    # an existing attr node gets the flag, otherwise one is added
+    assert '(at 1 2)\n    (property "Reference" "R1")\n    (attr smd dnp)' \
+        in content
+    assert '(layer "F.Cu") (attr dnp) (at 3 4)' in content
+    assert content.count("dnp") == 3